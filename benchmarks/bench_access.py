@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures reads and writes of document fields through attribute access, for a
+scalar field, an object field (through its proxy) and a member of an object
+field. Run from the repository root::
+
+    python benchmarks/bench_access.py
+"""
+
+# Python
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# JSON Schema Toolkit
+from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
+    JSONStringField, JSONObjectField
+
+
+class Profile(JSONDocument):
+
+    name = JSONStringField(title = u'name')
+    age = JSONIntegerField(title = u'age')
+    address = JSONObjectField(title = u'address', content = {
+        'city' : JSONStringField(title = u'city'),
+        'street' : JSONStringField(title = u'street'),
+    })
+
+    class Meta(object):
+        title = u'profile'
+        description = u'a profile'
+
+
+def main(number = 100000):
+    document = Profile({ 'name' : u'Alexis', 'age' : 42,
+        'address' : { 'city' : u'London', 'street' : u'Baker Street' } })
+    cases = [
+        ('read scalar field', lambda: document.name),
+        ('write scalar field', lambda: setattr(document, 'age', 43)),
+        ('read object field', lambda: document.address),
+        ('read object member', lambda: document.address.city),
+        ('read revision', lambda: document.revision),
+    ]
+    for label, case in cases:
+        best = min(timeit.repeat(case, number = number, repeat = 3))
+        print('%-20s %8.3f us' % (label, best / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the memory held by field definitions and by the schemas generated for
+many JSONDocument classes with nested content, and the size of the generated
+schemas compared with the same schemas carrying every key with its default
+value and a reference to the field. Run from the repository root::
+
+    python benchmarks/bench_memory.py
+"""
+
+# Python
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# JSON Schema Toolkit
+from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
+    JSONStringField, JSONObjectField, JSONListField, JSONDateTimeField
+
+
+def make_fields():
+    return {
+        'name' : JSONStringField(title = u'name', max_length = 64),
+        'age' : JSONIntegerField(title = u'age', min_value = 0),
+        'created' : JSONDateTimeField(title = u'created', optional = True),
+        'address' : JSONObjectField(title = u'address', content = {
+            'city' : JSONStringField(title = u'city'),
+            'street' : JSONStringField(title = u'street'),
+            'geo' : JSONObjectField(title = u'geo', content = {
+                'lat' : JSONIntegerField(title = u'lat'),
+                'lon' : JSONIntegerField(title = u'lon'),
+            }),
+        }),
+        'tags' : JSONListField(title = u'tags', content = [
+            JSONStringField(title = u'tag'),
+            JSONStringField(title = u'tag'),
+        ]),
+    }
+
+
+def measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+    held = build(count)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return size
+
+
+def build_fields(count):
+    return [ make_fields() for index in range(count) ]
+
+
+def build_classes(count):
+    return [ type('Document%d' % index, (JSONDocument, ), make_fields())
+        for index in range(count) ]
+
+
+_VERBOSE = {
+    'title' : None,
+    'description' : None,
+    'default' : None,
+    'optional' : False,
+    'null' : False,
+    'pattern' : None,
+    'properties' : {},
+    '__field' : None,
+}
+
+
+def verbose(schema):
+    """ Returns the schema with every key present, as schemas were generated
+    before default-valued keys were left out.
+    """
+    if isinstance(schema, dict):
+        result = dict((key, verbose(value)) for key, value in schema.items())
+        if '__fragment_cls' in result:
+            for key, value in _VERBOSE.items():
+                result.setdefault(key, dict(value) if isinstance(value, dict)
+                    else value)
+        return result
+    if isinstance(schema, list):
+        return [ verbose(value) for value in schema ]
+    return schema
+
+
+def main(count = 1000):
+    classes = build_classes(1)
+    print('%-28s %10.0f bytes' % ('fields per class',
+        measure(build_fields, count) / float(count)))
+    print('%-28s %10.0f bytes' % ('class with schema',
+        measure(build_classes, count) / float(count)))
+    schema = classes[0].document_schema
+    print('%-28s %10.0f bytes' % ('schema',
+        measure(lambda count: [ _copy(schema) for index in range(count) ],
+            count) / float(count)))
+    print('%-28s %10.0f bytes' % ('schema with defaults',
+        measure(lambda count: [ verbose(schema) for index in range(count) ],
+            count) / float(count)))
+
+
+def _copy(schema):
+    if isinstance(schema, dict):
+        return dict((key, _copy(value)) for key, value in schema.items())
+    if isinstance(schema, list):
+        return [ _copy(value) for value in schema ]
+    return schema
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the generic json_schema_validator Validator with the CompiledValidator
+on a nested document. Run from the repository root::
+
+    python benchmarks/bench_validator.py
+"""
+
+# Python
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# JSON Schema Validator
+from json_schema_validator.schema import Schema
+from json_schema_validator.validator import Validator
+
+# JSON Schema Toolkit
+from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
+    JSONStringField, JSONListField, JSONObjectField, JSONDateTimeField
+from json_schema_toolkit.validator import CompiledValidator
+
+
+class EventLog(JSONDocument):
+
+    source = JSONStringField(title = u'source', min_length = 1,
+        max_length = 64)
+    events = JSONListField(title = u'events', content = [
+        JSONObjectField(title = u'event', content = {
+            'title' : JSONStringField(title = u'event title', max_length = 80),
+            'importance' : JSONIntegerField(title = u'event importance',
+                min_value = 0, max_value = 100),
+            'when' : JSONDateTimeField(title = u'event time'),
+            'tags' : JSONListField(title = u'tags', content = [
+                JSONStringField(title = u'tag', enum = [u'a', u'b', u'c']),
+            ]),
+        }) for _ in range(10)
+    ])
+
+    class Meta(object):
+        title = u'event log'
+        description = u'a log of events'
+
+
+VALUE = {
+    'source' : u'benchmark',
+    'events' : [{
+        'title' : u'event %d' % index,
+        'importance' : index,
+        'when' : u'2013-06-16T12:00:00Z',
+        'tags' : [u'a', u'b'],
+    } for index in range(10)],
+}
+
+
+def main(number = 2000):
+    schema = Schema(EventLog.document_schema)
+    compiled = CompiledValidator.for_document(EventLog)
+    generic = min(timeit.repeat(lambda: Validator.validate(schema, VALUE),
+        number = number, repeat = 3))
+    specialized = min(timeit.repeat(lambda: compiled.validate(schema, VALUE),
+        number = number, repeat = 3))
+    print('generic validator:  %8.2f us per document' % (
+        generic / number * 1e6))
+    print('compiled validator: %8.2f us per document' % (
+        specialized / number * 1e6))
+    print('speedup:            %8.1fx' % (generic / specialized))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,636 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the document, field and validation hot paths, with timing
+and memory measurements written to a JSON results file, and a comparison mode
+flagging regressions between two results files. Run from the repository root::
+
+    python benchmarks/suite.py run --output results.json
+    python benchmarks/suite.py run --filter validate --output results.json
+    python benchmarks/suite.py compare before.json after.json
+
+Each case is timed over several repeats, each repeat running the operation as
+many times as needed to take at least --min-time seconds (once, for the slowest
+cases), and the best time per operation is reported along with the median. The
+peak memory allocated by one operation is measured with tracemalloc where
+available. The comparison exits with status 1 when any case is slower (or, for
+memory, larger) than in the first file by more than --threshold.
+"""
+
+# Python
+import argparse
+import copy
+import datetime
+import gc
+import json
+import os
+import platform
+import re
+import sys
+import time
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# JSON Schema Validator
+from json_schema_validator.extensions import datetime_extension, \
+    timedelta_extension
+from json_schema_validator.schema import Schema
+from json_schema_validator.validator import Validator
+
+# JSON Schema Toolkit
+import json_schema_toolkit
+from json_schema_toolkit import codec
+from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
+    JSONStringField, JSONListField, JSONObjectField, JSONDateTimeField, \
+    JSONTimeDeltaField, JSONDecimalField, JSONBooleanField, parse_datetime, \
+    parse_timedelta
+from json_schema_toolkit.validator import CompiledValidator
+
+
+CASES = []
+
+
+def case(name, number = None):
+    """ Registers a benchmark case. The decorated function prepares the data
+    of the case and returns the operation to measure; it is called again
+    before every repeat, so operations may consume what it prepared. Cases
+    with a fixed number run the operation that many times per repeat.
+    """
+    def register(function):
+        CASES.append((name, function, number))
+        return function
+    return register
+
+
+# Documents
+
+class FlatDocument(JSONDocument):
+
+    name = JSONStringField(title = u'name', max_length = 64)
+    email = JSONStringField(title = u'email')
+    age = JSONIntegerField(title = u'age', min_value = 0, max_value = 150)
+    height = JSONDecimalField(title = u'height')
+    active = JSONBooleanField(title = u'active')
+    created = JSONDateTimeField(title = u'created')
+    session = JSONTimeDeltaField(title = u'session', optional = True)
+    city = JSONStringField(title = u'city', optional = True)
+    country = JSONStringField(title = u'country', optional = True)
+    score = JSONIntegerField(title = u'score', optional = True)
+
+
+FLAT_VALUE = {
+    'name' : u'Alexis',
+    'email' : u'alexis@example.org',
+    'age' : 42,
+    'height' : 1.8,
+    'active' : True,
+    'created' : u'2013-06-16T12:00:00Z',
+    'city' : u'London',
+    'country' : u'United Kingdom',
+    'score' : 7,
+}
+
+
+def _nested_field(depth):
+    content = {
+        'label' : JSONStringField(title = u'label'),
+        'weight' : JSONIntegerField(title = u'weight'),
+    }
+    if depth:
+        content['child'] = _nested_field(depth - 1)
+    return JSONObjectField(title = u'level', content = content)
+
+
+def _nested_value(depth):
+    value = { 'label' : u'level %d' % depth, 'weight' : depth, }
+    if depth:
+        value['child'] = _nested_value(depth - 1)
+    return value
+
+
+NESTED_DEPTH = 8
+
+
+class NestedDocument(JSONDocument):
+
+    name = JSONStringField(title = u'name')
+    root = _nested_field(NESTED_DEPTH)
+
+
+NESTED_VALUE = { 'name' : u'nested', 'root' : _nested_value(NESTED_DEPTH), }
+
+
+class ContainerDocument(JSONDocument):
+
+    items = JSONListField(title = u'items', content = [])
+    members = JSONObjectField(title = u'members')
+
+
+class TimeDocument(JSONDocument):
+
+    when = JSONDateTimeField(title = u'when')
+    duration = JSONTimeDeltaField(title = u'duration')
+
+
+def _sized_document(size):
+    """ Returns a document class and a value whose JSON encoding is about the
+    given size, made of events with a body of up to 10 KB; every event has its
+    own schema, so the whole value is validated.
+    """
+    body = 10000 if size >= 100000 else size // 2
+    count = max(1, size // (body + 100))
+    event = JSONObjectField(title = u'event', content = {
+        'title' : JSONStringField(title = u'title', max_length = 80),
+        'importance' : JSONIntegerField(title = u'importance',
+            min_value = 0, max_value = 100),
+        'when' : JSONDateTimeField(title = u'when'),
+        'body' : JSONStringField(title = u'body', pattern = r'^[a-z ]*$'),
+    })
+    document_cls = type('SizedDocument%d' % size, (JSONDocument, ), {
+        'source' : JSONStringField(title = u'source'),
+        'events' : JSONListField(title = u'events', content = [ event ] *
+            count),
+    })
+    value = {
+        'source' : u'benchmark',
+        'events' : [ {
+            'title' : u'event %d' % index,
+            'importance' : index % 100,
+            'when' : u'2013-06-16T12:00:00Z',
+            'body' : (u'lorem ipsum ' * (body // 12 + 1))[:body],
+        } for index in range(count) ],
+    }
+    return document_cls, value
+
+
+# Construction
+
+@case('construct flat')
+def construct_flat():
+    return lambda: FlatDocument(FLAT_VALUE)
+
+
+@case('construct nested')
+def construct_nested():
+    return lambda: NestedDocument(NESTED_VALUE)
+
+
+@case('construct class')
+def construct_class():
+    fields = dict((name, field) for name, field in
+        FlatDocument._fields.items())
+    return lambda: type('Document', (JSONDocument, ), dict(fields))
+
+
+def _address_field():
+    return JSONObjectField(title = u'address', content = {
+        'street' : JSONStringField(title = u'street', max_length = 80),
+        'city' : JSONStringField(title = u'city'),
+        'zip' : JSONStringField(title = u'zip', pattern = r'^[0-9]{5}$'),
+    })
+
+
+@case('compile catalog', number = 1)
+def compile_catalog():
+    """ Creates and compiles the validators of 100 classes declaring the same
+    fields, as in a catalog of document classes.
+    """
+    def compile():
+        for index in range(100):
+            CompiledValidator.for_document(type('Catalog%d' % index,
+                (JSONDocument, ), {
+                    'name' : JSONStringField(title = u'name'),
+                    'home' : _address_field(),
+                    'work' : _address_field(),
+                    'created' : JSONDateTimeField(title = u'created'),
+                    'history' : JSONListField(title = u'history',
+                        content = [ _address_field() ] * 10),
+                }))
+    return compile
+
+
+# Attribute access
+
+@case('read scalar')
+def read_scalar():
+    document = FlatDocument(FLAT_VALUE)
+    return lambda: document.name
+
+
+@case('write scalar')
+def write_scalar():
+    document = FlatDocument(FLAT_VALUE)
+    values = [ 41, 42, ]
+    def write():
+        document.age = values[document.revision % 2]
+    return write
+
+
+@case('read nested member')
+def read_nested_member():
+    document = NestedDocument(NESTED_VALUE)
+    return lambda: document.root.child.child.child.label
+
+
+@case('write nested member')
+def write_nested_member():
+    document = NestedDocument(NESTED_VALUE)
+    def write():
+        document.root.child.child.child.weight = document.revision
+    return write
+
+
+# Deletion
+
+LARGE = 100000
+
+
+@case('delete from large list', number = 10000)
+def delete_from_large_list():
+    document = ContainerDocument({ 'items' : list(range(LARGE)),
+        'members' : {}, })
+    def delete():
+        del document.items[0]
+    return delete
+
+
+@case('delete from large object', number = 10000)
+def delete_from_large_object():
+    keys = [ 'key%d' % index for index in range(LARGE) ]
+    document = ContainerDocument({ 'items' : [],
+        'members' : dict((key, index) for index, key in enumerate(keys)), })
+    keys = iter(keys)
+    def delete():
+        del document.members[next(keys)]
+    return delete
+
+
+# Coercion
+
+@case('set datetime')
+def set_datetime():
+    document = TimeDocument({ 'when' : u'2013-06-16T12:00:00Z',
+        'duration' : u'0d 0s 0us', })
+    values = [ datetime.datetime(2013, 6, 16, 12, 0, 0),
+        datetime.datetime(2013, 6, 17, 12, 0, 0), ]
+    def write():
+        document.when = values[document.revision % 2]
+    return write
+
+
+@case('set timedelta')
+def set_timedelta():
+    document = TimeDocument({ 'when' : u'2013-06-16T12:00:00Z',
+        'duration' : u'0d 0s 0us', })
+    values = [ datetime.timedelta(seconds = 1),
+        datetime.timedelta(seconds = 2), ]
+    def write():
+        document.duration = values[document.revision % 2]
+    return write
+
+
+# Typed reads
+
+@case('read datetime native')
+def read_datetime_native():
+    document = TimeDocument({ 'when' : u'2013-06-16T12:00:00Z',
+        'duration' : u'0d 0s 0us', })
+    return lambda: document['when'].native
+
+
+@case('read datetime from_json')
+def read_datetime_from_json():
+    document = TimeDocument({ 'when' : u'2013-06-16T12:00:00Z',
+        'duration' : u'0d 0s 0us', })
+    return lambda: datetime_extension.from_json(document.when)
+
+
+@case('parse datetime')
+def parse_datetime_case():
+    return lambda: parse_datetime(u'2013-06-16T12:00:00Z')
+
+
+@case('read timedelta native')
+def read_timedelta_native():
+    document = TimeDocument({ 'when' : u'2013-06-16T12:00:00Z',
+        'duration' : u'1d 2s 3us', })
+    return lambda: document['duration'].native
+
+
+@case('read timedelta from_json')
+def read_timedelta_from_json():
+    document = TimeDocument({ 'when' : u'2013-06-16T12:00:00Z',
+        'duration' : u'1d 2s 3us', })
+    return lambda: timedelta_extension.from_json(document.duration)
+
+
+@case('parse timedelta')
+def parse_timedelta_case():
+    return lambda: parse_timedelta(u'1d 2s 3us')
+
+
+# Validation
+
+def _validation_cases():
+    for label, size in [ ('1KB', 1000), ('100KB', 100000),
+        ('10MB', 10000000), ]:
+        def prepare(size = size):
+            if size not in _SIZED:
+                _SIZED[size] = _sized_document(size)
+            return _SIZED[size]
+        def generic(prepare = prepare):
+            document_cls, value = prepare()
+            schema = Schema(document_cls.document_schema)
+            return lambda: Validator.validate(schema, value)
+        def compiled(prepare = prepare):
+            document_cls, value = prepare()
+            validator = CompiledValidator.for_document(document_cls)
+            return lambda: validator(value)
+        case('validate %s generic' % label)(generic)
+        case('validate %s compiled' % label)(compiled)
+
+
+_SIZED = {}
+_validation_cases()
+
+
+# Encoding
+
+def _sized_value(size):
+    if size not in _SIZED:
+        _SIZED[size] = _sized_document(size)
+    return _SIZED[size][1]
+
+
+def _codec_cases():
+    shapes = [
+        ('flat', lambda: FLAT_VALUE),
+        ('nested', lambda: NESTED_VALUE),
+        ('100KB', lambda: _sized_value(100000)),
+    ]
+    for name in codec.codecs():
+        for label, value in shapes:
+            def encode(name = name, value = value):
+                json_codec = codec.get_codec(name)
+                value = value()
+                return lambda: json_codec.encode(value)
+            def decode(name = name, value = value):
+                json_codec = codec.get_codec(name)
+                encoded = json_codec.encode_bytes(value())
+                return lambda: json_codec.decode(encoded)
+            case('encode %s %s' % (label, name))(encode)
+            case('decode %s %s' % (label, name))(decode)
+
+
+_codec_cases()
+
+
+# Compact lists
+
+class SeriesDocument(JSONDocument):
+
+    readings = JSONListField(title = u'readings', compact = True, content = [
+        JSONIntegerField(title = u'reading', min_value = 0,
+            max_value = 1000000), ])
+
+
+SERIES = 100000
+
+
+def _series_value():
+    return { 'readings' : [ index * 7 % 1000000 for index in
+        range(SERIES) ], }
+
+
+@case('validate series list')
+def validate_series_list():
+    validator = CompiledValidator.for_document(SeriesDocument)
+    value = _series_value()
+    return lambda: validator(value)
+
+
+@case('validate series compact')
+def validate_series_compact():
+    validator = CompiledValidator.for_document(SeriesDocument)
+    value = SeriesDocument(_series_value(), validator = validator)._value
+    return lambda: validator(value)
+
+
+@case('construct series compact', number = 10)
+def construct_series_compact():
+    validator = CompiledValidator.for_document(SeriesDocument)
+    value = _series_value()
+    return lambda: SeriesDocument(value, validator = validator)
+
+
+# Change patches
+
+def _patch_cases():
+    def prepare():
+        _sized_value(100000)
+        document_cls, value = _SIZED[100000]
+        return document_cls(copy.deepcopy(value))
+    def write():
+        document = prepare()
+        importance = [ 1, 2 ]
+        def operation():
+            importance.reverse()
+            document.events[3].importance = importance[0]
+            return document.patch(document.revision - 1)
+        return operation
+    def apply():
+        document = prepare()
+        document.is_valid
+        patches = [ [ { 'op' : 'replace', 'path' : u'/events/3/importance',
+            'value' : importance, }, ] for importance in (1, 2) ]
+        def operation():
+            patches.reverse()
+            document.apply_patch(patches[0])
+        return operation
+    case('patch 100KB write')(write)
+    case('patch 100KB apply')(apply)
+
+
+_patch_cases()
+
+
+# Column validation
+
+class RowDocument(JSONDocument):
+
+    sensor = JSONStringField(title = u'sensor', min_length = 1,
+        max_length = 16, pattern = r'^[a-z][a-z0-9]*$')
+    reading = JSONIntegerField(title = u'reading', min_value = 0,
+        max_value = 1000)
+    level = JSONStringField(title = u'level', enum = [ u'low', u'high', ])
+    ratio = JSONDecimalField(title = u'ratio', min_value = 0.0,
+        max_value = 1.0)
+    note = JSONStringField(title = u'note', optional = True)
+
+
+ROWS = 100000
+
+
+def _rows():
+    # one row in a hundred is out of range
+    return [ { 'sensor' : u's%d' % (index % 50), 'reading' : index % 1010,
+        'level' : (u'low', u'high')[index % 2], 'ratio' : index % 100 / 100.0,
+        } for index in range(ROWS) ]
+
+
+@case('validate rows compiled', number = 1)
+def validate_rows_compiled():
+    validator = CompiledValidator.for_document(RowDocument)
+    rows = _rows()
+    return lambda: RowDocument.validate_many(rows, validator = validator)
+
+
+@case('validate rows columns', number = 1)
+def validate_rows_columns():
+    rows = _rows()
+    return lambda: RowDocument.validate_columns(rows)
+
+
+# Running
+
+def measure(prepare, number, repeat, min_time):
+    timer = timeit.default_timer
+    times = []
+    for index in range(repeat):
+        operation = prepare()
+        if number is None:
+            # calibrate on the first repeat
+            start = timer()
+            operation()
+            elapsed = timer() - start
+            number = max(1, int(min_time / elapsed)) if elapsed > 0 else 1000
+            operation = prepare()
+        gc.collect()
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = timer()
+            for call in range(number):
+                operation()
+            times.append((timer() - start) / number)
+        finally:
+            if enabled:
+                gc.enable()
+    times.sort()
+    result = {
+        'seconds' : times[0],
+        'median' : times[len(times) // 2],
+        'number' : number,
+        'repeat' : repeat,
+    }
+    if tracemalloc is not None:
+        operation = prepare()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            operation()
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run(arguments):
+    results = {}
+    pattern = re.compile(arguments.filter) if arguments.filter else None
+    for name, prepare, number in CASES:
+        if pattern is not None and not pattern.search(name):
+            continue
+        result = measure(prepare, number, arguments.repeat, arguments.min_time)
+        results[name] = result
+        print('%-28s %14s %14s' % (name, _format_time(result['seconds']),
+            _format_bytes(result.get('peak_bytes'))))
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump({
+                'meta' : {
+                    'version' : json_schema_toolkit.__version__,
+                    'python' : platform.python_version(),
+                    'implementation' : platform.python_implementation(),
+                    'platform' : platform.platform(),
+                    'date' : time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                        time.gmtime()),
+                },
+                'results' : results,
+            }, output, indent = 2, sort_keys = True)
+    return 0
+
+
+def compare(arguments):
+    with open(arguments.before) as before:
+        before = json.load(before)['results']
+    with open(arguments.after) as after:
+        after = json.load(after)['results']
+    regressions = 0
+    for name in sorted(set(before) & set(after)):
+        for key, label in [ ('seconds', 'time'), ('peak_bytes', 'memory'), ]:
+            if key not in before[name] or key not in after[name]:
+                continue
+            old, new = before[name][key], after[name][key]
+            ratio = float(new) / old if old else 1.0
+            flag = ''
+            if ratio > 1.0 + arguments.threshold:
+                flag = 'REGRESSION'
+                regressions += 1
+            elif ratio < 1.0 - arguments.threshold:
+                flag = 'improvement'
+            format = _format_time if key == 'seconds' else _format_bytes
+            print('%-28s %-6s %14s %14s %7.2fx %s' % (name, label,
+                format(old), format(new), ratio, flag))
+    for name in sorted(set(before) ^ set(after)):
+        print('%-28s only in %s' % (name, 'before' if name in before else
+            'after'))
+    return 1 if regressions else 0
+
+
+def _format_time(seconds):
+    for unit, scale in [ ('s', 1.0), ('ms', 1e-3), ('us', 1e-6), ]:
+        if seconds >= scale:
+            return '%.3f %s' % (seconds / scale, unit)
+    return '%.3f ns' % (seconds / 1e-9)
+
+
+def _format_bytes(size):
+    if size is None:
+        return '-'
+    return '%d B' % size
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest = 'command')
+    run_parser = commands.add_parser('run', help = 'run the benchmarks')
+    run_parser.add_argument('--output', help = 'JSON results file to write')
+    run_parser.add_argument('--filter',
+        help = 'regular expression selecting the cases to run')
+    run_parser.add_argument('--repeat', type = int, default = 5)
+    run_parser.add_argument('--min-time', type = float, default = 0.2,
+        help = 'minimum duration of each repeat, in seconds')
+    compare_parser = commands.add_parser('compare',
+        help = 'compare two results files')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', type = float, default = 0.1,
+        help = 'relative change reported as a regression')
+    arguments = parser.parse_args(argv)
+    if arguments.command == 'compare':
+        return compare(arguments)
+    if arguments.command == 'run':
+        return run(arguments)
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
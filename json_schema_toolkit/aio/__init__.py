@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+""" Validation of values against the schema of a JSONDocument class from
+asyncio code (Python >= 3.6), without blocking the event loop on large values:
+values up to a size are validated inline, and larger values by a thread or
+process executor, with a bound on the number of validations in flight.
+"""
+
+__status__ = "beta"
+__version__ = "1.0.0b1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import asyncio
+import collections
+import multiprocessing
+import weakref
+
+from concurrent import futures
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+from json_schema_validator.schema import Schema
+
+# JSON Schema Toolkit
+from json_schema_toolkit.batch import EXECUTORS, ValidationResult
+from json_schema_toolkit.validator import CompiledValidator
+
+
+# The running event loop (asyncio.get_event_loop returns it from coroutines
+# before Python 3.7, which has no get_running_loop).
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+# The number of values (including the members and items of objects and lists)
+# up to which a value is validated inline, in the event loop.
+INLINE_SIZE = 1000
+
+
+def _exceeds(value, size):
+    """ True if the value is made of more than size values; only the first
+    size + 1 values are counted, so the cost is bounded by the size.
+    """
+    count = 0
+    pending = [ value ]
+    while pending:
+        value = pending.pop()
+        count += 1
+        if count > size:
+            return True
+        if isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, list):
+            pending.extend(value)
+    return False
+
+
+def _validate(validator, schema, value):
+    try:
+        validator.validate(schema, value)
+    except ValidationError as error:
+        return (error.message, error.new_message, error.object_expr,
+            error.schema_expr)
+    return None
+
+
+def _validate_document(document_cls, value):
+    # the compiled validator of the class is compiled once per worker process
+    return _validate(CompiledValidator.for_document(document_cls), None, value)
+
+
+class AsyncValidator(object):
+    """ Validates values against the schema of a JSONDocument class from
+    asyncio code. Values made of up to inline_size values are validated inline;
+    larger values are validated by the executor: 'thread' or 'process' (a pool
+    of the given number of workers, created when first needed), or a
+    concurrent.futures executor, which is not shut down by close. At most
+    concurrency validations (by default, the number of workers) run in the
+    executor at any time (in each event loop the validator is used from);
+    further validations wait for one of them to end.
+
+    The validator is the compiled validator of the class by default, or the
+    same as the 'validator' argument of JSONDocument. Process workers validate
+    with the compiled validator of the class (which must then be importable by
+    the workers), compiled once per worker, unless a validator is given, in
+    which case it is sent along with every value.
+
+    Cancelling a validation waiting for the executor removes it; a validation
+    already running in a worker runs to its end, but its result is discarded.
+    """
+
+    def __init__(self, document_cls, validator = None, executor = 'thread',
+        workers = None, concurrency = None, inline_size = INLINE_SIZE):
+        super(AsyncValidator, self).__init__()
+        if not isinstance(executor, futures.Executor) and \
+            executor not in EXECUTORS:
+            raise ValueError("executor must be one of %r, or an Executor" % (
+                EXECUTORS, ))
+        self.document_cls = document_cls
+        self.custom = validator is not None
+        self.validator = validator if validator is not None else \
+            CompiledValidator.for_document(document_cls)
+        self.schema = Schema(document_cls.document_schema)
+        self.executor = executor
+        self.workers = workers or multiprocessing.cpu_count()
+        self.concurrency = concurrency or self.workers
+        self.inline_size = inline_size
+        self._pool = None
+        # the semaphore bounding the validations in flight, per event loop,
+        # as semaphores cannot be shared by loops
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _submit(self, value):
+        loop = _running_loop()
+        if isinstance(self.executor, futures.Executor):
+            pool = self.executor
+        else:
+            if self._pool is None:
+                self._pool = (futures.ThreadPoolExecutor if
+                    self.executor == 'thread' else
+                    futures.ProcessPoolExecutor)(max_workers = self.workers)
+            pool = self._pool
+        if self.executor != 'thread' and not self.custom:
+            return loop.run_in_executor(pool, _validate_document,
+                self.document_cls, value)
+        return loop.run_in_executor(pool, _validate, self.validator,
+            self.schema, value)
+
+    async def validate(self, value):
+        """ Validates the value, returning True or raising the
+        ValidationError of the validator.
+        """
+        if self.executor == 'serial' or not _exceeds(value,
+            self.inline_size):
+            self.validator.validate(self.schema, value)
+            return True
+        loop = _running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(
+                self.concurrency)
+        async with semaphore:
+            error = await self._submit(value)
+        if error is not None:
+            raise ValidationError(*error)
+        return True
+
+    async def _result(self, index, value):
+        try:
+            await self.validate(value)
+        except ValidationError as error:
+            return ValidationResult(index, [ error ])
+        return ValidationResult(index, [])
+
+    async def validate_stream(self, iterable):
+        """ Validates the values of an asynchronous (or plain) iterable,
+        generating a ValidationResult for each of them in input order. Values
+        are read ahead of the results only while fewer than concurrency
+        validations are in flight; the validations in flight are cancelled if
+        the generator is closed or cancelled.
+        """
+        pending = collections.deque()
+        try:
+            if hasattr(iterable, '__aiter__'):
+                index = 0
+                async for value in iterable:
+                    pending.append(asyncio.ensure_future(self._result(index,
+                        value)))
+                    index += 1
+                    while len(pending) >= self.concurrency or \
+                        (pending and pending[0].done()):
+                        yield await pending.popleft()
+            else:
+                for index, value in enumerate(iterable):
+                    pending.append(asyncio.ensure_future(self._result(index,
+                        value)))
+                    while len(pending) >= self.concurrency or \
+                        (pending and pending[0].done()):
+                        yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def close(self):
+        """ Shuts down the pool of workers created by this validator, if any.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait = False)
+            self._pool = None
+
+
+# The AsyncValidator of each class used by JSONDocument.avalidate and
+# avalidate_stream.
+_VALIDATORS = weakref.WeakKeyDictionary()
+
+
+def for_document(document_cls):
+    """ Returns the AsyncValidator (with the default options) of the given
+    JSONDocument class, creating it the first time, or when the class schema
+    has been recompiled.
+    """
+    validator = _VALIDATORS.get(document_cls)
+    if validator is None or validator.schema._schema is not \
+        document_cls.document_schema:
+        validator = _VALIDATORS[document_cls] = AsyncValidator(document_cls)
+    return validator
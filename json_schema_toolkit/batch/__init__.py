@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 - 2015 by Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+"""
+
+__status__ = "beta"
+__version__ = "1.0.0b1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import collections
+import functools
+import itertools
+import multiprocessing
+import operator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+from json_schema_validator.schema import Schema
+from json_schema_validator.validator import Validator
+
+# JSON Schema Toolkit
+from json_schema_toolkit.validator import CompiledValidator
+
+
+EXECUTORS = ('serial', 'thread', 'process', )
+
+
+class ValidationResult(collections.namedtuple('ValidationResult',
+    ['index', 'errors'])):
+    """ The outcome of validating one record of a batch: the index of the record
+    in the input, and the list of ValidationError raised for it (empty when the
+    record is valid).
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+def _validate_chunk(schema, validator, start, records, fail_fast):
+    """ Validates a chunk of records starting at the given input index. Errors
+    are returned as plain tuples, so they can be sent back from worker
+    processes.
+    """
+    results = []
+    for index, record in enumerate(records, start):
+        try:
+            validator.validate(schema, record)
+        except ValidationError as error:
+            results.append((index, [ (error.message, error.new_message,
+                error.object_expr, error.schema_expr), ]))
+            if fail_fast:
+                break
+        else:
+            results.append((index, []))
+    return results
+
+
+# The schema and validator of a worker process, set once by _initialize_worker
+# when the process starts instead of being sent along with every chunk.
+_worker = {}
+
+
+def _initialize_worker(schema, validator):
+    _worker['schema'] = Schema(schema)
+    _worker['validator'] = validator
+
+
+def _validate_chunk_in_worker(start, records, fail_fast):
+    return _validate_chunk(_worker['schema'], _worker['validator'], start,
+        records, fail_fast)
+
+
+def _chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    start = 0
+    while True:
+        records = list(itertools.islice(iterator, chunk_size))
+        if not records:
+            return
+        yield start, records
+        start += len(records)
+
+
+def _results(chunk_results):
+    return [ ValidationResult(index, [ ValidationError(*error) for error in
+        errors ]) for index, errors in chunk_results ]
+
+
+def _map_chunks(chunks, function, workers = None, executor = 'serial',
+    initializer = None, initargs = ()):
+    """ Applies the function to the start index and records of every chunk,
+    generating the chunks and their results in input order. Chunks are
+    processed in the calling thread ('serial'), or by a pool of worker threads
+    or processes ('thread' or 'process', in which case the function must be
+    picklable, and the initializer is called once in every worker process); at
+    most two chunks per worker are in flight at any time, so the chunks are
+    consumed only as fast as their results are.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError("executor must be one of %r" % (EXECUTORS, ))
+    if executor == 'serial':
+        for start, records in chunks:
+            yield start, records, function(start, records)
+        return
+    if futures is None:
+        raise ImportError("the '%s' executor requires concurrent.futures" %
+            executor)
+    workers = workers or multiprocessing.cpu_count()
+    if executor == 'thread':
+        pool = futures.ThreadPoolExecutor(max_workers = workers)
+    else:
+        pool = futures.ProcessPoolExecutor(max_workers = workers,
+            initializer = initializer, initargs = initargs)
+    pending = collections.deque()
+    try:
+        for start, records in itertools.islice(chunks, 2 * workers):
+            pending.append((start, records, pool.submit(function, start,
+                records)))
+        while pending:
+            start, records, future = pending.popleft()
+            yield start, records, future.result()
+            for start, records in itertools.islice(chunks, 1):
+                pending.append((start, records, pool.submit(function, start,
+                    records)))
+    finally:
+        for start, records, future in pending:
+            future.cancel()
+        pool.shutdown(wait = True)
+
+
+def validate_many(schema, iterable, workers = None, executor = 'serial',
+    chunk_size = 1000, fail_fast = False, validator = None):
+    """ Validates every record of the iterable against the schema, returning a
+    list of ValidationResult in input order. Records are validated in chunks of
+    chunk_size, either in the calling thread ('serial'), or by a pool of worker
+    threads or processes ('thread' or 'process'); at most two chunks per worker
+    are in flight at any time, so the iterable is consumed incrementally. With
+    fail_fast, validation stops at the first invalid record (in input order),
+    which is the last result returned.
+
+    The validator (the json_schema_validator Validator by default) is the same
+    as the 'validator' argument of JSONDocument; with process workers the
+    schema and validator are sent to each worker process once, when it starts.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError("executor must be one of %r" % (EXECUTORS, ))
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    validator = validator if validator is not None else Validator
+    if executor == 'process':
+        function = functools.partial(_validate_chunk_in_worker,
+            fail_fast = fail_fast)
+    else:
+        compiled_schema = Schema(schema)
+        function = lambda start, records: _validate_chunk(compiled_schema,
+            validator, start, records, fail_fast)
+    results = []
+    for start, records, chunk_results in _map_chunks(_chunks(iterable,
+        chunk_size), function, workers = workers, executor = executor,
+        initializer = _initialize_worker, initargs = (schema, validator)):
+        chunk_results = _results(chunk_results)
+        results.extend(chunk_results)
+        if fail_fast and chunk_results and not chunk_results[-1].ok:
+            break
+    return results
+
+
+class ColumnReport(collections.namedtuple('ColumnReport',
+    ['count', 'failures'])):
+    """ The outcome of validating a batch of records column by column: the
+    number of records, and a dictionary of the input indices (in ascending
+    order) of the records failing each property, by property name. Records
+    which are not objects (and every invalid record, when the schema cannot
+    be validated by column) are listed under None; properties which no record
+    fails are left out.
+    """
+
+    __slots__ = ()
+
+    @property
+    def invalid(self):
+        """ The input indices of the invalid records, in ascending order. """
+        return sorted(set(itertools.chain.from_iterable(
+            self.failures.values())))
+
+    @property
+    def ok(self):
+        return not self.failures
+
+
+_MISSING = object()
+
+
+def _types(json_type):
+    types = Validator.JSON_TYPE_MAP[json_type]
+    return frozenset(types if isinstance(types, tuple) else (types, ))
+
+
+# The exact types of the values which are numbers and strings for the
+# Validator (which tests them with isinstance, so booleans are numbers).
+_NUMBERS = frozenset([ bool, ]) | _types('integer') | _types('number')
+
+_STRINGS = _types('string')
+
+# The exact types of the values whose checks the columns implement; values of
+# any other type (including subclasses) are validated one at a time.
+_KNOWN = _NUMBERS | _STRINGS | frozenset([ type(None), dict, list, ])
+
+_EXACT = {
+    'boolean' : frozenset([ bool, ]),
+    'null' : frozenset([ type(None), ]),
+    'object' : frozenset([ dict, ]),
+    'array' : frozenset([ list, ]),
+}
+
+
+def _exact_types(json_type):
+    """ Returns the exact types of the values of the given schema type which
+    the columns check, or None for any known type.
+    """
+    if json_type == 'any':
+        return None
+    if isinstance(json_type, list):
+        if 'any' in json_type or json_type == []:
+            return None
+        return frozenset().union(*[ _exact_types(t) for t in json_type ])
+    if json_type in ('integer', 'number'):
+        return frozenset([ bool, ]) | _types(json_type)
+    if json_type == 'string':
+        return _STRINGS
+    return _EXACT[json_type]
+
+
+def _by_column(schema):
+    """ True if the columns implement every check of the schema of a
+    property (its type, range, length, enumeration and pattern), and False
+    for schemas whose values are validated one at a time.
+    """
+    json_type = schema.type
+    if isinstance(json_type, list):
+        if [ t for t in json_type if t not in _EXACT and t not in ('any',
+            'integer', 'number', 'string') ]:
+            return False
+    elif json_type not in _EXACT and json_type not in ('any', 'integer',
+        'number', 'string'):
+        return False
+    return schema._schema.get('format') is None and \
+        not schema._schema.get('properties') and \
+        not schema._schema.get('items')
+
+
+def _positions(types, found, wanted):
+    """ Returns the positions of the values whose types (found among the
+    given types) are wanted, or None when they all are.
+    """
+    if found <= wanted:
+        return None
+    return [ position for position, value_type in enumerate(types)
+        if value_type in wanted ]
+
+
+def _select(values, positions):
+    return values if positions is None else [ values[position]
+        for position in positions ]
+
+
+def _translate(positions, selected):
+    """ Returns the positions in a column of the given positions among the
+    values selected from it by _select.
+    """
+    return selected if positions is None else [ positions[position]
+        for position in selected ]
+
+
+def _outside(values, minimum, maximum, minimum_can_equal,
+    maximum_can_equal):
+    """ Returns the positions of the values which may be out of range: none
+    when the smallest and largest values are within it, and otherwise those
+    found with NumPy when it is installed (and the values and bounds are all
+    integers or all floats), or by comparing every value. When the values
+    cannot be compared with each other, they are all returned.
+    """
+    if not values or (minimum is None and maximum is None):
+        return []
+    try:
+        lowest, highest = min(values), max(values)
+        if not any(map(operator.ne, values, values)) and \
+            (minimum is None or lowest > minimum or (lowest == minimum and
+            minimum_can_equal)) and (maximum is None or highest < maximum or
+            (highest == maximum and maximum_can_equal)):
+            return []
+    except (TypeError, ArithmeticError):
+        return list(range(len(values)))
+    positions = _numpy_outside(values, minimum, maximum, minimum_can_equal,
+        maximum_can_equal)
+    if positions is not None:
+        return positions
+    try:
+        return [ position for position, value in enumerate(values)
+            if not (minimum is None or value > minimum or (value == minimum and
+            minimum_can_equal)) or not (maximum is None or value < maximum or
+            (value == maximum and maximum_can_equal)) ]
+    except (TypeError, ArithmeticError):
+        return list(range(len(values)))
+
+
+def _numpy_outside(values, minimum, maximum, minimum_can_equal,
+    maximum_can_equal):
+    if numpy is None:
+        return None
+    value_types = set(map(type, values))
+    bounds = [ bound for bound in (minimum, maximum) if bound is not None ]
+    if value_types == set([ int, ]) and [ bound for bound in bounds
+        if type(bound) is int ] == bounds:
+        dtype = numpy.int64
+    elif value_types == set([ float, ]) and [ bound for bound in bounds
+        if type(bound) is float ] == bounds:
+        dtype = numpy.float64
+    else:
+        return None
+    try:
+        array = numpy.array(values, dtype = dtype)
+        numpy.array(bounds, dtype = dtype)
+    except (OverflowError, ValueError):
+        return None
+    mask = numpy.zeros(len(values), dtype = bool)
+    if minimum is not None:
+        mask |= (array <= minimum) if not minimum_can_equal else \
+            (array < minimum)
+    if maximum is not None:
+        mask |= (array >= maximum) if not maximum_can_equal else \
+            (array > maximum)
+    return numpy.flatnonzero(mask).tolist()
+
+
+def _candidates(schema, values):
+    """ Returns the set of the positions of the values of a column which may
+    fail the schema of its property, a superset of those which do.
+    """
+    types = list(map(type, values))
+    exact = _exact_types(schema.type)
+    allowed = _KNOWN if exact is None else _KNOWN & exact
+    found = set(types)
+    candidates = set()
+    if not found <= allowed:
+        candidates.update(position for position, value_type in
+            enumerate(types) if value_type not in allowed)
+    if schema.minimum is not None or schema.maximum is not None:
+        positions = _positions(types, found, _NUMBERS)
+        minimum, maximum = schema.minimum, schema.maximum
+        outside = _outside(_select(values, positions), minimum, maximum,
+            minimum is None or schema.minimumCanEqual,
+            maximum is None or schema.maximumCanEqual)
+        candidates.update(_translate(positions, outside))
+    pattern = schema.pattern
+    if schema.minLength or schema.maxLength is not None or \
+        (pattern is not None and pattern.pattern):
+        positions = _positions(types, found, _STRINGS)
+        strings = _select(values, positions)
+        # strings repeat within columns, so each string is checked once
+        distinct = list(set(strings))
+        outside = _outside(list(map(len, distinct)), schema.minLength or None,
+            schema.maxLength, True, True)
+        if pattern is not None and pattern.pattern:
+            outside.extend(itertools.compress(range(len(distinct)),
+                map(operator.not_, map(pattern.match, distinct))))
+        if outside:
+            failing = set(distinct[position] for position in outside)
+            candidates.update(_translate(positions, list(itertools.compress(
+                range(len(strings)), map(failing.__contains__, strings)))))
+    enum = schema.enum
+    if enum is not None:
+        try:
+            outside = set(values).difference(enum)
+        except TypeError:
+            candidates.update(position for position, value in
+                enumerate(values) if value not in enum)
+        else:
+            if outside:
+                candidates.update(itertools.compress(range(len(values)),
+                    map(outside.__contains__, values)))
+    return candidates
+
+
+def _fails(validate, value):
+    try:
+        validate(value)
+    except ValidationError:
+        return True
+    return False
+
+
+def validate_columns(schema, records, validator = None):
+    """ Validates the records (objects, the values of documents of one class)
+    against the schema column by column, returning a ColumnReport of the
+    records failing each property. Each check of the schema of a property
+    (type, range, length, enumeration and pattern) is applied to the values of
+    the property in all the records at once: ranges and lengths by their
+    smallest and largest values (locating the values out of range with NumPy,
+    when it is installed), enumerations by set difference and patterns by
+    mapping the compiled expression over the strings. The values these checks
+    single out, and the values of properties with other schemas (objects,
+    lists and formats), are validated one at a time with the compiled
+    validator, so a record is reported as invalid exactly when validating it
+    on its own fails.
+
+    The validator is the CompiledValidator of the schema (compiled when not
+    given); schemas it cannot compile, and schemas of a type other than
+    'object', are validated record by record.
+    """
+    records = records if isinstance(records, list) else list(records)
+    validator = validator if validator is not None else \
+        CompiledValidator(schema)
+    schema = Schema(validator.schema)
+    if validator.source is None or schema.type != 'object':
+        invalid = [ index for index, record in enumerate(records)
+            if _fails(validator, record) ]
+        return ColumnReport(len(records), { None : invalid } if invalid
+            else {})
+    failures = {}
+    if set(map(type, records)) <= set([ dict, ]):
+        indices = None
+        objects = records
+    else:
+        indices = [ index for index, record in enumerate(records)
+            if isinstance(record, dict) ]
+        objects = [ records[index] for index in indices ]
+        if len(indices) < len(records):
+            failures[None] = sorted(set(range(len(records))).difference(
+                indices))
+    for name, prop_schema in schema.properties.items():
+        prop_schema = Schema(prop_schema)
+        failed = set()
+        try:
+            values = list(map(operator.itemgetter(name), objects))
+            positions = None
+        except KeyError:
+            # the values of the records which have the property
+            values = list(map(operator.methodcaller('get', name, _MISSING),
+                objects))
+            positions = list(itertools.compress(range(len(values)),
+                map(operator.is_not, values, itertools.repeat(_MISSING))))
+            if not prop_schema.optional:
+                failed.update(set(range(len(values))).difference(positions))
+            values = [ values[position] for position in positions ]
+        validate = validator.for_subschema(prop_schema._schema)
+        candidates = _candidates(prop_schema, values) if \
+            _by_column(prop_schema) else range(len(values))
+        failed.update(_translate(positions, [ position for position in
+            candidates if _fails(validate, values[position]) ]))
+        if failed:
+            failures[name] = _translate(indices, sorted(failed))
+    return ColumnReport(len(records), failures)
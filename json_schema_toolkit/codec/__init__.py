@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+""" Registry of JSON codecs (encoder and decoder backends) used by
+JSONDocument.to_json and from_json, and by the bulk loader. The standard
+library json module is always available and is the default; simplejson (with
+its C speedups) and orjson are registered when they are installed, and are only
+used when chosen (by name, or with set_default), as they do not encode all the
+values the json module does in the same way.
+"""
+
+__status__ = "beta"
+__version__ = "1.0.0b1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import datetime
+import decimal
+import json
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON Schema Validator
+from json_schema_validator.extensions import datetime_extension, \
+    timedelta_extension
+
+# JSON Schema Toolkit
+from json_schema_toolkit.compact import NumericArray
+
+
+def _default(value):
+    """ Encodes the values the documents coerce when they are set (datetimes
+    and timedeltas, as JSONDateTimeField and JSONTimeDeltaField do), for values
+    which were never set through a document, the NumericArrays holding the
+    lists of compact JSONListFields, and Decimals (as the integer or float
+    they are equal to, as numbers are decoded).
+    """
+    if isinstance(value, datetime.datetime):
+        return datetime_extension.to_json(value)
+    if isinstance(value, datetime.timedelta):
+        return timedelta_extension.to_json(value)
+    if isinstance(value, NumericArray):
+        return value.tolist()
+    if isinstance(value, decimal.Decimal):
+        if value.is_finite() and value == value.to_integral_value():
+            return int(value)
+        return float(value)
+    raise TypeError("%r is not JSON serializable" % (value, ))
+
+
+class Codec(object):
+    """ A JSON encoder and decoder. Subclasses implement encode (returning
+    text), and may implement encode_bytes (returning the UTF-8 encoding)
+    when their encoder produces bytes. Decoding accepts text or UTF-8 bytes.
+    Codecs are stateless, so they can be sent to worker processes.
+    """
+
+    name = None
+
+    def encode(self, value):
+        raise NotImplementedError
+
+    def encode_bytes(self, value):
+        return self.encode(value).encode('utf-8')
+
+    def decode(self, raw):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.name)
+
+
+class StandardCodec(Codec):
+    """ The json module of the standard library (with its C accelerator when
+    available).
+    """
+
+    name = 'json'
+
+    def encode(self, value):
+        return json.dumps(value, separators = (',', ':'), default = _default)
+
+    def decode(self, raw):
+        if isinstance(raw, (bytearray, memoryview)):
+            raw = bytes(raw)
+        if isinstance(raw, bytes) and bytes is not str:
+            raw = raw.decode('utf-8')
+        return json.loads(raw)
+
+
+class SimplejsonCodec(Codec):
+    """ simplejson, registered when installed with its C speedups.
+    """
+
+    name = 'simplejson'
+
+    def encode(self, value):
+        return simplejson.dumps(value, separators = (',', ':'),
+            default = _default)
+
+    def decode(self, raw):
+        if isinstance(raw, (bytearray, memoryview)):
+            raw = bytes(raw)
+        return simplejson.loads(raw)
+
+
+class OrjsonCodec(Codec):
+    """ orjson, registered when installed but not the default. Datetimes are
+    encoded as the other codecs encode them instead of with the orjson format;
+    integers must fit in 64 bits, and NaN and infinities are encoded as null.
+    """
+
+    name = 'orjson'
+
+    def encode(self, value):
+        return self.encode_bytes(value).decode('utf-8')
+
+    def encode_bytes(self, value):
+        return orjson.dumps(value, default = _default, option =
+            orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+    def decode(self, raw):
+        return orjson.loads(raw)
+
+
+# Registered codecs by name, and the name of the default codec.
+_CODECS = {}
+_default_name = None
+
+
+def register(codec, default = False):
+    """ Registers a codec instance under its name, replacing any codec with the
+    same name, and optionally makes it the default.
+    """
+    global _default_name
+    _CODECS[codec.name] = codec
+    if default or _default_name is None:
+        _default_name = codec.name
+
+
+def set_default(name):
+    """ Makes the registered codec with the given name the default.
+    """
+    global _default_name
+    get_codec(name)
+    _default_name = name
+
+
+def get_codec(codec = None):
+    """ Returns the registered codec with the given name, the default codec
+    when the name is None, or the given Codec itself.
+    """
+    if isinstance(codec, Codec):
+        return codec
+    if codec is None:
+        codec = _default_name
+    try:
+        return _CODECS[codec]
+    except KeyError:
+        raise ValueError("unknown JSON codec %r (registered: %s)" % (codec,
+            ', '.join(sorted(_CODECS))))
+
+
+def codecs():
+    """ Returns the names of the registered codecs.
+    """
+    return sorted(_CODECS)
+
+
+def _has_speedups():
+    try:
+        from simplejson import _speedups
+    except ImportError:
+        return False
+    return True
+
+
+# simplejson is registered, but measured no faster than the standard library
+# json module on the documents of the benchmarks, so it is not the default;
+# neither is orjson, whose output differs, so installing it changes nothing
+register(StandardCodec())
+if simplejson is not None and _has_speedups():
+    register(SimplejsonCodec())
+if orjson is not None:
+    register(OrjsonCodec())
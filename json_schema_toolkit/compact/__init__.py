@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+""" Compact storage of lists of JSON integers or numbers, held by documents
+for the lists of JSONListFields declared with 'compact': the values are kept
+in a typed buffer of the array module (or a NumPy array, when NumPy is
+installed) instead of one Python object per item, and are only turned into a
+list when the document is encoded.
+"""
+
+__status__ = "beta"
+__version__ = "1.0.0b1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+BACKENDS = ('array', 'numpy', )
+
+
+try:
+    _INTEGER_TYPES = frozenset([ int, long, ])
+except NameError:
+    _INTEGER_TYPES = frozenset([ int, ])
+
+_FLOAT_TYPES = frozenset([ float, ])
+
+# integers are stored as 64 bit signed integers, floats as doubles
+try:
+    array.array('q')
+    _INTEGER_CODE = 'q'
+except ValueError:
+    _INTEGER_CODE = 'l'
+
+_MINIMUM = -2 ** 63
+_MAXIMUM = 2 ** 63 - 1
+
+
+def backends():
+    """ Returns the storage backends available: 'array', and 'numpy' when
+    NumPy is installed.
+    """
+    return tuple(backend for backend in BACKENDS if backend != 'numpy' or
+        numpy is not None)
+
+
+def _buffer(values, integers, backend):
+    if backend == 'numpy':
+        return numpy.array(values, dtype = numpy.int64 if integers else
+            numpy.float64)
+    return array.array(_INTEGER_CODE if integers else 'd', values)
+
+
+def to_array(values, json_type, backend = 'array'):
+    """ Returns a NumericArray holding the items of a list, when they are all
+    integers which fit 64 bits or (for the 'number' JSON type) all floats, or
+    None otherwise (including for empty lists). Booleans are not integers here,
+    so that they remain booleans when encoded.
+    """
+    if not values or not isinstance(values, list):
+        return None
+    types = set(map(type, values))
+    if types <= _INTEGER_TYPES:
+        bounds = min(values), max(values)
+        if bounds[0] < _MINIMUM or bounds[1] > _MAXIMUM:
+            return None
+        return NumericArray(_buffer(values, True, backend), bounds)
+    if json_type == 'number' and types <= _FLOAT_TYPES:
+        return NumericArray(_buffer(values, False, backend))
+    return None
+
+
+class NumericArray(object):
+    """ A list of integers or floats held in an array.array or NumPy array,
+    with the list operations documents perform on their values (indexing,
+    assignment, deletion, iteration, len, comparison) and tolist. Items read
+    are Python ints and floats. Assigning a value the buffer cannot hold
+    exactly (such as a float to an integer array, a boolean or a string)
+    turns the buffer into a plain list, so an array accepts whatever a list
+    would, and only loses its compactness.
+    """
+
+    __slots__ = ('_buffer', '_bounds', )
+
+    def __init__(self, buffer, bounds = None):
+        super(NumericArray, self).__init__()
+        self._buffer = buffer
+        # the smallest and largest values, once known; kept until a value
+        # is replaced or deleted, and extended by values inserted
+        self._bounds = bounds
+
+    @property
+    def compact(self):
+        """ False once the values are held in a plain list.
+        """
+        return self._buffer.__class__ is not list
+
+    def types(self):
+        """ Returns the Python types of the values held (ints or floats), or
+        None once the values are held in a plain list.
+        """
+        buffer = self._buffer
+        if buffer.__class__ is list:
+            return None
+        if buffer.__class__ is array.array:
+            integers = buffer.typecode != 'd'
+        else:
+            integers = buffer.dtype.kind == 'i'
+        return _INTEGER_TYPES if integers else _FLOAT_TYPES
+
+    def _fits(self, value):
+        types = self.types()
+        if types is None or value.__class__ not in types:
+            return False
+        return types is _FLOAT_TYPES or _MINIMUM <= value <= _MAXIMUM
+
+    def _loosen(self):
+        self._buffer = self.tolist()
+        self._bounds = None
+
+    def bounds(self):
+        """ Returns the smallest and largest values held, or None for an empty
+        array, a plain list, or floats including a NaN (whose comparisons do
+        not order the values). The bounds are kept until a value is replaced
+        or deleted, so validating an array again does not go through its
+        values.
+        """
+        if self._bounds is not None:
+            return self._bounds
+        buffer = self._buffer
+        if buffer.__class__ is list or not len(buffer):
+            return None
+        if buffer.__class__ is array.array:
+            if buffer.typecode == 'd':
+                total = sum(buffer)
+                if total != total:
+                    return None
+            self._bounds = min(buffer), max(buffer)
+        else:
+            if buffer.dtype.kind == 'f' and numpy.isnan(buffer).any():
+                return None
+            self._bounds = buffer.min().item(), buffer.max().item()
+        return self._bounds
+
+    def tolist(self):
+        """ Returns the values as a list of Python ints and floats.
+        """
+        buffer = self._buffer
+        return list(buffer) if buffer.__class__ is list else buffer.tolist()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def __getitem__(self, index):
+        value = self._buffer[index]
+        if isinstance(index, slice):
+            return value if value.__class__ is list else value.tolist()
+        if numpy is not None and isinstance(value, numpy.generic):
+            return value.item()
+        return value
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice) or not self._fits(value):
+            self._loosen()
+        self._buffer[index] = value
+        self._bounds = None
+
+    def __delitem__(self, index):
+        self._bounds = None
+        buffer = self._buffer
+        if numpy is not None and isinstance(buffer, numpy.ndarray):
+            # raises IndexError as lists do
+            buffer[index]
+            self._buffer = numpy.delete(buffer, index)
+        else:
+            del buffer[index]
+
+    def insert(self, index, value):
+        if not self._fits(value):
+            self._loosen()
+        elif self._bounds is not None and value == value:
+            self._bounds = (min(self._bounds[0], value),
+                max(self._bounds[1], value))
+        buffer = self._buffer
+        if numpy is not None and isinstance(buffer, numpy.ndarray):
+            self._buffer = numpy.insert(buffer, min(index, len(buffer)) if
+                index >= 0 else max(index + len(buffer), 0), value)
+        else:
+            buffer.insert(index, value)
+
+    def append(self, value):
+        self.insert(len(self._buffer), value)
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def pop(self, index = -1):
+        value = self[index]
+        del self[index]
+        return value
+
+    def __iter__(self):
+        buffer = self._buffer
+        if numpy is not None and isinstance(buffer, numpy.ndarray):
+            return iter(buffer.tolist())
+        return iter(buffer)
+
+    def __contains__(self, value):
+        return value in self._buffer
+
+    def __eq__(self, other):
+        if isinstance(other, NumericArray):
+            other = other.tolist()
+        if not isinstance(other, list):
+            return NotImplemented
+        return len(self) == len(other) and self.tolist() == other
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __copy__(self):
+        buffer = self._buffer
+        return NumericArray(buffer.copy() if numpy is not None and
+            isinstance(buffer, numpy.ndarray) else buffer[:], self._bounds)
+
+    def __deepcopy__(self, memo):
+        # the values are immutable
+        return self.__copy__()
+
+    def __reduce__(self):
+        return (NumericArray, (self._buffer, self._bounds))
+
+    def __repr__(self):
+        return 'NumericArray(%r)' % (self.tolist(), )
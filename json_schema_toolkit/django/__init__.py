@@ -31,11 +31,162 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-""" 
+
+""" Django model field storing a JSONDocument as its JSON encoding in a text
+column.
 """
 
+from __future__ import absolute_import
+
 __status__ = "alpha"
 __version__ = "1.0.0a1"
 __maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
 __author__ = (u"Alexis Petrounias <www.petrounias.org>", )
 
+# Django
+from django.core import exceptions
+from django.db import models
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+
+# JSON Schema Toolkit
+from json_schema_toolkit.document import JSONDocument
+from json_schema_toolkit.validator import CompiledValidator
+
+
+try:
+    _TEXT_TYPES = (basestring, bytearray, )
+except NameError:
+    _TEXT_TYPES = (str, bytes, bytearray, )
+
+
+class _LoadedText(type(u'')):
+    """ The JSON encoding of a document as loaded from the database (marked by
+    JSONDocumentModelField.from_db_value), which is saved back without being
+    validated again as long as it is not modified.
+    """
+
+    __slots__ = ()
+
+
+class JSONDocumentDescriptor(object):
+    """ Attribute of a model holding the value of a JSONDocumentModelField. The
+    JSON encoding loaded from the database is only wrapped in a (lazy) document
+    when the attribute is first read, and only decoded and validated when the
+    value of that document is first accessed. Text assigned otherwise is
+    decoded and validated when read or saved.
+    """
+
+    def __init__(self, field):
+        super(JSONDocumentDescriptor, self).__init__()
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        if self.field.attname not in instance.__dict__:
+            # deferred field
+            instance.refresh_from_db(fields = [ self.field.attname, ])
+        value = instance.__dict__[self.field.attname]
+        if value is not None and not isinstance(value, JSONDocument):
+            value = self.field.to_python(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # text is recorded as loaded from the database only when marked so by
+        # from_db_value (or taken from another instance which loaded it)
+        instance.__dict__[self.field.attname] = value
+
+
+class JSONDocumentModelField(models.TextField):
+    """ Model field storing a document of the given JSONDocument class. The
+    compiled validator of the class is used for all of its documents. Values
+    loaded from the database are wrapped and decoded lazily (see
+    JSONDocumentDescriptor); the field can be assigned a document or its value.
+
+    The encoding loaded from the database is only marked as such by
+    from_db_value, without being decoded, and wrapped by the descriptor when
+    read. Documents, and text assigned to the field, are validated when the
+    model is saved, unless they were loaded from the database and have not
+    been modified since (their revision is unchanged), in which case the
+    encoding loaded is saved back as it was.
+    """
+
+    description = "JSON document"
+
+    def __init__(self, document_class = None, *args, **kwargs):
+        if document_class is None or not issubclass(document_class,
+            JSONDocument):
+            raise TypeError("document_class must be a JSONDocument subclass")
+        self.document_class = document_class
+        self.validator = None
+        super(JSONDocumentModelField, self).__init__(*args, **kwargs)
+
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super(JSONDocumentModelField, self).contribute_to_class(cls, name,
+            *args, **kwargs)
+        # compiled (or reused) once, when the model class is created
+        self.validator = CompiledValidator.for_document(self.document_class)
+        setattr(cls, self.name, JSONDocumentDescriptor(self))
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(JSONDocumentModelField,
+            self).deconstruct()
+        kwargs['document_class'] = self.document_class
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection, *args):
+        if isinstance(value, type(u'')):
+            return _LoadedText(value)
+        return value
+
+    def to_python(self, value):
+        if value is None or isinstance(value, JSONDocument):
+            return value
+        try:
+            if isinstance(value, _LoadedText):
+                # as plain text, which some codecs require
+                return self.document_class.from_json(type(u'')(value),
+                    lazy = True, validator = self.validator)
+            if isinstance(value, _TEXT_TYPES):
+                return self.document_class.from_json(value,
+                    validator = self.validator)
+            return self.document_class(value, validator = self.validator)
+        except ValidationError as error:
+            raise exceptions.ValidationError(error.message, code = 'invalid')
+        except ValueError as error:
+            # text which is not JSON
+            raise exceptions.ValidationError(u'%s' % error, code = 'invalid')
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.attname)
+        if value is None or isinstance(value, _LoadedText):
+            # loaded and never read, so unchanged
+            return value
+        value = self.to_python(value)
+        model_instance.__dict__[self.attname] = value
+        raw = value.__dict__.get('_raw')
+        if raw is None or raw[1] != value.revision:
+            self._validate_document(value)
+        return value
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, _TEXT_TYPES):
+            return value
+        return self.to_python(value).to_json()
+
+    def validate(self, value, model_instance):
+        super(JSONDocumentModelField, self).validate(value, model_instance)
+        if isinstance(value, JSONDocument):
+            self._validate_document(value)
+
+    def value_to_string(self, obj):
+        return self.get_prep_value(self.value_from_object(obj))
+
+    def _validate_document(self, document):
+        try:
+            document.validate()
+        except ValidationError as error:
+            raise exceptions.ValidationError(error.message, code = 'invalid')
@@ -31,10 +31,1020 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-""" 
+
+""" Generation of PostgreSQL CHECK constraints enforcing the schema of a
+JSONDocument class on a json, jsonb or text column (PostgreSQL >= 9.4, for the
+jsonb casts of enumerations), their integration with Django migrations, bulk
+loading of validated documents with COPY, a model field saving only the
+members of documents changed since they were loaded, and indexes on the values
+of fields with the lookups which use them.
 """
 
+from __future__ import absolute_import
+
 __status__ = "alpha"
 __version__ = "1.0.0a1"
 __maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
 __author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import collections
+import functools
+import hashlib
+import io
+import json
+import time
+
+# Django
+import django
+from django.core import exceptions
+from django.db import migrations, models
+from django.db.models import Index, Transform
+from django.db.models.expressions import RawSQL
+
+try:
+    from django.db.models.constraints import BaseConstraint
+except ImportError:
+    BaseConstraint = None
+
+try:
+    from django.db.models import JSONField
+except ImportError:
+    JSONField = None
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+from json_schema_validator.schema import Schema
+
+# JSON Schema Toolkit
+from json_schema_toolkit import batch
+from json_schema_toolkit.codec import get_codec
+from json_schema_toolkit.django import JSONDocumentDescriptor, \
+    JSONDocumentModelField, _TEXT_TYPES
+from json_schema_toolkit.document import JSONDocument, JSONDocumentField, \
+    JSONDateTimeField, JSONDateField
+from json_schema_toolkit.validator import CompiledValidator
+
+
+COLUMN_TYPES = ('json', 'jsonb', 'text', )
+
+# the largest number of operations saved by a partial update, see
+# PartialJSONDocumentModelField
+MAX_OPERATIONS = 100
+
+# JSON schema types and the casts of their values in index expressions and
+# lookups; values of other types are compared as jsonb
+_CASTS = {
+    'string' : 'text',
+    'integer' : 'bigint',
+    'number' : 'numeric',
+    'boolean' : 'boolean',
+}
+
+# the casts of text to dates and times depend on the settings of the session,
+# so they are made by functions fixing these settings, which can be indexed
+_CAST_FUNCTIONS = {
+    'timestamptz' : 'json_schema_toolkit_timestamptz',
+    'date' : 'json_schema_toolkit_date',
+}
+
+# JSON schema types and the json_typeof result for their values
+_TYPEOF = {
+    'string' : 'string',
+    'number' : 'number',
+    'integer' : 'number',
+    'boolean' : 'boolean',
+    'object' : 'object',
+    'array' : 'array',
+    'null' : 'null',
+}
+
+
+def quote_name(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def quote_literal(value):
+    return "'%s'" % value.replace("'", "''")
+
+
+class _Node(object):
+    """ SQL expressions for the value at a path of a json or jsonb column.
+    """
+
+    def __init__(self, column, function, path = ()):
+        super(_Node, self).__init__()
+        self.column = column
+        self.function = function
+        self.path = path
+        if path:
+            location = 'ARRAY[%s]' % ', '.join(quote_literal(u'%s' % item)
+                for item in path)
+            self.json = '(%s #> %s)' % (column, location)
+            self.text = '(%s #>> %s)' % (column, location)
+        else:
+            self.json = column
+            self.text = "(%s #>> '{}')" % column
+        self.typeof = '%s_typeof(%s)' % (function, self.json)
+
+    def child(self, item):
+        return _Node(self.column, self.function, self.path + (item, ))
+
+    def when(self, json_type, condition):
+        """ Applies the condition only to values of the given type; the type
+        itself is checked separately.
+        """
+        return 'CASE WHEN %s = %s THEN %s ELSE TRUE END' % (self.typeof,
+            quote_literal(json_type), condition)
+
+
+def _conditions(schema, node, conditions):
+    types = schema.get('type', 'any')
+    if not isinstance(types, list):
+        types = [ types, ]
+    if all(json_type in _TYPEOF for json_type in types):
+        conditions.append('%s IN (%s)' % (node.typeof, ', '.join(
+            quote_literal(json_type) for json_type in
+            sorted(set(_TYPEOF[json_type] for json_type in types)))))
+        if 'integer' in types and 'number' not in types:
+            conditions.append(node.when('number', "%s ~ '^-?[0-9]+$'" % (
+                node.text, )))
+    bounds = []
+    if schema.get('minimum') is not None:
+        bounds.append('%s::numeric %s %s' % (node.text,
+            '>=' if schema.get('minimumCanEqual', True) else '>',
+            schema['minimum']))
+    if schema.get('maximum') is not None:
+        bounds.append('%s::numeric %s %s' % (node.text,
+            '<=' if schema.get('maximumCanEqual', True) else '<',
+            schema['maximum']))
+    if bounds:
+        conditions.append(node.when('number', ' AND '.join(bounds)))
+    if schema.get('minLength') is not None:
+        conditions.append(node.when('string', 'char_length(%s) >= %d' % (
+            node.text, schema['minLength'])))
+    if schema.get('maxLength') is not None:
+        conditions.append(node.when('string', 'char_length(%s) <= %d' % (
+            node.text, schema['maxLength'])))
+    pattern = _pattern(schema)
+    if pattern:
+        conditions.append(node.when('string', '%s ~ %s' % (node.text,
+            quote_literal(pattern))))
+    if schema.get('enum') is not None:
+        conditions.append('%s::jsonb IN (%s)' % (node.json, ', '.join(
+            '%s::jsonb' % quote_literal(json.dumps(value, sort_keys = True))
+            for value in schema['enum'])))
+    for key, property_schema in sorted(schema.get('properties', {}).items()):
+        child = node.child(key)
+        if not property_schema.get('optional', False):
+            conditions.append(node.when('object', '%s IS NOT NULL' % (
+                child.json, )))
+        _conditions(property_schema, child, conditions)
+    items = schema.get('items')
+    if isinstance(items, list):
+        if items:
+            conditions.append(node.when('array', '%s_array_length(%s) >= %d' % (
+                node.function, node.json, len(items))))
+        for index, item_schema in enumerate(items):
+            _conditions(item_schema, node.child(index), conditions)
+    elif isinstance(items, dict):
+        # CHECK constraints cannot use subqueries, so the items of the list are
+        # reached by a jsonpath filter selecting the items violating the schema
+        # (in strict mode, as lax mode unwraps lists of lists)
+        violations = _path_violations(items, '@', [])
+        if violations:
+            conditions.append(node.when('array',
+                'NOT jsonb_path_exists(%s, %s)' % (node.json if
+                node.function == 'jsonb' else '%s::jsonb' % node.json,
+                quote_literal('strict $[*] ? (%s)' % ' || '.join(
+                violations)))))
+    return conditions
+
+
+def _pattern(schema):
+    pattern = schema.get('pattern')
+    if pattern:
+        pattern = getattr(pattern, 'pattern', pattern)
+        # the validator matches patterns at the start of strings only
+        if not pattern.startswith('^'):
+            pattern = '^(%s)' % pattern
+    return pattern
+
+
+def _length_pattern(length):
+    """ The pattern of strings of at least the given number of characters;
+    regular expressions of PostgreSQL repeat at most 255 times.
+    """
+    repeats, rest = divmod(length, 255)
+    return '^%s.{%d}' % ('(.{255}){%d}' % repeats if repeats else '', rest)
+
+
+def _path_violations(schema, path, violations):
+    """ Appends to violations the jsonpath predicates true of the value at the
+    given path of a filter expression when it violates the schema, which are
+    the negations of the conditions of _conditions. Each predicate checks the
+    type of the value (and members and items the presence of the value) first,
+    as values of other types, and missing values, are errors in strict mode.
+    """
+    def when(json_type, predicate):
+        return '(%s.type() == "%s" && %s)' % (path, json_type, predicate)
+
+    types = schema.get('type', 'any')
+    if not isinstance(types, list):
+        types = [ types, ]
+    if all(json_type in _TYPEOF for json_type in types):
+        violations.append('!(%s)' % ' || '.join('%s.type() == "%s"' % (path,
+            json_type) for json_type in sorted(set(_TYPEOF[json_type]
+            for json_type in types))))
+        if 'integer' in types and 'number' not in types:
+            violations.append(when('number', '%s.floor() != %s' % (path,
+                path)))
+    if schema.get('minimum') is not None:
+        violations.append(when('number', '%s %s %s' % (path,
+            '<' if schema.get('minimumCanEqual', True) else '<=',
+            json.dumps(schema['minimum']))))
+    if schema.get('maximum') is not None:
+        violations.append(when('number', '%s %s %s' % (path,
+            '>' if schema.get('maximumCanEqual', True) else '>=',
+            json.dumps(schema['maximum']))))
+    if schema.get('minLength') is not None:
+        violations.append(when('string', '!(%s like_regex %s flag "s")' % (
+            path, json.dumps(_length_pattern(schema['minLength'])))))
+    if schema.get('maxLength') is not None:
+        violations.append(when('string', '%s like_regex %s flag "s"' % (
+            path, json.dumps(_length_pattern(schema['maxLength'] + 1)))))
+    pattern = _pattern(schema)
+    if pattern:
+        violations.append(when('string', '!(%s like_regex %s)' % (path,
+            json.dumps(pattern))))
+    if schema.get('enum') is not None:
+        if any(isinstance(value, (dict, list)) for value in schema['enum']):
+            raise ValueError("enumerations of objects or lists cannot be "
+                "checked in the items of lists")
+        violations.append('(%s.type() == "object" || %s.type() == "array" || '
+            '!(%s))' % (path, path, ' || '.join('%s == %s' % (path,
+            json.dumps(value)) for value in schema['enum'])))
+    for key, property_schema in sorted(schema.get('properties', {}).items()):
+        child = '%s.%s' % (path, json.dumps(key))
+        present = 'exists(%s.keyvalue() ? (@.key == %s))' % (path,
+            json.dumps(key))
+        if not property_schema.get('optional', False):
+            violations.append(when('object', '!%s' % present))
+        child_violations = _path_violations(property_schema, child, [])
+        if child_violations:
+            violations.append(when('object', '%s && (%s)' % (present,
+                ' || '.join(child_violations))))
+    items = schema.get('items')
+    if isinstance(items, list):
+        if items:
+            violations.append(when('array', '%s.size() < %d' % (path,
+                len(items))))
+        for index, item_schema in enumerate(items):
+            child = '%s[%d]' % (path, index)
+            child_violations = _path_violations(item_schema, child, [])
+            if child_violations:
+                violations.append(when('array', '%s.size() > %d && (%s)' % (
+                    path, index, ' || '.join(child_violations))))
+    elif isinstance(items, dict):
+        # the nested filter binds @ to each item
+        item_violations = _path_violations(items, '@', [])
+        if item_violations:
+            violations.append(when('array', 'exists(%s[*] ? (%s))' % (path,
+                ' || '.join(item_violations))))
+    return violations
+
+
+def check_constraint_sql(document_class, column, column_type = 'jsonb'):
+    """ Returns the SQL expression of a CHECK constraint enforcing the schema of
+    the JSONDocument class on the values of the given column, which holds json,
+    jsonb or text (the JSON encoding, as stored by JSONDocumentModelField).
+
+    The expression checks the types of values (with json_typeof, and integers
+    by their representation), required members and the length of lists with
+    positional schemas, the minimum and maximum of numbers, the length of
+    strings and their pattern (with ~; patterns must therefore use the syntax
+    common to Python and PostgreSQL regular expressions), and enumerations.
+    The items of lists with a single schema for all items (such as compact
+    lists) are checked with jsonb_path_exists, available from PostgreSQL 12;
+    their schema cannot have enumerations of objects or lists, which raise
+    ValueError. Other members of the schema (such as formats) are not
+    enforced. Unlike the Python validator, booleans are not accepted as
+    integers, and in such items numbers without a fraction (such as 1.0) are.
+    """
+    if column_type not in COLUMN_TYPES:
+        raise ValueError("column_type must be one of %s" % (COLUMN_TYPES, ))
+    column = quote_name(column)
+    if column_type == 'text':
+        column = '(%s::jsonb)' % column
+    node = _Node(column, 'json' if column_type == 'json' else 'jsonb')
+    return ' AND\n'.join('(%s)' % condition for condition in
+        _conditions(document_class.document_schema, node, []))
+
+
+def add_check_constraint(table, column, name, document_class,
+    column_type = 'jsonb'):
+    """ Returns a migration operation adding (and, when reversed, dropping) the
+    CHECK constraint of check_constraint_sql to the given table, for versions of
+    Django without model constraints. The constraint is generated from the
+    document class when the migration is created.
+    """
+    check = check_constraint_sql(document_class, column, column_type)
+    return migrations.RunSQL(
+        'ALTER TABLE %s ADD CONSTRAINT %s CHECK (%s)' % (
+            quote_name(table), quote_name(name), check),
+        'ALTER TABLE %s DROP CONSTRAINT %s' % (quote_name(table),
+            quote_name(name)))
+
+
+if BaseConstraint is not None:
+
+    class JSONDocumentCheckConstraint(BaseConstraint):
+        """ Model constraint (for Meta.constraints) enforcing the schema of a
+        JSONDocument class on a field, through the CHECK constraint of
+        check_constraint_sql::
+
+            class Meta(object):
+                constraints = [ JSONDocumentCheckConstraint(
+                    field = 'profile', name = 'profile_schema',
+                    document_class = ProfileDocument,
+                    column_type = 'text'), ]
+
+        The generated SQL is recorded in migrations, so changing the schema of
+        the document class makes makemigrations replace the constraint.
+        """
+
+        def __init__(self, field, name, document_class = None, check = None,
+            column_type = 'jsonb', column = None, **kwargs):
+            if check is None:
+                if document_class is None or not issubclass(document_class,
+                    JSONDocument):
+                    raise TypeError(
+                        "document_class must be a JSONDocument subclass")
+                check = check_constraint_sql(document_class, column or field,
+                    column_type)
+            super(JSONDocumentCheckConstraint, self).__init__(name = name,
+                **kwargs)
+            self.field = field
+            self.check = check
+
+        def constraint_sql(self, model, schema_editor):
+            return 'CONSTRAINT %s CHECK (%s)' % (
+                quote_name(self.name), self.check)
+
+        def create_sql(self, model, schema_editor):
+            return 'ALTER TABLE %s ADD %s' % (
+                quote_name(model._meta.db_table),
+                self.constraint_sql(model, schema_editor))
+
+        def remove_sql(self, model, schema_editor):
+            return 'ALTER TABLE %s DROP CONSTRAINT %s' % (
+                quote_name(model._meta.db_table), quote_name(self.name))
+
+        def validate(self, model, instance, exclude = None, using = None):
+            if exclude and self.field in exclude:
+                return
+            value = getattr(instance, self.field)
+            if isinstance(value, JSONDocument) and not value.is_valid:
+                message = self.get_violation_error_message() if hasattr(self,
+                    'get_violation_error_message') else \
+                    'Constraint "%s" is violated.' % self.name
+                raise exceptions.ValidationError(message)
+
+        def deconstruct(self):
+            path, args, kwargs = super(JSONDocumentCheckConstraint,
+                self).deconstruct()
+            kwargs['field'] = self.field
+            kwargs['check'] = self.check
+            return path, args, kwargs
+
+        def __eq__(self, other):
+            if isinstance(other, JSONDocumentCheckConstraint):
+                return self.name == other.name and \
+                    self.field == other.field and self.check == other.check
+            return super(JSONDocumentCheckConstraint, self).__eq__(other)
+
+        def __hash__(self):
+            return hash((self.name, self.field, self.check))
+
+
+class LoadReport(collections.namedtuple('LoadReport',
+    ['loaded', 'rejected', 'seconds'])):
+    """ The progress of a bulk load: the number of records copied into the
+    table and rejected so far, and the seconds elapsed.
+    """
+
+    __slots__ = ()
+
+    @property
+    def rate(self):
+        """ The number of records (loaded or rejected) processed per second.
+        """
+        return (self.loaded + self.rejected) / self.seconds if self.seconds \
+            else 0.0
+
+
+def _load_chunk(schema, validator, codec, start, records):
+    """ Decodes (when given as JSON text), validates and encodes a chunk of
+    records, returning the rows of the valid records in the text format of COPY
+    and, for every rejected record, its input index and its errors as tuples
+    (as batch._validate_chunk does).
+    """
+    rows = []
+    rejects = []
+    for index, record in enumerate(records, start):
+        try:
+            value = codec.decode(record) if isinstance(record, (type(u''),
+                type(b''))) else record
+        except ValueError as error:
+            rejects.append((index, [ (u'%s' % error, u'%s' % error, 'object',
+                'schema'), ]))
+            continue
+        try:
+            validator.validate(schema, value)
+        except ValidationError as error:
+            rejects.append((index, [ (error.message, error.new_message,
+                error.object_expr, error.schema_expr), ]))
+            continue
+        # encoders escape control characters within strings, so backslashes
+        # are the only characters special to COPY left in the encoding
+        rows.append(codec.encode(value).replace(u'\\', u'\\\\'))
+        rows.append(u'\n')
+    return u''.join(rows), rejects
+
+
+# The schema, validator and codec of a loading worker process, set once by
+# _initialize_loader when the process starts.
+_loader = {}
+
+
+def _initialize_loader(schema, validator, codec):
+    _loader['schema'] = Schema(schema)
+    _loader['validator'] = validator
+    _loader['codec'] = codec
+
+
+def _load_chunk_in_worker(start, records):
+    return _load_chunk(_loader['schema'], _loader['validator'],
+        _loader['codec'], start, records)
+
+
+def _copy(connection, sql, rows):
+    with connection.cursor() as cursor:
+        if hasattr(cursor, 'copy_expert'):
+            # psycopg2
+            cursor.copy_expert(sql, io.StringIO(rows))
+        else:
+            # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(rows)
+
+
+def _reject(rejects, codec, index, record, errors):
+    if not isinstance(record, type(u'')):
+        record = record.decode('utf-8', 'replace') if isinstance(record,
+            type(b'')) else _encode_reject(codec, record)
+    rejects.write(u'%s\n' % json.dumps({ 'index' : index, 'record' : record,
+        'errors' : [ { 'message' : error[1], 'object_expr' : error[2],
+        'schema_expr' : error[3], } for error in errors ], },
+        sort_keys = True))
+
+
+def _encode_reject(codec, record):
+    try:
+        return codec.encode(record)
+    except (TypeError, ValueError):
+        return repr(record)
+
+
+def bulk_load(connection, table, column, document_class, records,
+    rejects = None, workers = None, executor = 'process', chunk_size = 1000,
+    batch_size = 10000, validator = None, codec = None, progress = None):
+    """ Loads the records (values, or their JSON encoding as text or bytes)
+    into the given json, jsonb or text column of a table with COPY, validating
+    them against the schema of the JSONDocument class, and returns a
+    LoadReport. The connection is a Django database connection (for instance
+    django.db.connections['default']) or a psycopg2 or psycopg connection; it
+    is not committed, so with Django's autocommit every COPY is committed as
+    it completes, and in a transaction the load is all or nothing.
+
+    Records are decoded, validated and encoded in chunks of chunk_size by a
+    pool of worker processes (or threads, or in the calling thread, as
+    batch.validate_many does; the compiled validator of the document class is
+    used by default), and the rows of valid records are copied in batches of at
+    least batch_size rows. At most two chunks per worker and one batch are held
+    in memory, and records are only read from the iterable as fast as they are
+    copied. Records are decoded and encoded with the given codec (a name or
+    Codec; the default, fastest available, codec of json_schema_toolkit.codec
+    if None).
+
+    Rejected records are written to the rejects text file, if given, as lines
+    of JSON objects with the index of the record in the input, the record (its
+    encoding, or its representation if it cannot be encoded), and its errors.
+    The progress function, if given, is called with the LoadReport after every
+    batch.
+    """
+    if chunk_size < 1 or batch_size < 1:
+        raise ValueError("chunk_size and batch_size must be positive")
+    schema = document_class.document_schema
+    validator = validator if validator is not None else \
+        CompiledValidator.for_document(document_class)
+    codec = get_codec(codec)
+    if executor == 'process':
+        function = _load_chunk_in_worker
+    else:
+        function = functools.partial(_load_chunk, Schema(schema), validator,
+            codec)
+    sql = 'COPY %s (%s) FROM STDIN' % (quote_name(table), quote_name(column))
+    started = time.time()
+    loaded = rejected = 0
+    pending = []
+    pending_count = 0
+    for start, chunk, (rows, chunk_rejects) in batch._map_chunks(
+        batch._chunks(records, chunk_size), function, workers = workers,
+        executor = executor, initializer = _initialize_loader,
+        initargs = (schema, validator, codec)):
+        for index, errors in chunk_rejects:
+            if rejects is not None:
+                _reject(rejects, codec, index, chunk[index - start],
+                    errors)
+        rejected += len(chunk_rejects)
+        pending.append(rows)
+        pending_count += len(chunk) - len(chunk_rejects)
+        if pending_count >= batch_size:
+            _copy(connection, sql, u''.join(pending))
+            loaded += pending_count
+            pending = []
+            pending_count = 0
+            if progress is not None:
+                progress(LoadReport(loaded, rejected, time.time() - started))
+    if pending_count:
+        _copy(connection, sql, u''.join(pending))
+        loaded += pending_count
+    report = LoadReport(loaded, rejected, time.time() - started)
+    if progress is not None and pending_count:
+        progress(report)
+    return report
+
+
+
+def partial_update_sql(column, operations, column_type = 'jsonb',
+    codec = None):
+    """ Returns the SQL expression, and its parameters, of the value of the
+    given json, jsonb or text column after the JSON Patch operations, whose
+    paths are tuples of object keys and list indices (as returned by
+    JSONDocument.patch with pointers False), for the SET clause of an UPDATE.
+    Replacements and additions of object members are made with jsonb_set,
+    additions of list items with jsonb_insert, and removals with #-; values
+    are encoded with the given codec (a name or Codec; the default codec of
+    json_schema_toolkit.codec if None). Raises ValueError for operations on the
+    whole value, and for operations other than 'add', 'remove' and 'replace'.
+    """
+    if column_type not in COLUMN_TYPES:
+        raise ValueError("column_type must be one of %s" % (COLUMN_TYPES, ))
+    sql = quote_name(column)
+    if not operations:
+        return sql, []
+    codec = get_codec(codec)
+    if column_type != 'jsonb':
+        sql = '%s::jsonb' % sql
+    params = []
+    for operation in operations:
+        op, path = operation['op'], operation['path']
+        if not path:
+            raise ValueError("the whole value cannot be updated partially")
+        params.append([ u'%s' % item for item in path ])
+        if op == 'remove':
+            sql = '(%s #- %%s::text[])' % sql
+            continue
+        if op == 'add' and isinstance(path[-1], int):
+            # inserted before the item at the index, or appended
+            sql = 'jsonb_insert(%s, %%s::text[], %%s::jsonb)' % sql
+        elif op in ('add', 'replace', ):
+            sql = 'jsonb_set(%s, %%s::text[], %%s::jsonb)' % sql
+        else:
+            raise ValueError("%r operations cannot be updated partially" % (
+                op, ))
+        params.append(codec.encode(operation['value']))
+    if column_type != 'jsonb':
+        sql = '(%s)::%s' % (sql, column_type)
+    return sql, params
+
+
+class PartialJSONDocumentModelDescriptor(JSONDocumentDescriptor):
+    """ Attribute of a model holding the value of a
+    PartialJSONDocumentModelField, which also records the document loaded
+    from the database for the instance, its revision and the size of its
+    encoding. Assigning to the attribute of an instance which was loaded or
+    saved discards the record.
+    """
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        raw = instance.__dict__.get(self.field.attname)
+        value = super(PartialJSONDocumentModelDescriptor, self).__get__(
+            instance, owner)
+        if isinstance(raw, _TEXT_TYPES) and not instance._state.adding and \
+            self.field.stored_attname not in instance.__dict__:
+            # the encoding loaded from the database, wrapped just now
+            instance.__dict__[self.field.stored_attname] = (value,
+                value.revision, len(raw))
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+        if not instance._state.adding:
+            instance.__dict__[self.field.stored_attname] = None
+
+
+class PartialJSONDocumentModelField(JSONDocumentModelField):
+    """ JSONDocumentModelField stored in a json, jsonb or text column of
+    PostgreSQL, which saves documents loaded from the database (or saved
+    before) with an UPDATE of the members changed since then only, made with
+    the SQL of partial_update_sql from the change log of the document (see
+    JSONDocument.patch). The whole document is written when the instance is
+    added, when its document was assigned rather than loaded, when the changes
+    are not all recorded, when there are more than MAX_OPERATIONS of them or
+    one of them replaces the whole value, and when the SQL and values of the
+    partial update are not smaller than the encoding last loaded or saved.
+    Documents are validated as by JSONDocumentModelField; an unchanged
+    document is saved by assigning the column to itself.
+
+    The members of documents are available to lookups through the fields of
+    the document class (see JSONDocumentKeyTransform).
+    """
+
+    description = "JSON document, updated partially"
+
+    def __init__(self, document_class = None, column_type = 'jsonb', *args,
+        **kwargs):
+        if column_type not in COLUMN_TYPES:
+            raise ValueError("column_type must be one of %s" % (
+                COLUMN_TYPES, ))
+        self.column_type = column_type
+        super(PartialJSONDocumentModelField, self).__init__(document_class,
+            *args, **kwargs)
+
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super(PartialJSONDocumentModelField, self).contribute_to_class(cls,
+            name, *args, **kwargs)
+        # the (document, revision, encoding size) stored by the database, and
+        # the one saved by the save in progress
+        self.stored_attname = '_%s_stored' % self.attname
+        self.saving_attname = '_%s_saving' % self.attname
+        setattr(cls, self.name, PartialJSONDocumentModelDescriptor(self))
+        models.signals.post_save.connect(self._saved, sender = cls,
+            weak = False)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(PartialJSONDocumentModelField,
+            self).deconstruct()
+        if self.column_type != 'jsonb':
+            kwargs['column_type'] = self.column_type
+        return name, path, args, kwargs
+
+    def db_type(self, connection):
+        return self.column_type
+
+    def pre_save(self, model_instance, add):
+        loaded = not add and not model_instance._state.adding and \
+            self.stored_attname not in model_instance.__dict__
+        value = super(PartialJSONDocumentModelField, self).pre_save(
+            model_instance, add)
+        model_instance.__dict__.pop(self.saving_attname, None)
+        if value is None:
+            return value
+        if isinstance(value, _TEXT_TYPES):
+            # loaded and never read, so unchanged
+            return RawSQL(quote_name(self.column), [], output_field = self) \
+                if loaded else value
+        stored = None if add else model_instance.__dict__.get(
+            self.stored_attname)
+        if stored is not None and stored[0] is value:
+            update = self._partial_update(value, stored[1], stored[2])
+            if update is not None:
+                model_instance.__dict__[self.saving_attname] = (value,
+                    value.revision, stored[2])
+                return update
+        encoded = value.to_json()
+        model_instance.__dict__[self.saving_attname] = (value,
+            value.revision, len(encoded))
+        return encoded
+
+    def _partial_update(self, document, revision, size):
+        """ Returns the RawSQL expression updating the column with the changes
+        made to the document since the revision, or None when writing the
+        whole document (of the given encoding size) is cheaper.
+        """
+        try:
+            operations = document.patch(revision, pointers = False)
+        except ValueError:
+            return None
+        if len(operations) > MAX_OPERATIONS or not all(operation['path']
+            for operation in operations):
+            return None
+        sql, params = partial_update_sql(self.column, operations,
+            self.column_type)
+        if len(sql) + sum(len(param) if isinstance(param, _TEXT_TYPES) else
+            sum(len(item) for item in param) for param in params) >= size:
+            return None
+        return RawSQL(sql, params, output_field = self)
+
+    def get_transform(self, name):
+        transform = super(PartialJSONDocumentModelField, self).get_transform(
+            name)
+        if transform is not None:
+            return transform
+        return self._key_transform((name, ))
+
+    def _key_transform(self, path):
+        cast = _path_cast(self.document_class, path)
+        if cast is None:
+            return None
+        return _KeyTransformFactory(path, cast, self.column_type)
+
+    def _saved(self, sender, instance, update_fields = None, **kwargs):
+        saving = instance.__dict__.pop(self.saving_attname, None)
+        if saving is not None and (update_fields is None or
+            self.name in update_fields or self.attname in update_fields):
+            instance.__dict__[self.stored_attname] = saving
+
+
+def _cast_function_sql(cast):
+    return ("CREATE OR REPLACE FUNCTION %s(text) RETURNS %s AS "
+        "'SELECT $1::%s' LANGUAGE sql IMMUTABLE STRICT "
+        "SET timezone = 'UTC' SET datestyle = 'ISO, MDY'" % (
+        _CAST_FUNCTIONS[cast], cast, cast))
+
+
+def _field_cast(field):
+    if isinstance(field, JSONDateTimeField):
+        return 'timestamptz'
+    if isinstance(field, JSONDateField):
+        return 'date'
+    return _CASTS.get(field.TYPE, 'jsonb')
+
+
+def _path_sql(column, path, cast, column_type = 'jsonb'):
+    """ Returns the SQL expression of the values at the path of the documents
+    of a column (given as SQL), with the given cast ('jsonb' for the values
+    themselves, 'text' for their text).
+    """
+    if column_type != 'jsonb':
+        column = '(%s::jsonb)' % column
+    node = _Node(column, 'jsonb', tuple(path))
+    if cast == 'jsonb':
+        return node.json
+    if cast == 'text':
+        return node.text
+    if cast in _CAST_FUNCTIONS:
+        return '%s(%s)' % (_CAST_FUNCTIONS[cast], node.text)
+    return '(%s)::%s' % (node.text, cast)
+
+
+def _content_items(field):
+    content = field.content
+    if isinstance(content, dict):
+        return sorted(content.items())
+    if isinstance(content, (list, tuple)) and not getattr(field, 'compact',
+        None):
+        return list(enumerate(content))
+    return []
+
+
+def _indexed_fields(items, path = ()):
+    """ Generates the path, method and cast of the index of every indexed
+    field among the items (pairs of names and fields) and their content.
+    """
+    for key, field in items:
+        if not isinstance(field, JSONDocumentField):
+            continue
+        if field.index:
+            cast = _field_cast(field)
+            method = field.index if field.index in \
+                JSONDocumentField.INDEXES else \
+                'gin' if cast == 'jsonb' else 'btree'
+            yield path + (key, ), method, 'jsonb' if method == 'gin' else cast
+        for indexed in _indexed_fields(_content_items(field), path + (key, )):
+            yield indexed
+
+
+def _path_cast(document_class, path):
+    """ Returns the cast of the values at the path of documents of the class
+    for lookups, or None when the path is not in the schema. The members of
+    objects and lists declared without content are compared as jsonb.
+    """
+    items = sorted(document_class._fields.items())
+    field = None
+    for item in path:
+        if field is not None and field.content is None:
+            return 'jsonb' if field.TYPE in ('any', 'object', 'array', ) \
+                else None
+        if getattr(field, 'compact', None):
+            field = field.content[0] if item.isdigit() else None
+        else:
+            field = dict((u'%s' % key, value) for key, value in items).get(
+                item)
+        if field is None:
+            return None
+        items = _content_items(field)
+    return _field_cast(field)
+
+
+def _index_name(table, column, path, method):
+    """ Returns a name for the index of the values at the path of a column,
+    of at most 30 characters, as Django names indexes.
+    """
+    digest = hashlib.md5(u'\x00'.join([ table, column, method, ] + [
+        u'%s' % item for item in path ]).encode('utf-8')).hexdigest()[:6]
+    name = '%s_%s_%s_%s' % (table[:11], column[:7], digest,
+        'gin' if method == 'gin' else 'idx')
+    if name[0] == '_' or name[0].isdigit():
+        name = 'D%s' % name[1:]
+    return name
+
+
+def _create_index_sql(name, table, column, path, method, cast, column_type):
+    return 'CREATE INDEX %s ON %s USING %s ((%s)%s)' % (quote_name(name),
+        quote_name(table), method, _path_sql(quote_name(column), path, cast,
+        column_type), ' jsonb_path_ops' if method == 'gin' else '')
+
+
+def index_sql(document_class, table, column, column_type = 'jsonb'):
+    """ Returns the SQL statements creating the indexes of the fields of the
+    JSONDocument class declared with 'index' (including those nested in the
+    content of object and list fields) on the documents of the given json,
+    jsonb or text column, preceded by the functions they use.
+
+    Fields indexed with 'btree' (the default for fields other than objects,
+    lists and untyped fields) are indexed by their values with the cast of
+    their type: bigint for integers, numeric for numbers, boolean, text for
+    strings, timestamptz for JSONDateTimeField and date for JSONDateField
+    (cast by immutable functions converting in UTC, with ISO and MDY dates);
+    fields indexed with 'gin' (the default for the others) are indexed as
+    jsonb with the jsonb_path_ops operator class, for containment (@>). The
+    index expressions are those of the lookups of
+    PartialJSONDocumentModelField, so filters on these fields use the indexes.
+    """
+    if column_type not in COLUMN_TYPES:
+        raise ValueError("column_type must be one of %s" % (COLUMN_TYPES, ))
+    indexed = list(_indexed_fields(sorted(document_class._fields.items())))
+    statements = [ _cast_function_sql(cast) for cast in sorted(set(cast
+        for path, method, cast in indexed if cast in _CAST_FUNCTIONS)) ]
+    for path, method, cast in indexed:
+        statements.append(_create_index_sql(_index_name(table, column, path,
+            method), table, column, path, method, cast, column_type))
+    return statements
+
+
+def add_indexes(table, column, document_class, column_type = 'jsonb'):
+    """ Returns a migration operation creating (and, when reversed, dropping)
+    the indexes of index_sql, for versions of Django without model indexes.
+    The indexes are generated from the document class when the migration is
+    created.
+    """
+    return migrations.RunSQL(index_sql(document_class, table, column,
+        column_type), [ 'DROP INDEX %s' % quote_name(_index_name(table,
+        column, path, method)) for path, method, cast in _indexed_fields(
+        sorted(document_class._fields.items())) ])
+
+
+class JSONDocumentIndex(Index):
+    """ Model index (for Meta.indexes) on the values at a path of the
+    documents of a field, with the given cast and method ('btree' or 'gin'),
+    as created by index_sql; document_indexes returns those of the indexed
+    fields of a document class. The generated SQL is recorded in migrations,
+    so changing the indexed fields makes makemigrations replace the indexes.
+    Without a name, the index is named after the table of its model, which
+    requires Django >= 2.0 (earlier versions do not give indexes their model).
+    """
+
+    def __init__(self, field, path, cast = 'text', method = 'btree',
+        column_type = 'jsonb', column = None, name = None, **kwargs):
+        if method not in JSONDocumentField.INDEXES:
+            raise ValueError("method must be one of %r" % (
+                JSONDocumentField.INDEXES, ))
+        if not name and django.VERSION < (2, 0):
+            raise ValueError("JSONDocumentIndex must be named with Django "
+                "< 2.0")
+        super(JSONDocumentIndex, self).__init__(fields = [ field, ],
+            name = name, **kwargs)
+        self.field = field
+        self.path = tuple(path)
+        self.cast = cast
+        self.method = method
+        self.column_type = column_type
+        self.column = column
+
+    def _column(self, model):
+        return self.column or model._meta.get_field(self.field).column
+
+    def set_name_with_model(self, model):
+        # explicit names are kept (Django 1.11 names the indexes of migration
+        # states again)
+        if not self.name:
+            self.name = _index_name(model._meta.db_table,
+                self._column(model), self.path, self.method)
+
+    def create_sql(self, model, schema_editor, using = '', **kwargs):
+        statements = [ _cast_function_sql(self.cast), ] if self.cast in \
+            _CAST_FUNCTIONS else []
+        statements.append(_create_index_sql(self.name, model._meta.db_table,
+            self._column(model), self.path, self.method, self.cast,
+            self.column_type))
+        return ';\n'.join(statements)
+
+    def deconstruct(self):
+        path, args, kwargs = super(JSONDocumentIndex, self).deconstruct()
+        kwargs.pop('fields', None)
+        kwargs.update(field = self.field, path = self.path, cast = self.cast,
+            method = self.method, column_type = self.column_type)
+        if self.column is not None:
+            kwargs['column'] = self.column
+        return path, args, kwargs
+
+
+def document_indexes(document_class, field, column_type = 'jsonb',
+    column = None, table = None):
+    """ Returns the JSONDocumentIndex of every field of the JSONDocument class
+    declared with 'index', on the documents of the given model field::
+
+        class Meta(object):
+            indexes = document_indexes(ProfileDocument, 'profile')
+
+    The indexes are named after the table, the column (by default, the name of
+    the field) and the path, as Django names indexes. Given the table of the
+    model, the names are set here; otherwise Django sets them when the model is
+    created, which requires Django >= 2.0.
+    """
+    if column_type not in COLUMN_TYPES:
+        raise ValueError("column_type must be one of %s" % (COLUMN_TYPES, ))
+    if table is None and django.VERSION < (2, 0):
+        raise ValueError("document_indexes needs the table of the model with "
+            "Django < 2.0")
+    return [ JSONDocumentIndex(field, path, cast, method, column_type, column,
+        name = None if table is None else _index_name(table, column or field,
+        path, method)) for path, method, cast in _indexed_fields(sorted(
+        document_class._fields.items())) ]
+
+
+# the model fields of the values of lookups, by cast
+_OUTPUT_FIELDS = {
+    'text' : models.TextField,
+    'bigint' : models.BigIntegerField,
+    'numeric' : models.DecimalField,
+    'boolean' : models.BooleanField,
+    'timestamptz' : models.DateTimeField,
+    'date' : models.DateField,
+    'jsonb' : JSONField or models.TextField,
+}
+
+
+class JSONDocumentKeyTransform(Transform):
+    """ The values at a path of the documents of a
+    PartialJSONDocumentModelField, with the given cast, in lookups such as::
+
+        Profile.objects.filter(profile__age__gte = 18,
+            profile__address__city = u'London')
+
+    The expression is that of the indexes of index_sql and JSONDocumentIndex,
+    and the values are compared as the model field of their cast (a
+    BigIntegerField, DecimalField, BooleanField, TextField, DateTimeField or
+    DateField, or a JSONField for objects and lists, for contains).
+    """
+
+    def __init__(self, path, cast, column_type, expression, **extra):
+        super(JSONDocumentKeyTransform, self).__init__(expression,
+            output_field = _OUTPUT_FIELDS[cast](), **extra)
+        self.path = tuple(path)
+        self.cast = cast
+        self.column_type = column_type
+
+    def as_sql(self, compiler, connection, **extra):
+        sql, params = compiler.compile(self.lhs)
+        return _path_sql(sql, [ (u'%s' % item).replace('%', '%%') for item in
+            self.path ], self.cast, self.column_type), params
+
+    def get_transform(self, name):
+        field = getattr(self.lhs, 'output_field', None)
+        if isinstance(field, PartialJSONDocumentModelField):
+            return field._key_transform(self.path + (name, ))
+        return super(JSONDocumentKeyTransform, self).get_transform(name)
+
+
+class _KeyTransformFactory(object):
+    """ Creates the JSONDocumentKeyTransform of a path on a column, or on the
+    column of the transform of the path leading to it.
+    """
+
+    def __init__(self, path, cast, column_type):
+        super(_KeyTransformFactory, self).__init__()
+        self.path = path
+        self.cast = cast
+        self.column_type = column_type
+
+    def __call__(self, lhs, *args, **kwargs):
+        if isinstance(lhs, JSONDocumentKeyTransform):
+            lhs = lhs.lhs
+        return JSONDocumentKeyTransform(self.path, self.cast,
+            self.column_type, lhs, **kwargs)
@@ -42,14 +42,505 @@ __author__ = (u"Alexis Petrounias <www.petrounias.org>", )
 # Python
 import copy
 import datetime
+import re
+import threading
+import weakref
 
 # JSON Document
-from json_document.document import Document, DocumentFragment
+from json_document.document import DefaultValue, Document, DocumentFragment
 
 # JSON Schema Validator
+from json_schema_validator.errors import ValidationError
 from json_schema_validator.extensions import datetime_extension, \
     timedelta_extension
 
+# JSON Schema Toolkit
+from json_schema_toolkit import batch, instrumentation, stream
+from json_schema_toolkit.codec import get_codec
+from json_schema_toolkit.compact import NumericArray, to_array, \
+    backends as _compact_backends
+from json_schema_toolkit.patch import operations, parse_pointer, pointer, \
+    snapshot
+from json_schema_toolkit.validator import CompiledValidator
+
+
+_PATTERNS = {}
+
+
+def compile_pattern(pattern):
+    """ Returns the compiled regular expression for the given pattern, or None
+    for an empty pattern. Compiled patterns are cached and shared by all fields,
+    and are placed in the generated schemas so the validator does not compile
+    them again on every check.
+    """
+    if not pattern:
+        return None
+    try:
+        return _PATTERNS[pattern]
+    except KeyError:
+        return _PATTERNS.setdefault(pattern, re.compile(pattern))
+
+
+# The parsers of the values of the date and time fields check the fixed layout
+# of the formats the fields write, and slice the digits out, instead of going
+# through strptime or a regular expression; datetimes of that layout are read
+# by datetime.fromisoformat where available (Python >= 3.7).
+_FROM_ISO_FORMAT = getattr(datetime.datetime, 'fromisoformat', None)
+
+def parse_datetime(value):
+    """ Returns the datetime represented by a string in the format of
+    datetime_extension (YYYY-MM-DDThh:mm:ssZ), or None for None; raises
+    ValueError for other strings, as datetime_extension.from_json does.
+    """
+    if value is None:
+        return None
+    if len(value) == 20 and value[4] == '-' and value[7] == '-' and \
+        value[10] == 'T' and value[13] == ':' and value[16] == ':' and \
+        value[19] == 'Z':
+        if _FROM_ISO_FORMAT is not None:
+            try:
+                return _FROM_ISO_FORMAT(value[:19])
+            except ValueError:
+                pass
+        else:
+            digits = value[0:4] + value[5:7] + value[8:10] + value[11:13] + \
+                value[14:16] + value[17:19]
+            if digits.isdigit():
+                return datetime.datetime(int(digits[0:4]), int(digits[4:6]),
+                    int(digits[6:8]), int(digits[8:10]), int(digits[10:12]),
+                    int(digits[12:14]))
+    # other layouts strptime accepts (such as single digit hours), and the
+    # errors it raises
+    return datetime_extension.from_json(value)
+
+
+def _year(digits):
+    # two digit years as strptime reads them
+    year = int(digits)
+    if len(digits) == 2:
+        year += 1900 if year >= 69 else 2000
+    return year
+
+
+def parse_date(value):
+    """ Returns the date represented by a string in one of the formats of
+    JSONDateField (YYYY-MM-DD, MM/DD/YYYY or MM/DD/YY), or None for None;
+    raises ValueError for other strings.
+    """
+    if value is None:
+        return None
+    length = len(value)
+    if length == 10 and value[4] == '-' and value[7] == '-':
+        digits = value[0:4] + value[5:7] + value[8:10]
+        if digits.isdigit():
+            return datetime.date(int(digits[0:4]), int(digits[4:6]),
+                int(digits[6:8]))
+    elif (length == 10 or length == 8) and value[2] == '/' and \
+        value[5] == '/':
+        digits = value[0:2] + value[3:5] + value[6:]
+        if digits.isdigit():
+            return datetime.date(_year(digits[4:]), int(digits[0:2]),
+                int(digits[2:4]))
+    raise ValueError("%r is not a date in a format of JSONDateField" % (
+        value, ))
+
+
+def parse_time(value):
+    """ Returns the time represented by a string in one of the formats of
+    JSONTimeField (HH:MM:SS or HH:MM, with an optional leading zero), or None
+    for None; raises ValueError for other strings.
+    """
+    if value is None:
+        return None
+    parts = value.split(':')
+    if 2 <= len(parts) <= 3 and 1 <= len(parts[0]) <= 2 and \
+        all(len(part) == 2 for part in parts[1:]) and \
+        ''.join(parts).isdigit():
+        return datetime.time(*[ int(part) for part in parts ])
+    raise ValueError("%r is not a time in a format of JSONTimeField" % (
+        value, ))
+
+
+def parse_timedelta(value):
+    """ Returns the timedelta represented by a string in the format of
+    timedelta_extension ([DAYS]d [SECONDS]s [MICROSECONDS]us), or None for
+    None; raises TypeError or ValueError for other values, as
+    timedelta_extension.from_json does.
+    """
+    if value is None:
+        return None
+    try:
+        parts = value.split(' ')
+    except AttributeError:
+        parts = ()
+    if len(parts) == 3 and parts[0][-1:] == 'd' and \
+        parts[1][-1:] == 's' and parts[2][-2:] == 'us':
+        days, seconds, microseconds = parts[0][:-1], parts[1][:-1], \
+            parts[2][:-2]
+        if (days + seconds + microseconds).isdigit() and days and seconds and \
+            microseconds:
+            return datetime.timedelta(int(days), int(seconds),
+                int(microseconds))
+    return timedelta_extension.from_json(value)
+
+
+def _is_container(fragment):
+    schema = fragment._schema
+    return schema is not None and schema.get('type') in ('object', 'array')
+
+
+def _cached_proxy(proxies, fragment, item):
+    """ Returns the FragmentProxy for the item of the fragment, reusing the one
+    cached in proxies until the document revision changes.
+    """
+    document = fragment._document
+    if document is None:
+        return FragmentProxy(fragment[item])
+    cached = proxies.get(item)
+    if cached is not None and cached[0] == document._revision:
+        return cached[1]
+    start = instrumentation.sample() if instrumentation.enabled else None
+    proxy = FragmentProxy(fragment[item])
+    proxies[item] = (document._revision, proxy)
+    if start is not None:
+        instrumentation.record('proxy',
+            instrumentation.class_key(document.__class__), start)
+    return proxy
+
+
+def _expose(document):
+    """ Called whenever the value of a fragment may be handed out, after which
+    no container of the document is considered owned by it any more.
+    """
+    owned = getattr(document, '_owned', None)
+    if owned:
+        owned.clear()
+
+
+def _own(fragment):
+    """ Returns the container wrapped by the fragment, first replacing it with a
+    shallow copy unless the document already owns it, i.e. created it itself
+    and has not handed out any value since. Containers owned by the document
+    can be modified in place without affecting anyone holding a reference to a
+    previous value.
+    """
+    value = fragment._value
+    owned = getattr(fragment._document, '_owned', None)
+    if owned is None:
+        value = copy.copy(value)
+        fragment._lowlevel_set_value(value)
+    elif owned.get(id(value)) is not value:
+        value = copy.copy(value)
+        fragment._lowlevel_set_value(value)
+        owned[id(value)] = value
+    return value
+
+
+def _path(fragment):
+    """ Returns the items leading from the document to the fragment.
+    """
+    path = []
+    while fragment._parent is not None:
+        path.append(fragment._item)
+        fragment = fragment._parent
+    path.reverse()
+    return tuple(path)
+
+
+def _tracking(document):
+    """ Returns True when every write to the document since its validity was
+    last established has been recorded; see JSONDocument.is_valid.
+    """
+    tracked = getattr(document, '_tracked', None)
+    return tracked is not None and tracked == document._revision
+
+
+def _record_write(fragment, tracking, *items):
+    """ Records the path of the fragment (followed by the given items) as
+    written, if the write changed the document and writes were being tracked
+    before it.
+    """
+    document = fragment._document
+    if tracking and document._revision != document._tracked:
+        document._dirty.add(_path(fragment) + items)
+        document._tracked = document._revision
+
+
+def _record_fragment(fragment, item, start):
+    instrumentation.record('fragment', instrumentation.class_key(
+        fragment._fragment_cache[item].__class__), start)
+
+
+def _logging(fragment):
+    """ Returns what _record_change needs to know about the document of the
+    fragment before a write: its revision, and the outermost of the fragment
+    and its parents which holds the default value (and so is given a value by
+    the write), if any; None for documents keeping no change log.
+    """
+    document = fragment._document
+    if getattr(document, '_changes', None) is None:
+        return None
+    root = None
+    while fragment is not None:
+        if fragment._value is DefaultValue:
+            root = fragment
+        fragment = fragment._parent
+    return document._revision, root
+
+
+def _record_change(fragment, logging, op, items = (), value = None):
+    """ Appends the write to the fragment (or to the given items of it) to the
+    change log of the document, if the write changed the document; see
+    JSONDocument.patch. A write replacing a default value is recorded as the
+    addition of the value which replaced it.
+    """
+    if logging is None:
+        return
+    revision, root = logging
+    document = fragment._document
+    if document._revision == revision:
+        return
+    changes = document._changes
+    if revision != document._logged:
+        # the writes in between were not recorded, so the log starts over
+        del changes[:]
+        document._changes_base = revision
+    if root is not None:
+        op, path, value = 'add', _path(root), root._value
+    else:
+        path = _path(fragment) + items
+    changes.append((document._revision, op, path, snapshot(value) if
+        op != 'remove' else None))
+    document._logged = document._revision
+    if len(changes) > document.CHANGES:
+        # the older half of the log is discarded
+        document._changes_base = changes[len(changes) // 2 - 1][0]
+        del changes[:len(changes) // 2]
+
+
+def _fragment_for_item(fragment_schema):
+    """ Replaces the DocumentFragment implementation of the items which have
+    no implementation of their own (such as the members of objects declared
+    without content) with JSONDocumentFragment, so writes to them are recorded.
+    """
+    fragment_cls, item_schema = fragment_schema
+    if fragment_cls is DocumentFragment:
+        fragment_cls = JSONDocumentFragment
+    return fragment_cls, item_schema
+
+
+def _item_schema(schema, value, item):
+    """ Returns the schema of the item of a dictionary or list value, as
+    json_document does for fragments, or None when the item is not constrained.
+    """
+    if schema is None:
+        return None
+    if isinstance(value, dict):
+        properties = schema.get('properties', {})
+        if item in properties:
+            return properties[item]
+        additional = schema.get('additionalProperties', {})
+        return additional if additional is not False else None
+    items = schema.get('items', {})
+    if isinstance(items, list):
+        index = item if item >= 0 else item + len(value)
+        return items[index] if index < len(items) else None
+    return items
+
+
+def _constrains_items(schema):
+    """ Returns True if the schema of a container places constraints on its
+    items other than their own schemas and the presence of required properties,
+    in which case the whole container is validated after one of its items
+    changes.
+    """
+    if schema is None:
+        return False
+    if schema.get('additionalProperties', {}) is False or \
+        schema.get('uniqueItems', False) or schema.get('extends') is not None:
+        return True
+    return any(isinstance(prop, dict) and prop.get('requires')
+        for prop in schema.get('properties', {}).values())
+
+
+def _delete_item(fragment, key):
+    """ Deletes the item of the container wrapped by the fragment and bumps the
+    document revision, copying the container only when the document does not
+    own it (see _own). Only the sub-fragments affected by the deletion are
+    orphaned.
+    """
+    fragment._ensure_not_orphaned()
+    tracking = _tracking(fragment._document)
+    logging = _logging(fragment)
+    # raise for a missing item before modifying anything, without exposing
+    # the value
+    DocumentFragment._get_value(fragment)[key]
+    fragment._ensure_not_default()
+    container = _own(fragment)
+    cache = fragment._fragment_cache
+    if isinstance(container, dict):
+        stale = [ key, ] if key in cache else []
+    elif isinstance(key, int):
+        # items after the deleted one move to a new index
+        index = key if key >= 0 else key + len(container)
+        stale = [ item for item in cache if item >= index ]
+    else:
+        stale = list(cache)
+    del container[key]
+    for item in stale:
+        cache.pop(item)._orphan()
+    fragment._document._bump_revision()
+    if isinstance(container, dict):
+        _record_write(fragment, tracking, key)
+        _record_change(fragment, logging, 'remove', (key, ))
+    else:
+        # the following items move, so the whole list is validated again
+        _record_write(fragment, tracking)
+        if isinstance(key, int):
+            _record_change(fragment, logging, 'remove', (key if key >= 0
+                else key + len(container) + 1, ))
+        else:
+            _record_change(fragment, logging, 'replace', (), container)
+
+
+def _insert_item(fragment, index, value):
+    """ Inserts the value into the list wrapped by the fragment before the
+    given index and bumps the document revision, copying the list only when
+    the document does not own it, as _delete_item does.
+    """
+    fragment._ensure_not_orphaned()
+    tracking = _tracking(fragment._document)
+    logging = _logging(fragment)
+    fragment._ensure_not_default()
+    container = _own(fragment)
+    cache = fragment._fragment_cache
+    stale = [ item for item in cache if item >= index ]
+    container.insert(index, value)
+    for item in stale:
+        cache.pop(item)._orphan()
+    fragment._document._bump_revision()
+    _record_write(fragment, tracking)
+    _record_change(fragment, logging, 'add', (index, ), value)
+
+
+def _token(fragment, token):
+    """ Returns the item of the container wrapped by the fragment which a
+    reference token of a JSON Pointer designates: a key of an object, or an
+    index of a list ('-' designating the end of the list).
+    """
+    container = DocumentFragment._get_value(fragment)
+    if isinstance(container, dict):
+        return token
+    if not isinstance(container, (list, NumericArray)):
+        raise ValueError("%r is neither an object nor a list" % (container, ))
+    if token == u'-':
+        return len(container)
+    if not token.isdigit() or (token.startswith(u'0') and token != u'0'):
+        raise ValueError("%r is not a list index" % (token, ))
+    return int(token)
+
+
+def _locate(document, text):
+    """ Returns the fragment of the container of the value a JSON Pointer
+    designates, and the item of the value in the container.
+    """
+    tokens = parse_pointer(text)
+    fragment = document
+    try:
+        for token in tokens[:-1]:
+            fragment = fragment[_token(fragment, token)]
+    except (KeyError, IndexError):
+        raise ValueError("%r does not exist" % (text, ))
+    return fragment, _token(fragment, tokens[-1])
+
+
+def _existing(document, text):
+    fragment, item = _locate(document, text)
+    container = DocumentFragment._get_value(fragment)
+    missing = item not in container if isinstance(container, dict) else \
+        item >= len(container)
+    if missing:
+        raise ValueError("%r does not exist" % (text, ))
+    return fragment, item, container[item]
+
+
+def _read(document, text):
+    if not text:
+        return DocumentFragment._get_value(document)
+    return _existing(document, text)[2]
+
+
+def _add(document, text, value, undo):
+    if not text:
+        undo.append(('replace', text, DocumentFragment._get_value(document)))
+        document.value = value
+        return
+    fragment, item = _locate(document, text)
+    container = DocumentFragment._get_value(fragment)
+    if isinstance(container, dict):
+        undo.append(('replace', text, container[item]) if item in container
+            else ('remove', text, None))
+        fragment[item] = value
+    elif item > len(container):
+        raise ValueError("%r does not exist" % (text, ))
+    else:
+        undo.append(('remove', pointer(_path(fragment) + (item, )), None))
+        _insert_item(fragment, item, value)
+
+
+def _remove(document, text, value, undo):
+    if not text:
+        raise ValueError("the document cannot be removed")
+    fragment, item, previous = _existing(document, text)
+    undo.append(('add', pointer(_path(fragment) + (item, )), previous))
+    _delete_item(fragment, item)
+
+
+def _replace(document, text, value, undo):
+    if not text:
+        _add(document, text, value, undo)
+        return
+    fragment, item, previous = _existing(document, text)
+    undo.append(('replace', text, previous))
+    fragment[item] = value
+
+
+_WRITES = {
+    'add' : _add,
+    'remove' : _remove,
+    'replace' : _replace,
+}
+
+
+def _apply_operation(document, operation, undo):
+    """ Applies a JSON Patch operation to the document, appending the
+    operations which undo it to undo.
+    """
+    try:
+        op, text = operation['op'], operation['path']
+        value = operation['value'] if op in ('add', 'replace', 'test') \
+            else None
+        source = operation['from'] if op in ('move', 'copy') else None
+    except (KeyError, TypeError):
+        raise ValueError("%r is not a JSON Patch operation" % (operation, ))
+    if op in _WRITES:
+        _WRITES[op](document, text, value, undo)
+    elif op == 'move':
+        if parse_pointer(text)[:len(parse_pointer(source))] == \
+            parse_pointer(source) and text != source:
+            raise ValueError("%r cannot be moved into itself" % (source, ))
+        # values of compact lists are only held as arrays by compact lists
+        value = snapshot(_read(document, source))
+        _remove(document, source, None, undo)
+        _add(document, text, value, undo)
+    elif op == 'copy':
+        _add(document, text, snapshot(_read(document, source)), undo)
+    elif op == 'test':
+        if _read(document, text) != value:
+            raise ValueError("%r is not %r" % (text, value))
+    else:
+        raise ValueError("%r is not a JSON Patch operation" % (op, ))
+
 
 class FragmentProxy(object):
     """
@@ -58,6 +549,7 @@ class FragmentProxy(object):
     def __init__(self, fragment):
         super(FragmentProxy, self).__init__()
         self.__getattribute__('__dict__')['__fragment'] = fragment
+        self.__getattribute__('__dict__')['__proxies'] = {}
 
     @property
     def _fragment(self) :
@@ -73,98 +565,902 @@ class FragmentProxy(object):
         del self[item]
 
     def __getitem__(self, item):
-        fragment = self._fragment[item]
-        if fragment.schema.type in [ 'object', 'array', ]:
-            return FragmentProxy(fragment)
-        return fragment.value
+        proxies = self.__getattribute__('__dict__')['__proxies']
+        fragment = self._fragment
+        if fragment._schema is not None and '__compact' in fragment._schema:
+            # items of compact lists are read from the buffer, without
+            # creating fragments for them
+            value = fragment.value
+            if value.__class__ is NumericArray:
+                return value[item]
+        if item in proxies or _is_container(fragment[item]):
+            return _cached_proxy(proxies, fragment, item)
+        return fragment[item].value
 
     def __setitem__(self, key, value):
         self._fragment[key] = value
 
     def __delitem__(self, key):
-        _value = copy.copy(self._fragment.value)
-        del _value[key]
-        self._fragment.value = _value
+        _delete_item(self._fragment, key)
+
+
+class _FrozenDict(dict):
+    """ A dictionary which cannot be modified after construction, used for the
+    schema and field map compiled once per JSONDocument class and shared by all
+    of its instances.
+    """
+
+    # the validation function and source compiled for a schema by
+    # json_schema_toolkit.validator, shared by every class using the schema
+    _compiled = None
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("compiled schemas are immutable")
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self), ))
+
+
+class _FrozenList(list):
+    """ A list which cannot be modified after construction, the counterpart of
+    _FrozenDict for the 'items', 'type' and 'enum' members of a schema.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("compiled schemas are immutable")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = reverse = sort = _immutable
+
+    def __reduce__(self):
+        return (self.__class__, (list(self), ))
+
+
+# The immutable parts of compiled schemas by structure, so that identical parts
+# of the schemas of all JSONDocument classes (such as the same field declared
+# in many classes) are one shared object; parts are dropped when no schema uses
+# them anymore.
+_INTERNED = weakref.WeakValueDictionary()
+
+
+# Serializes the compilation of JSONDocument classes, and hence the interning
+# of their schemas, which are otherwise only ever read.
+_COMPILE_LOCK = threading.RLock()
+
+
+# Types of the values identified by their type and value in structural keys.
+_PLAIN = frozenset([ type(None), bool, int, float, type(u''), type(''),
+    type(2 ** 64), ])
+
+
+def _structure(value):
+    """ Returns the key identifying a member of a schema in the structural keys
+    of its parent: interned parts by identity (identical parts being the same
+    object), and other values by type and value (or identity, when they cannot
+    be hashed).
+    """
+    if value.__class__ in _PLAIN:
+        return (value.__class__, value)
+    if isinstance(value, (_FrozenDict, _FrozenList)):
+        return id(value)
+    try:
+        hash(value)
+    except TypeError:
+        return id(value)
+    return (value.__class__, value)
+
+
+def _freeze(value):
+    """ Recursively converts the dictionaries and lists of a generated schema
+    into their immutable counterparts, interned by structure; any other value
+    (including the field and fragment class references) is shared as is.
+    """
+    if isinstance(value, dict):
+        items = [ (key, item if item.__class__ in _PLAIN else _freeze(item))
+            for key, item in value.items() ]
+        key = (_FrozenDict, frozenset([ (key, (item.__class__, item) if
+            item.__class__ in _PLAIN else _structure(item)) for key, item in
+            items ]))
+        frozen = _INTERNED.get(key)
+        if frozen is None:
+            frozen = _INTERNED.setdefault(key, _FrozenDict(items))
+        return frozen
+    if isinstance(value, list):
+        items = [ item if item.__class__ in _PLAIN else _freeze(item)
+            for item in value ]
+        key = (_FrozenList, tuple(_structure(item) for item in items))
+        frozen = _INTERNED.get(key)
+        if frozen is None:
+            frozen = _INTERNED.setdefault(key, _FrozenList(items))
+        return frozen
+    return value
+
+
+class _FieldDescriptor(object):
+    """ Data descriptor installed by JSONDocumentMeta on a JSONDocument class for
+    each field declared on it, giving access to the value of the field (or to a
+    FragmentProxy for object and list fields) through the dot notation. On the
+    class itself, the descriptor returns the field.
+    """
 
+    __slots__ = ('name', 'field', 'container', 'plain', )
+
+    def __init__(self, name, field):
+        super(_FieldDescriptor, self).__init__()
+        self.name = name
+        self.field = field
+        self.container = isinstance(field, (JSONObjectField, JSONListField))
+        # scalar values of fields without a custom fragment implementation can
+        # be read directly from the document value
+        self.plain = field.implementation is JSONDocumentFragment and \
+            field.TYPE not in ('any', 'object', 'array', )
+
+    def __get__(self, document, owner):
+        if document is None:
+            return self.field
+        if self.container:
+            return _cached_proxy(document._proxies, document, self.name)
+        if self.plain:
+            try:
+                return document._value[self.name]
+            except KeyError:
+                # missing members are read through their fragment, which
+                # supplies the default value
+                pass
+        return document[self.name].value
+
+    def __set__(self, document, value):
+        document[self.name] = value
+
+    def __delete__(self, document):
+        del document[self.name]
+
+
+def _subschemas(schema):
+    """ Generates the subschemas of a schema: the schemas of its properties and
+    items, and of additional properties.
+    """
+    for key, value in sorted(schema.get('properties', {}).items()):
+        yield value
+    items = schema.get('items')
+    if isinstance(items, dict):
+        yield items
+    elif isinstance(items, list):
+        for value in items:
+            yield value
+    additional = schema.get('additionalProperties')
+    if isinstance(additional, dict):
+        yield additional
+
+
+def _plain(value):
+    if isinstance(value, dict):
+        return dict((key, _plain(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [ _plain(item) for item in value ]
+    return getattr(value, 'pattern', value)
+
+
+def _export(schema, references, top = False):
+    """ Converts a compiled schema into plain JSON Schema, replacing the
+    subschemas named in references by a '$ref' to their definition.
+    """
+    if not top and id(schema) in references:
+        return { '$ref' : '#/definitions/%s' % references[id(schema)], }
+    exported = {}
+    for key, value in schema.items():
+        if key in ('__fragment_cls', '__compact', ):
+            continue
+        if key == 'properties':
+            value = dict((name, _export(item, references)) for name, item in
+                value.items())
+        elif key == 'items' and isinstance(value, list):
+            value = [ _export(item, references) for item in value ]
+        elif key in ('items', 'additionalProperties') and \
+            isinstance(value, dict):
+            value = _export(value, references)
+        else:
+            value = _plain(value)
+        exported[key] = value
+    return exported
 
-class JSONDocument(Document):
+
+def _index_fields(field, schema, schema_fields):
+    """ Adds the field, and the fields of its content, to the side table mapping
+    the ids of the parts of a compiled schema to the fields which generated
+    them.
     """
+    schema_fields[id(schema)] = (schema, field)
+    content = getattr(field, 'content', None)
+    if isinstance(content, dict):
+        properties = schema.get('properties', {})
+        for key, value in content.items():
+            if key in properties and isinstance(value, JSONDocumentField):
+                _index_fields(value, properties[key], schema_fields)
+    elif isinstance(content, (list, tuple)) and \
+        isinstance(schema.get('items'), list):
+        for value, item_schema in zip(content, schema['items']):
+            if isinstance(value, JSONDocumentField):
+                _index_fields(value, item_schema, schema_fields)
+    elif isinstance(content, (list, tuple)) and len(content) == 1 and \
+        isinstance(schema.get('items'), dict):
+        # the single item schema of a compact list
+        _index_fields(content[0], schema['items'], schema_fields)
+
+
+def _compact_lists(schema, path = ()):
+    """ Generates the path, item type and backend of each compact list of a
+    schema, reached through the properties of objects.
     """
+    for key, value in sorted(schema.get('properties', {}).items()):
+        if value.get('__compact'):
+            yield (path + (key, ), value['items'].get('type'),
+                value['__compact'])
+        else:
+            for compact_path in _compact_lists(value, path + (key, )):
+                yield compact_path
+
+
+def _compact_value(value, paths, copy = True):
+    """ Replaces the lists at the given paths of a document value by
+    NumericArrays, where their items allow it. Unless copy is False, the
+    objects on the way to each list are copied rather than modified, so the
+    value given to a document is left as it is. Returns the (possibly copied)
+    value, and the copies by id.
+    """
+    copies = {}
+    for path, json_type, backend in paths:
+        containers = [ value, ]
+        for key in path:
+            container = containers[-1]
+            if not isinstance(container, dict) or key not in container:
+                break
+            containers.append(container[key])
+        else:
+            array = to_array(containers[-1], json_type, backend)
+            if array is None:
+                continue
+            if copy:
+                for index in range(len(path)):
+                    if id(containers[index]) not in copies:
+                        duplicate = dict(containers[index])
+                        copies[id(duplicate)] = duplicate
+                        if index == 0:
+                            value = duplicate
+                        else:
+                            containers[index - 1][path[index - 1]] = \
+                                duplicate
+                        containers[index] = duplicate
+            containers[-2][path[-1]] = array
+    return value, copies
+
+
+class JSONDocumentMeta(type):
+    """ Compiles the schema and field map of each JSONDocument class once, when
+    the class is created, instead of on every instantiation, and replaces each
+    field declared on the class with a _FieldDescriptor. Fields declared on
+    base classes are inherited. Adding, replacing or deleting a field (or the
+    Meta class) on a JSONDocument class recompiles that class and every class
+    derived from it.
+    """
+
+    def __init__(cls, name, bases, attrs):
+        super(JSONDocumentMeta, cls).__init__(name, bases, attrs)
+        # JSONDocument itself is created before the field classes are defined,
+        # and is compiled at the end of this module.
+        if 'JSONDocumentField' in globals():
+            cls._compile()
+
+    def __setattr__(cls, name, value):
+        super(JSONDocumentMeta, cls).__setattr__(name, value)
+        if isinstance(value, JSONDocumentField) or name in cls._fields or \
+            name == 'Meta':
+            cls._recompile()
+
+    def __delattr__(cls, name):
+        super(JSONDocumentMeta, cls).__delattr__(name)
+        if name in cls._fields or name == 'Meta':
+            cls._recompile()
+
+    def _compile(cls):
+        start = instrumentation.sample() if instrumentation.enabled else None
+        with _COMPILE_LOCK:
+            fields = {}
+            for klass in reversed(cls.__mro__):
+                for name, value in list(klass.__dict__.items()):
+                    if isinstance(value, _FieldDescriptor):
+                        value = value.field
+                    if isinstance(value, JSONDocumentField):
+                        fields[name] = value
+                        if klass is cls and not isinstance(cls.__dict__[name],
+                            _FieldDescriptor):
+                            type.__setattr__(cls, name,
+                                _FieldDescriptor(name, value))
+                    elif name in fields:
+                        # a plain attribute shadows an inherited field
+                        del fields[name]
+            type.__setattr__(cls, '_fields', _FrozenDict(fields))
+            schema = _freeze(cls._generate_schema())
+            schema_fields = {}
+            properties = schema.get('properties', {})
+            for name, field in fields.items():
+                if name in properties:
+                    _index_fields(field, properties[name], schema_fields)
+            # the schema is published last, once its field table is complete
+            type.__setattr__(cls, '_schema_fields',
+                _FrozenDict(schema_fields))
+            type.__setattr__(cls, '_compact_paths',
+                tuple(_compact_lists(schema)))
+            type.__setattr__(cls, 'document_schema', schema)
+        if start is not None:
+            instrumentation.record('compile', instrumentation.class_key(cls),
+                start)
+
+    def _recompile(cls):
+        with _COMPILE_LOCK:
+            cls._compile()
+            for subclass in cls.__subclasses__():
+                subclass._recompile()
+
+
+# Python 2 and 3 compatible application of the JSONDocumentMeta metaclass.
+_JSONDocumentBase = JSONDocumentMeta('_JSONDocumentBase', (Document, ), {})
+
+
+class JSONDocument(_JSONDocumentBase):
+    """
+    """
+
+    # the number of changes each document keeps, see patch
+    CHANGES = 1000
 
     def __init__(self, value, validator = None):
-        # set _fields before __getattribute__ is processed
-        self._fields = {}
-        super(JSONDocument, self).__init__(value,  self._generate_schema(),
+        # proxies of object and list fields, see _cached_proxy
+        self._proxies = {}
+        # containers which can be modified in place, see _own
+        self._owned = {}
+        # compact lists are converted before validation when the validator
+        # is compiled (which checks the converted arrays by their bounds),
+        # and after it otherwise
+        compacted = bool(self._compact_paths) and \
+            isinstance(validator, CompiledValidator)
+        if compacted:
+            value, copies = _compact_value(value, self._compact_paths)
+            self._owned.update(copies)
+        start = instrumentation.sample() if instrumentation.enabled and \
+            validator is not False else None
+        super(JSONDocument, self).__init__(value, self.document_schema,
             validator = validator)
+        if start is not None:
+            instrumentation.record('validate',
+                instrumentation.class_key(self.__class__), start)
+        # share the compiled schema instead of the copy made by json_document
+        self._schema = self.document_schema
+        # the revision at which the document was last known to be valid or
+        # invalid, and the paths written since then, see is_valid
+        self._validity = (self._revision, True) if validator is not False \
+            else None
+        self._dirty = set()
+        self._tracked = self._revision
+        # the changes made since the revision the log starts at, and the
+        # revision of the last change recorded, see patch
+        self._changes = []
+        self._changes_base = self._logged = self._revision
+        if self._compact_paths and not compacted:
+            self._value, copies = _compact_value(self._value,
+                self._compact_paths)
+            self._owned.update(copies)
+
+    @classmethod
+    def from_json(cls, raw, lazy = False, validator = None, codec = None):
+        """ Returns a document of this class from its JSON encoding (bytes or
+        text), decoded with the given codec (a name or Codec; the default codec
+        of json_schema_toolkit.codec if None). The encoding is kept, and
+        returned by to_json as long as the document has not been modified. A
+        lazy document defers decoding and validating the encoding until its
+        value is first accessed (through a field, a fragment, is_valid or
+        validate); an invalid encoding then raises the ValueError or
+        ValidationError the constructor would.
+        """
+        codec = get_codec(codec)
+        if not lazy:
+            document = cls(codec.decode(raw), validator = validator)
+        else:
+            document = cls.__new__(cls)
+            JSONDocument.__init__(document, None, validator = False)
+            # leaving the value unset makes accessing it call __getattr__
+            del document._value
+            document._lazy = (validator, codec)
+        document._raw = (raw, document._revision)
+        return document
+
+    def __getattr__(self, name):
+        # decodes and validates the value of a lazy document
+        if name != '_value' or '_lazy' not in self.__dict__:
+            raise AttributeError(name)
+        validator, codec = self.__dict__['_lazy']
+        value = codec.decode(self._raw[0])
+        if validator is None:
+            validator = CompiledValidator.for_document(self.__class__)
+        compacted = bool(self._compact_paths) and (validator is False or
+            isinstance(validator, CompiledValidator))
+        if compacted:
+            # the decoded value belongs to the document
+            value = _compact_value(value, self._compact_paths,
+                copy = False)[0]
+        if validator is not False:
+            start = instrumentation.sample() if instrumentation.enabled \
+                else None
+            validator.validate(self.schema, value)
+            if start is not None:
+                instrumentation.record('validate',
+                    instrumentation.class_key(self.__class__), start)
+            self._validity = (self._revision, True)
+        del self._lazy
+        if self._compact_paths and not compacted:
+            value = _compact_value(value, self._compact_paths,
+                copy = False)[0]
+        self._value = value
+        return value
+
+    def to_json(self, codec = None, buffer = None):
+        """ Returns the JSON encoding of the value of the document, encoded with
+        the given codec (a name or Codec; the default codec of
+        json_schema_toolkit.codec if None), as text, or as bytes for a
+        document created from bytes; for a document created with from_json and
+        not modified since, returns the encoding it was created from, without
+        decoding it. Datetimes and timedeltas which were not set through a
+        field are encoded as JSONDateTimeField and JSONTimeDeltaField encode
+        them.
+
+        With a buffer (a bytearray, or a binary file object), the UTF-8
+        encoding is instead written to the end of the buffer, without
+        intermediate copies where the codec produces bytes, and the number of
+        bytes written is returned.
+        """
+        raw = self.__dict__.get('_raw')
+        if raw is not None and raw[1] == self._revision:
+            encoded = raw[0]
+            if buffer is None:
+                return encoded
+            if not isinstance(encoded, (bytes, bytearray, memoryview)):
+                encoded = encoded.encode('utf-8')
+        elif buffer is None:
+            codec = get_codec(codec)
+            if raw is not None and not isinstance(raw[0], type(u'')):
+                return codec.encode_bytes(self.value)
+            return codec.encode(self.value)
+        else:
+            encoded = get_codec(codec).encode_bytes(self.value)
+        if isinstance(buffer, bytearray):
+            buffer.extend(encoded)
+        else:
+            buffer.write(encoded)
+        return len(encoded)
 
-    def _generate_schema(self):
+    @classmethod
+    def _generate_schema(cls):
+        meta = getattr(cls, 'Meta', None)
         base = {
             'type' : 'object',
-            'title' : self.Meta.title,
-            'description' : self.Meta.description,
             'properties' : {},
         }
-        for name, field in self.__class__.__dict__.items():
-            if isinstance(field, JSONDocumentField):
-                base['properties'][name] = field._generate_schema()
-                self._fields[name] = field
+        if getattr(meta, 'title', None) is not None:
+            base['title'] = meta.title
+        if getattr(meta, 'description', None) is not None:
+            base['description'] = meta.description
+        for name, field in cls._fields.items():
+            base['properties'][name] = field._generate_schema()
         return base
 
-    def __getattribute__(self, name):
-        _fields = Document.__getattribute__(self, '_fields')
-        if name in _fields:
-            if isinstance(_fields[name], JSONObjectField) or \
-                isinstance(_fields[name], JSONListField):
-                return FragmentProxy(self[name])
-            return self[name].value
-        return Document.__getattribute__(self, name)
-
-    def __setattr__(self, key, value):
-        if hasattr(self, '_fields') and key in self._fields:
-            self[key] = value
-        else:
-            return Document.__setattr__(self, key, value)
+    @classmethod
+    def export_schema(cls, definitions = True):
+        """ Returns the schema of this class as plain JSON Schema, which can be
+        encoded to JSON: without the fragment implementation classes, and with
+        patterns as strings. With definitions, the subschemas used more than
+        once (identical fields declared in several places share one
+        subschema) are written once under 'definitions', named after their
+        title, and referenced with '$ref' where they are used.
+        """
+        schema = cls.document_schema
+        if not definitions:
+            return _export(schema, {}, True)
+        # count the uses of every subschema, without counting again the
+        # subschemas nested in a subschema already seen
+        uses = {}
+        order = []
+        pending = list(_subschemas(schema))
+        pending.reverse()
+        while pending:
+            subschema = pending.pop()
+            if id(subschema) in uses:
+                uses[id(subschema)] += 1
+                continue
+            uses[id(subschema)] = 1
+            order.append(subschema)
+            nested = list(_subschemas(subschema))
+            nested.reverse()
+            pending.extend(nested)
+        references = {}
+        names = set()
+        shared = [ subschema for subschema in order if uses[id(subschema)] > 1 ]
+        for subschema in shared:
+            base = re.sub(r'[^A-Za-z0-9_.-]+', '_', u'%s' % (subschema.get(
+                'title') or 'schema'))
+            name = base
+            index = 1
+            while name in names:
+                index += 1
+                name = '%s%d' % (base, index)
+            names.add(name)
+            references[id(subschema)] = name
+        exported = _export(schema, references, True)
+        if shared:
+            exported['definitions'] = dict((references[id(subschema)],
+                _export(subschema, references, True)) for subschema in shared)
+        return exported
+
+    @classmethod
+    def field_for_schema(cls, schema):
+        """ Returns the field which generated the given part of the schema of
+        this class (for instance the schema of a fragment), or None.
+        """
+        entry = cls._schema_fields.get(id(schema))
+        if entry is not None and entry[0] is schema:
+            return entry[1]
+        return None
+
+    @classmethod
+    def validate_many(cls, iterable, workers = None, executor = 'serial',
+        chunk_size = 1000, fail_fast = False, validator = None):
+        """ Validates many values against the schema of this class without
+        constructing a document for each of them; see
+        json_schema_toolkit.batch.validate_many.
+        """
+        return batch.validate_many(cls.document_schema, iterable,
+            workers = workers, executor = executor, chunk_size = chunk_size,
+            fail_fast = fail_fast, validator = validator)
+
+    @classmethod
+    def validate_columns(cls, records):
+        """ Validates many values against the schema of this class property by
+        property, returning the indices of the values failing each property;
+        see json_schema_toolkit.batch.validate_columns.
+        """
+        return batch.validate_columns(cls.document_schema, records,
+            validator = CompiledValidator.for_document(cls))
+
+    @classmethod
+    def validate_stream(cls, source, field, validator = None,
+        chunk_size = 65536, homogeneous = True):
+        """ Validates the items of the list field of a document read
+        incrementally from a file object or an iterable of chunks, generating
+        them one at a time; see json_schema_toolkit.stream.validate_stream.
+        """
+        return stream.validate_stream(cls.document_schema, source, field,
+            validator = validator, chunk_size = chunk_size,
+            homogeneous = homogeneous)
+
+    @classmethod
+    def avalidate(cls, value, validator = None):
+        """ Returns an awaitable validating the value against the schema of
+        this class from asyncio code (Python >= 3.6), which returns True or
+        raises ValidationError; validator is a
+        json_schema_toolkit.aio.AsyncValidator for this class, by default the
+        one shared by all callers.
+        """
+        from json_schema_toolkit import aio
+        return (validator or aio.for_document(cls)).validate(value)
+
+    @classmethod
+    def avalidate_stream(cls, iterable, validator = None):
+        """ Returns an asynchronous generator of the ValidationResult of each
+        value of an asynchronous iterable, in input order; see avalidate.
+        """
+        from json_schema_toolkit import aio
+        return (validator or aio.for_document(cls)).validate_stream(iterable)
 
-    def __delattr__(self, item):
-        if hasattr(self, '_fields') and item in self._fields:
-            del self[item]
+    @property
+    def is_valid(self):
+        """ True if the document is valid against its schema. The result is
+        cached until the next write; after writes to a document known to be
+        valid, only the values written (and the constraints of their parents
+        which depend on them) are validated again.
+        """
+        revision = self._revision
+        validity = self._validity
+        if validity is not None and validity[0] == revision:
+            return validity[1]
+        validator = CompiledValidator.for_document(self.__class__)
+        if validity is not None and validity[1] and _tracking(self):
+            dirty = self._dirty
+            # paths below another written path are validated with it
+            valid = all(self._validate_path(validator, path)
+                for path in dirty if not any(path[:index] in dirty
+                    for index in range(len(path))))
         else:
-            return Document.__delattr__(self, item)
+            start = instrumentation.sample() if instrumentation.enabled \
+                else None
+            try:
+                validator(self._value)
+                valid = True
+            except ValidationError:
+                valid = False
+            if start is not None:
+                instrumentation.record('validate',
+                    instrumentation.class_key(self.__class__), start)
+        self._validity = (revision, valid)
+        self._dirty = set()
+        self._tracked = revision
+        return valid
+
+    def _validate_path(self, validator, path):
+        nodes = [ (self._value, self._schema), ]
+        for item in path:
+            value, schema = nodes[-1]
+            if not isinstance(value, (dict, list, NumericArray)):
+                # replaced by a later write, which is validated instead
+                return True
+            try:
+                nodes.append((value[item], _item_schema(schema, value, item)))
+            except (KeyError, IndexError):
+                if len(nodes) < len(path):
+                    # an ancestor was removed by a later write
+                    return True
+                break
+        depth = len(path)
+        while depth > 0 and _constrains_items(nodes[depth - 1][1]):
+            depth -= 1
+        if depth == len(nodes):
+            # the item is missing, which only its parent may forbid
+            parent, schema = nodes[-1]
+            if not isinstance(parent, dict) or schema is None:
+                return True
+            prop = schema.get('properties', {}).get(path[-1])
+            return prop is None or prop.get('optional', False)
+        value, schema = nodes[depth]
+        if schema is None:
+            return True
+        start = instrumentation.sample() if instrumentation.enabled else None
+        try:
+            if depth:
+                validator.for_subschema(schema)(value)
+            else:
+                validator(value)
+        except ValidationError:
+            return False
+        finally:
+            if start is not None:
+                instrumentation.record('validate_path', '%s:%s' % (
+                    instrumentation.class_key(self.__class__),
+                    '.'.join(str(item) for item in path[:depth])), start)
+        return True
+
+    def validate(self):
+        if not self.is_valid:
+            super(JSONDocument, self).validate()
+
+    def patch(self, since, until = None, pointers = True):
+        """ Returns the JSON Patch (RFC 6902) operations which turn the value
+        of this document at revision since into its value at revision until
+        (the current revision if None). The patch is made from the changes
+        recorded by the writes to the document through fields, proxies and
+        fragments (and by apply_patch), leaving out the values overwritten
+        by later changes. A document keeps its last CHANGES changes, and
+        only the changes following a write it could not record (for instance
+        through revert_to_default); raises ValueError when the changes since
+        the given revision are not all kept. With pointers False, the paths of
+        the operations are tuples of object keys and list indices instead of
+        JSON Pointers.
+        """
+        until = self._revision if until is None else until
+        if since == until:
+            return []
+        if not self._changes_base <= since <= until <= self._logged:
+            raise ValueError("the changes from revision %r to %r are not "
+                "recorded" % (since, until))
+        return operations([ change for change in self._changes
+            if since < change[0] <= until ], pointers = pointers)
+
+    def discard_changes(self, until = None):
+        """ Discards the changes recorded up to the given revision (the
+        current revision if None), after which patch only returns the changes
+        since then.
+        """
+        until = self._revision if until is None else until
+        if until > self._changes_base:
+            self._changes = [ change for change in self._changes
+                if change[0] > until ]
+            self._changes_base = min(until, self._logged)
+
+    def apply_patch(self, patch, validate = True):
+        """ Applies the JSON Patch (RFC 6902) operations to this document,
+        through the same writes as fields and fragments, so the changes are
+        recorded and, for a document known to be valid, only the values
+        written are validated again (see is_valid). When an operation cannot be
+        applied (raising ValueError), or when validate is set and the document
+        is not valid afterwards (raising the ValidationError of validate), the
+        operations already applied are undone, leaving the value of the
+        document as it was.
+        """
+        undo = []
+        try:
+            for operation in patch:
+                _apply_operation(self, operation, undo)
+            if validate:
+                self.validate()
+        except Exception:
+            for op, text, value in reversed(undo):
+                _WRITES[op](self, text, value, [])
+            raise
 
     def __delitem__(self, key):
-        # in order to bump the document revision, we must ensure
-        # Document._set_value is invoked.
-        _value = copy.copy(self.value)
-        del _value[key]
-        self.value = _value
+        _delete_item(self, key)
+
+    def _add_sub_fragment_to_cache(self, item, allow_create, create_value):
+        tracking = _tracking(self)
+        logging = _logging(self)
+        start = instrumentation.sample() if instrumentation.enabled else None
+        super(JSONDocument, self)._add_sub_fragment_to_cache(item,
+            allow_create, create_value)
+        if start is not None:
+            _record_fragment(self, item, start)
+        _record_write(self, tracking, item)
+        _record_change(self, logging, 'add', (item, ), create_value)
+
+    def _get_schema_for_item(self, item):
+        return _fragment_for_item(super(JSONDocument,
+            self)._get_schema_for_item(item))
+
+    def _get_value(self):
+        _expose(self)
+        return super(JSONDocument, self)._get_value()
+
+    def _set_value(self, new_value):
+        tracking = _tracking(self)
+        logging = _logging(self)
+        self._owned.pop(id(self._value), None)
+        super(JSONDocument, self)._set_value(new_value)
+        _record_write(self, tracking)
+        _record_change(self, logging, 'replace', (), self._value)
+
+    value = property(_get_value, _set_value)
 
 
 class JSONDocumentFragment(DocumentFragment):
     """
     """
 
+    # the native value of the fragment and the document revision it was
+    # parsed at
+    _native = None
+
+    @property
+    def native(self):
+        """ The value of this fragment as a Python object, as returned by the
+        parse method of the field which generated its schema: a datetime,
+        date, time or timedelta for the fields of those types, and the value
+        itself for other fields. The result is kept until the revision of the
+        document changes, so a value read many times is parsed once.
+        """
+        self._ensure_not_orphaned()
+        document = self._document
+        native = self._native
+        if native is not None and native[0] == document._revision:
+            return native[1]
+        field = document.field_for_schema(self._schema)
+        if field is None:
+            value = self.value
+        else:
+            value = field.parse(DocumentFragment._get_value(self)) \
+                if field.PARSED else self.value
+        self._native = (document._revision, value)
+        return value
+
+    def _get_schema_for_item(self, item):
+        return _fragment_for_item(super(JSONDocumentFragment,
+            self)._get_schema_for_item(item))
+
     def _get_value(self):
+        _expose(self._document)
         return super(JSONDocumentFragment, self)._get_value()
 
     def _set_value(self, new_value):
+        tracking = _tracking(self._document)
+        logging = _logging(self)
+        owned = getattr(self._document, '_owned', None)
+        if owned:
+            owned.pop(id(self._value), None)
         if isinstance(new_value, datetime.datetime):
+            start = instrumentation.sample() if instrumentation.enabled \
+                else None
             new_value = datetime_extension.to_json(new_value)
+            if start is not None:
+                instrumentation.record('coerce', 'datetime', start)
         if isinstance(new_value, datetime.timedelta):
+            start = instrumentation.sample() if instrumentation.enabled \
+                else None
             new_value = timedelta_extension.to_json(new_value)
+            if start is not None:
+                instrumentation.record('coerce', 'timedelta', start)
         super(JSONDocumentFragment, self)._set_value(new_value)
+        _record_write(self, tracking)
+        _record_change(self, logging, 'replace', (), self._value)
+
+    def _add_sub_fragment_to_cache(self, item, allow_create, create_value):
+        tracking = _tracking(self._document)
+        logging = _logging(self)
+        start = instrumentation.sample() if instrumentation.enabled else None
+        super(JSONDocumentFragment, self)._add_sub_fragment_to_cache(item,
+            allow_create, create_value)
+        if start is not None:
+            _record_fragment(self, item, start)
+        _record_write(self, tracking, item)
+        _record_change(self, logging, 'add', (item, ), create_value)
 
     value = property(_get_value, _set_value)
 
 
-class JSONDocumentField(object):
+class JSONCompactListFragment(JSONDocumentFragment):
+    """ Fragment of the lists of compact JSONListFields, which are held in
+    NumericArrays (see json_schema_toolkit.compact): lists assigned to it are
+    stored as arrays where their items allow it.
     """
+
+    def _set_value(self, new_value):
+        if isinstance(new_value, list):
+            array = to_array(new_value, self._schema['items'].get('type'),
+                self._schema['__compact'])
+            if array is not None:
+                new_value = array
+        super(JSONCompactListFragment, self)._set_value(new_value)
+
+    def _add_sub_fragment_to_cache(self, item, allow_create, create_value):
+        value = self.value
+        if value.__class__ is not NumericArray:
+            return super(JSONCompactListFragment,
+                self)._add_sub_fragment_to_cache(item, allow_create,
+                    create_value)
+        self._ensure_not_orphaned()
+        start = instrumentation.sample() if instrumentation.enabled else None
+        item_schema = self._schema['items']
+        self._fragment_cache[item] = item_schema.get('__fragment_cls',
+            DocumentFragment)._make_fragment(self._document, self,
+                value[item], item, item_schema)
+        if start is not None:
+            _record_fragment(self, item, start)
+
+    def __iter__(self):
+        if self.value.__class__ is NumericArray:
+            return self._iter_list()
+        return super(JSONCompactListFragment, self).__iter__()
+
+    value = property(JSONDocumentFragment._get_value, _set_value)
+
+
+class JSONDocumentField(object):
+    """ The base of fields. With 'index' set (to True, or to 'btree' or
+    'gin'), the values of the field are indexed in PostgreSQL; see
+    json_schema_toolkit.django.postgres.document_indexes.
     """
 
+    __slots__ = ('title', 'description', 'default', 'optional', 'null',
+        'pattern', 'content', 'enum', 'implementation', 'index', )
+
+    # the index methods of indexed fields
+    INDEXES = ('btree', 'gin', )
+
     TYPE = 'any'
 
+    # True for fields whose values are parsed into other Python objects
+    PARSED = False
+
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None, 
-        enum = None, implementation = None):
+        enum = None, implementation = None, index = False):
         super(JSONDocumentField, self).__init__()
         self.title = title
         self.description = description
@@ -175,53 +1471,74 @@ class JSONDocumentField(object):
         self.content = content
         self.enum = enum
         self.implementation = implementation or JSONDocumentFragment
+        if index not in (False, True) + self.INDEXES:
+            raise ValueError("index must be True, False or one of %r" % (
+                self.INDEXES, ))
+        self.index = index
 
     def _generate_schema(self):
+        # keys with their default value are left out, except for 'default'
+        # which makes json_document supply the default of missing members;
+        # the field itself is found through JSONDocument.field_for_schema
         SCHEMA = {
             'type' : self.TYPE if not self.null else [ self.TYPE, 'null', ],
-            'title' : self.title,
-            'description' : self.description,
             'default' : self.default,
-            'optional' : self.optional,
-            'null' : self.null,
-            'pattern' : self.pattern,
-            'properties' : {},
-            '__field' : self,
             '__fragment_cls' : self.implementation,
         }
+        if self.title is not None:
+            SCHEMA['title'] = self.title
+        if self.description is not None:
+            SCHEMA['description'] = self.description
+        if self.optional:
+            SCHEMA['optional'] = self.optional
+        if self.null:
+            SCHEMA['null'] = self.null
+        if self.pattern:
+            SCHEMA['pattern'] = compile_pattern(self.pattern)
         if self.enum is not None:
             SCHEMA['enum']=self.enum
         return SCHEMA
 
+    def parse(self, value):
+        """ Returns the Python object represented by a value of this field (the
+        value itself, except for the date and time fields).
+        """
+        return value
+
 
 class JSONBooleanField(JSONDocumentField):
     """
     """
 
+    __slots__ = ()
+
     TYPE = 'boolean'
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, implementation = None):
+        enum = None, implementation = None, index = False):
         super(JSONBooleanField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern, content = content, enum = enum,
-            implementation = implementation)
+            implementation = implementation, index = index)
 
 
 class JSONIntegerField(JSONDocumentField):
     """
     """
 
+    __slots__ = ('minimum', 'maximum', )
+
     TYPE = 'integer'
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, implementation = None, max_value = None, min_value = None):
+        enum = None, implementation = None, max_value = None, min_value = None,
+        index = False):
         super(JSONIntegerField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern, content = content, enum = enum,
-            implementation = implementation)
+            implementation = implementation, index = index)
         self.minimum = min_value
         self.maximum = max_value
 
@@ -236,15 +1553,18 @@ class JSONDecimalField(JSONDocumentField):
     """
     """
 
+    __slots__ = ('minimum', 'maximum', )
+
     TYPE = 'number'
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, implementation = None, max_value = None, min_value = None):
+        enum = None, implementation = None, max_value = None, min_value = None,
+        index = False):
         super(JSONDecimalField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern, content = content, enum = enum,
-            implementation = implementation)
+            implementation = implementation, index = index)
         self.minimum = min_value
         self.maximum = max_value
 
@@ -259,16 +1579,18 @@ class JSONStringField(JSONDocumentField):
     """
     """
 
+    __slots__ = ('minLength', 'maxLength', )
+
     TYPE = 'string'
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
         enum = None, implementation = None, min_length = None,
-        max_length = None):
+        max_length = None, index = False):
         super(JSONStringField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern, content = content, enum = enum,
-            implementation = implementation)
+            implementation = implementation, index = index)
         self.minLength = min_length
         self.maxLength = max_length
 
@@ -283,27 +1605,39 @@ class JSONDateTimeField(JSONDocumentField):
     """
     """
 
+    __slots__ = ()
+
     TYPE = 'string'
+    PARSED = True
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, implementation = None):
+        enum = None, implementation = None, index = False):
         super(JSONDateTimeField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern, content = content, enum = enum,
-            implementation = implementation)
+            implementation = implementation, index = index)
 
     def _generate_schema(self):
         schema = super(JSONDateTimeField, self)._generate_schema()
         schema['format'] = 'date-time'
         return schema
 
+    def parse(self, value):
+        """ Returns the datetime represented by a value of this field, as
+        datetime_extension.from_json does (None for None).
+        """
+        return parse_datetime(value)
+
 
 class JSONDateField(JSONDocumentField):
     """
     """
 
+    __slots__ = ()
+
     TYPE = 'string'
+    PARSED = True
 
     # PATTERN matching the following date formats:
     # - YYYY-MM-DD
@@ -311,114 +1645,168 @@ class JSONDateField(JSONDocumentField):
     # - MM/DD/YY
 
     PATTERN = (r"^(19|20)\d\d[-](0[1-9]|1[012])[-](0[1-9]|[12][0-9]|3[01])$|"
-                "^(0[1-9]|1[012])[/](0[1-9]|[12][0-9]|3[01])[/](19|20)\d\d$|"
-                "^(0[1-9]|1[012])[/](0[1-9]|[12][0-9]|3[01])[/]\d\d$")
+               r"^(0[1-9]|1[012])[/](0[1-9]|[12][0-9]|3[01])[/](19|20)\d\d$|"
+               r"^(0[1-9]|1[012])[/](0[1-9]|[12][0-9]|3[01])[/]\d\d$")
+    REGEX = compile_pattern(PATTERN)
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, implementation = None):
+        enum = None, implementation = None, index = False):
         super(JSONDateField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern or self.PATTERN, content = content,
-            enum = enum, implementation = implementation)
+            enum = enum, implementation = implementation, index = index)
+
+    def parse(self, value):
+        """ Returns the date represented by a value of this field (None for
+        None).
+        """
+        return parse_date(value)
 
 
 class JSONTimeField(JSONDocumentField):
     """
     """
 
+    __slots__ = ()
+
     TYPE = 'string'
+    PARSED = True
 
     # PATTERN matching the following time formats:
     # - HH:MM:SS
     # - HH:MM
     
     PATTERN = (r"^([0-1]?[0-9]|[2][0-3]):([0-5][0-9])$|"
-                "^([0-1]?[0-9]|[2][0-3]):([0-5][0-9]):([0-5][0-9])$")
+               r"^([0-1]?[0-9]|[2][0-3]):([0-5][0-9]):([0-5][0-9])$")
+    REGEX = compile_pattern(PATTERN)
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, implementation = None):
+        enum = None, implementation = None, index = False):
         super(JSONTimeField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern or self.PATTERN, content = content,
-            enum = enum, implementation = implementation)
+            enum = enum, implementation = implementation, index = index)
+
+    def parse(self, value):
+        """ Returns the time represented by a value of this field (None for
+        None).
+        """
+        return parse_time(value)
 
 
 class JSONTimeDeltaField(JSONDocumentField):
     """
     """
 
+    __slots__ = ()
+
     TYPE = 'string'
+    PARSED = True
 
     PATTERN = r"^(\d+)d (\d+)s (\d+)us$"
+    REGEX = compile_pattern(PATTERN)
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, implementation = None):
+        enum = None, implementation = None, index = False):
         super(JSONTimeDeltaField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern or self.PATTERN, content = content,
-            enum = enum, implementation = implementation)
+            enum = enum, implementation = implementation, index = index)
+
+    def parse(self, value):
+        """ Returns the timedelta represented by a value of this field, as
+        timedelta_extension.from_json does (None for None).
+        """
+        return parse_timedelta(value)
 
 
 class JSONObjectField(JSONDocumentField):
     """
     """
 
+    __slots__ = ()
+
     TYPE = 'object'
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, implementation = None):
+        enum = None, implementation = None, index = False):
         super(JSONObjectField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern, content = content, enum = enum,
-            implementation = implementation)
+            implementation = implementation, index = index)
 
     def _generate_schema(self):
         schema = super(JSONObjectField, self)._generate_schema()
-        if not self.content is None:
-            for key, value in self.content.items():
-                schema['properties'][key] = value._generate_schema()
+        if self.content:
+            schema['properties'] = dict((key, value._generate_schema())
+                for key, value in self.content.items())
         return schema
 
 
 class JSONListField(JSONDocumentField):
+    """ A list, whose content is a list of fields giving the schema of the
+    item at each position. With 'compact' set (to True or 'array', or to
+    'numpy'), the content is a single JSONIntegerField or JSONDecimalField
+    which every item must match, and the lists of documents are held in a
+    typed buffer of the array module (or a NumPy array) where their items
+    allow it; see json_schema_toolkit.compact.
     """
-    """
+
+    __slots__ = ('compact', )
 
     TYPE = 'array'
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, implementation = None):
+        enum = None, implementation = None, compact = False, index = False):
+        if compact:
+            compact = 'array' if compact is True else compact
+            if compact not in _compact_backends():
+                raise ValueError("compact must be True or one of %r" % (
+                    _compact_backends(), ))
+            if not isinstance(content, (list, tuple)) or \
+                len(content) != 1 or not isinstance(content[0],
+                (JSONIntegerField, JSONDecimalField)) or content[0].null:
+                raise ValueError("the content of a compact list must be one "
+                    "JSONIntegerField or JSONDecimalField, without null")
+            implementation = implementation or JSONCompactListFragment
         super(JSONListField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern, content = content, enum = enum,
-            implementation = implementation)
+            implementation = implementation, index = index)
+        self.compact = compact or None
 
     def _generate_schema(self):
         schema = super(JSONListField, self)._generate_schema()
-        if not self.content is None:
+        if self.compact:
+            schema['items'] = self.content[0]._generate_schema()
+            schema['__compact'] = self.compact
+        elif not self.content is None:
             schema['items'] = [value._generate_schema() for value in
                 self.content]
         return schema
 
 
+
 class JSONEmailField(JSONStringField):
     """
     """
 
+    __slots__ = ()
+
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
         enum = None, implementation = None, min_length = None,
-        max_length = None):
+        max_length = None, index = False):
         super(JSONEmailField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern, content = content, enum = enum,
             implementation = implementation, min_length = min_length, 
-            max_length = max_length)
+            max_length = max_length, index = index)
 
     def _generate_schema(self):
         schema = super(JSONEmailField, self)._generate_schema()
@@ -430,15 +1818,17 @@ class JSONIPAddressField(JSONStringField):
     """
     """
 
+    __slots__ = ('protocol', )
+
     DEFAULT_PROTOCOL = 'ipv4'
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, protocol=None, implementation = None):
+        enum = None, protocol=None, implementation = None, index = False):
         super(JSONIPAddressField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern, content = content, enum = enum,
-            implementation = implementation)
+            implementation = implementation, index = index)
         self.protocol = protocol if protocol is not None else \
             self.DEFAULT_PROTOCOL
 
@@ -451,35 +1841,47 @@ class JSONIPAddressField(JSONStringField):
 class JSONSlugField(JSONStringField):
     """
     """
+
+    __slots__ = ()
     
     PATTERN = r"^[a-z0-9-]+$"
+    REGEX = compile_pattern(PATTERN)
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, implementation = None, min_length = None,  max_length = None):
+        enum = None, implementation = None, min_length = None,  max_length = None,
+        index = False):
         super(JSONSlugField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern or self.PATTERN, content = content,
             enum = enum, implementation = implementation, min_length = min_length,
-            max_length = max_length)
+            max_length = max_length, index = index)
 
 
 class JSONURLField(JSONStringField):
     """
     """
 
-    # Pattern based on django's URLValidator regex pattern
+    __slots__ = ()
+
+    # Pattern based on django's URLValidator regex pattern; the labels of the
+    # host name are separated by mandatory dots, so matching time grows
+    # linearly with the length of the input, even for hostile input.
     PATTERN = (r"^(http|ftp)s?://(([A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)"
-                "+([A-Za-z]{2,6}\.?|[A-Za-z0-9-]{2,}\.?)|localhost|\d{1,3}\."
-                "\d{1,3}\.\d{1,3}\.\d{1,3}|\[?[a-fA-F0-9]*:[A-Fa-f0-9:]+\]?)"
-                "(:\d+)?(/?|[/?]\S+)$")
+               r"+([A-Za-z]{2,6}\.?|[A-Za-z0-9-]{2,}\.?)|localhost|\d{1,3}\."
+               r"\d{1,3}\.\d{1,3}\.\d{1,3}|\[?[a-fA-F0-9]*:[A-Fa-f0-9:]+\]?)"
+               r"(:\d+)?(/?|[/?]\S+)$")
+    REGEX = compile_pattern(PATTERN)
 
     def __init__(self, title = None, description = None, default = None,
         optional = False, null = False, pattern = None, content = None,
-        enum = None, implementation = None, min_length = None,  max_length = None):
+        enum = None, implementation = None, min_length = None,  max_length = None,
+        index = False):
         super(JSONURLField, self).__init__(title = title,
             description = description, default = default, optional = optional,
             null = null, pattern = pattern or self.PATTERN, content = content,
             enum = enum, implementation = implementation,
-            min_length = min_length,  max_length = max_length)
+            min_length = min_length,  max_length = max_length, index = index)
+
 
+JSONDocument._compile()
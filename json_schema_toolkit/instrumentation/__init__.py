@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 - 2015 by Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+""" Optional instrumentation of schema compilation, validation, fragment
+creation, proxy allocation and value coercion. Instrumentation is disabled by
+default, and then costs a single module attribute check at each instrumented
+point. When enabled, sampled events are passed to a sink, any callable accepting
+the event name, a key and the duration of the event in seconds::
+
+    stats = instrumentation.Stats()
+    instrumentation.enable(stats, sample_rate = 0.01)
+    ...
+    stats.snapshot()
+
+The keys of classes are their module and name, as in 'app.Profile' (see
+class_key). The events and their keys are:
+
+- 'compile': the schema of a JSONDocument class was compiled; the key is that
+  of the class.
+- 'validate': a whole document was validated (on construction, on first access
+  of a lazy document, or by is_valid); the key is that of the class.
+- 'validate_path': a written path of a document was validated again by is_valid;
+  the key is that of the class followed by the path, as in
+  'app.Profile:address.city'.
+- 'fragment': a fragment was created; the key is that of the fragment class.
+- 'proxy': a FragmentProxy was allocated; the key is that of the document
+  class.
+- 'coerce': a value was converted to its JSON representation when set; the key
+  is 'datetime' or 'timedelta'.
+"""
+
+__status__ = "beta"
+__version__ = "1.0.0b1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import random
+import threading
+import timeit
+
+
+EVENTS = ('compile', 'validate', 'validate_path', 'fragment', 'proxy',
+    'coerce', )
+
+# checked at every instrumented point; the other module attributes are only
+# used when it is True
+enabled = False
+
+_sink = None
+_sample_rate = 1.0
+_random = random.random
+_timer = timeit.default_timer
+
+
+def enable(sink, sample_rate = 1.0):
+    """ Enables instrumentation, passing a sample of the events (each with the
+    given probability) to the sink.
+    """
+    global enabled, _sink, _sample_rate
+    if not 0.0 < sample_rate <= 1.0:
+        raise ValueError("sample_rate must be greater than 0 and at most 1")
+    _sink = sink
+    _sample_rate = sample_rate
+    enabled = True
+
+
+def disable():
+    """ Disables instrumentation.
+    """
+    global enabled, _sink
+    enabled = False
+    _sink = None
+
+
+def sample():
+    """ Returns the start time of an event if it is sampled, otherwise None.
+    """
+    if _sample_rate >= 1.0 or _random() < _sample_rate:
+        return _timer()
+    return None
+
+
+def record(event, key, start):
+    """ Passes an event sampled at the given start time to the sink.
+    """
+    sink = _sink
+    if sink is not None:
+        sink(event, key, _timer() - start)
+
+
+def class_key(cls):
+    """ Returns the key identifying a class in events, the string of its
+    module and name.
+    """
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+class Stats(object):
+    """ In-process sink accumulating the count, total and maximum duration of
+    the sampled events per event and key, which can be read (for instance by a
+    metrics exporter) with snapshot. Stats can be shared by threads.
+    """
+
+    def __init__(self):
+        super(Stats, self).__init__()
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def __call__(self, event, key, seconds):
+        with self._lock:
+            entry = self._entries.get((event, key))
+            if entry is None:
+                self._entries[(event, key)] = [ 1, seconds, seconds, ]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+
+    def snapshot(self, reset = False):
+        """ Returns a dictionary mapping each event to a dictionary mapping each
+        key to its 'count', total 'seconds' and 'max' seconds; counts are of
+        sampled events. With reset, the statistics are cleared.
+        """
+        with self._lock:
+            entries = self._entries
+            if reset:
+                self._entries = {}
+            result = {}
+            for (event, key), (count, seconds, maximum) in entries.items():
+                result.setdefault(event, {})[key] = { 'count' : count,
+                    'seconds' : seconds, 'max' : maximum, }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+""" JSON Patch (RFC 6902) operations for the changes recorded by documents:
+the paths of the values written are turned into JSON Pointers (RFC 6901), and
+a sequence of changes into the operations which make the same changes, leaving
+out the values overwritten by later changes.
+"""
+
+__status__ = "beta"
+__version__ = "1.0.0b1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# JSON Schema Toolkit
+from json_schema_toolkit.compact import NumericArray
+
+
+OPERATIONS = ('add', 'remove', 'replace', 'move', 'copy', 'test', )
+
+
+def pointer(path):
+    """ Returns the JSON Pointer of a path (a sequence of object keys and list
+    indices); the empty path points to the whole document.
+    """
+    return u''.join(u'/' + (u'%s' % item).replace(u'~', u'~0').replace(u'/',
+        u'~1') for item in path)
+
+
+def parse_pointer(text):
+    """ Returns the reference tokens of a JSON Pointer, as strings; raises
+    ValueError for text which is not a JSON Pointer.
+    """
+    if not text:
+        return ()
+    if not text.startswith(u'/'):
+        raise ValueError("%r is not a JSON Pointer" % (text, ))
+    return tuple(token.replace(u'~1', u'/').replace(u'~0', u'~')
+        for token in text[1:].split(u'/'))
+
+
+def snapshot(value):
+    """ Returns a copy of a value, as plain objects and lists (the values of
+    compact lists are turned into lists), sharing only its scalars.
+    """
+    if isinstance(value, dict):
+        return dict((key, snapshot(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [ snapshot(item) for item in value ]
+    if value.__class__ is NumericArray:
+        return value.tolist()
+    return value
+
+
+def operations(changes, pointers = True):
+    """ Returns the JSON Patch operations making the given changes, a sequence
+    of (revision, operation, path, value) tuples in the order they were made,
+    where the operation is 'add', 'remove' or 'replace'. An addition or
+    replacement is left out when a later one writes the same path, or a path
+    containing it, with no removal or insertion into a list in between (which
+    move the following items of lists); a replacement of a value whose addition is left out
+    becomes an addition. With pointers False, the paths of the operations are
+    the paths of the changes (tuples of object keys and list indices) instead
+    of JSON Pointers.
+    """
+    location = pointer if pointers else tuple
+    result = []
+    # the operations written since the last removal or insertion, by path
+    written = {}
+    for revision, op, path, value in reversed(changes):
+        if op == 'remove':
+            written = {}
+            result.append({ 'op' : op, 'path' : location(path), })
+            continue
+        if any(path[:index] in written for index in range(len(path))):
+            continue
+        later = written.get(path)
+        if later is not None:
+            if op == 'add':
+                later['op'] = op
+        else:
+            written[path] = operation = { 'op' : op,
+                'path' : location(path), 'value' : snapshot(value), }
+            result.append(operation)
+        if op == 'add' and path and isinstance(path[-1], int):
+            # an insertion into a list moves the following items
+            written = {}
+    result.reverse()
+    return result
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 - 2015 by Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+"""
+
+__status__ = "beta"
+__version__ = "1.0.0b1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import codecs
+import collections
+import json
+import re
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+from json_schema_validator.schema import Schema
+
+# JSON Schema Toolkit
+from json_schema_toolkit.validator import CompiledValidator, compile_schema
+
+
+_WHITESPACE = ' \t\n\r'
+
+# the longest text at the end of the buffer which may be the start of a value
+# other than a string (an escaped surrogate pair within a string)
+_LOOKAHEAD = 12
+
+# the position of decoding errors in their message (Python 2 does not give it
+# as an attribute)
+_ERROR_POSITION = re.compile(r'\(char (\d+)\)')
+
+
+class StreamItem(collections.namedtuple('StreamItem',
+    ['index', 'value', 'errors'])):
+    """ An item of a streamed list: its index in the list, its value, and the
+    list of ValidationError raised for it (empty when the item is valid).
+    Errors which do not concern a single item (the rest of the document, or a
+    list shorter than its schema) are reported with index and value None.
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+class _Reader(object):
+    """ Incremental reader over a file object or an iterable of chunks (bytes
+    or text). The buffer only holds the part of the input which has not been
+    consumed yet, so its size is bounded by the largest single value read.
+    """
+
+    def __init__(self, source, chunk_size, encoding):
+        super(_Reader, self).__init__()
+        if hasattr(source, 'read'):
+            self.chunks = iter(lambda: source.read(chunk_size), source.read(0))
+        else:
+            self.chunks = iter(source)
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.json = json.JSONDecoder()
+        self.buffer = u''
+        self.position = 0
+        self.eof = False
+
+    def fill(self):
+        """ Reads at least as much input as is left unconsumed in the buffer
+        (so a value spanning many chunks is decoded a logarithmic number of
+        times), returning False at the end of the input.
+        """
+        if self.eof:
+            return False
+        pending = [ self.buffer[self.position:] ]
+        wanted = len(pending[0])
+        read = 0
+        while True:
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                pending.append(self.decoder.decode(b'', True))
+                self.eof = True
+                break
+            if not isinstance(chunk, type(u'')):
+                chunk = self.decoder.decode(chunk)
+            pending.append(chunk)
+            read += len(chunk)
+            if read > wanted:
+                break
+        self.buffer = u''.join(pending)
+        self.position = 0
+        return True
+
+    def peek(self):
+        """ Returns the next non whitespace character, or '' at the end of the
+        input.
+        """
+        while True:
+            while self.position < len(self.buffer) and \
+                self.buffer[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer) or not self.fill():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, characters):
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError("Expecting one of %r at input position %d" % (
+                characters, self.position))
+        self.position += 1
+        return character
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buffer, self.position)
+            except ValueError as error:
+                # only a value cut by the end of the buffer is read further, so
+                # a malformed value does not read the rest of the input
+                if not self.truncated(error) or not self.fill():
+                    raise
+                continue
+            # a number ending the buffer may continue in the next chunk
+            if end == len(self.buffer) and not self.eof:
+                self.fill()
+                continue
+            self.position = end
+            return value
+
+    def truncated(self, error):
+        """ Whether the decoding error may be caused by the end of the buffer:
+        strings are reported unterminated at their start, other errors at the
+        end of the buffer or within the few characters before it.
+        """
+        if (u'%s' % error).startswith(u'Unterminated string'):
+            return True
+        position = getattr(error, 'pos', None)
+        if position is None:
+            match = _ERROR_POSITION.search(u'%s' % error)
+            if match is None:
+                return True
+            position = int(match.group(1))
+        return len(self.buffer) - position < _LOOKAHEAD
+
+
+class _FragmentValidator(object):
+    """ Validates values against subschemas of a document schema, reporting
+    errors with the object and schema expressions they would have when
+    validating the whole document. Subschemas are compiled with compile_schema
+    unless another validator is given.
+    """
+
+    def __init__(self, validator):
+        super(_FragmentValidator, self).__init__()
+        if isinstance(validator, CompiledValidator):
+            validator = None
+        self.validator = validator
+        self.compiled = {}
+
+    def __call__(self, schema, value, object_expr, schema_expr):
+        try:
+            if self.validator is None:
+                key = id(schema)
+                if key not in self.compiled:
+                    self.compiled[key] = (schema, compile_schema(schema)[0])
+                self.compiled[key][1](value)
+            else:
+                self.validator.validate(Schema(schema), value)
+        except ValidationError as error:
+            error.object_expr = object_expr + error.object_expr[len('object'):]
+            error.schema_expr = schema_expr + error.schema_expr[len('schema'):]
+            return [ error ]
+        return []
+
+
+def _error(legacy_message, new_message, object_expr, schema_expr):
+    return StreamItem(None, None, [ ValidationError(legacy_message,
+        new_message, object_expr, schema_expr) ])
+
+
+def validate_stream(schema, source, field, validator = None,
+    chunk_size = 65536, encoding = 'utf-8', homogeneous = True):
+    """ Parses a JSON document incrementally from a file object or an iterable
+    of chunks, and generates a StreamItem for every item of the list under the
+    given top level field, validated against the item schema of the field as
+    soon as it has been read. Only one item is held in memory at a time. The
+    other members of the document are validated against their schemas and
+    discarded; their errors, and the missing required members, are generated
+    as StreamItem with index None.
+
+    Every item is validated against the 'items' schema when it is a single
+    schema or, when homogeneous is True (the default), a list of one schema,
+    as list fields with a single content field describe lists of any number of
+    items of the same kind. Otherwise, items are validated as they are when
+    validating the whole document: against the item schema at the same
+    position of the 'items' schema list, with items past the end of the list
+    not being constrained further.
+    """
+    properties = schema.get('properties', {})
+    field_schema = properties[field]
+    check = _FragmentValidator(validator)
+    reader = _Reader(source, chunk_size, encoding)
+    if reader.peek() != '{':
+        value = reader.value()
+        errors = check(schema, value, 'object', 'schema')
+        if errors:
+            yield StreamItem(None, None, errors)
+        return
+    reader.expect('{')
+    seen = set()
+    while reader.peek() != '}':
+        if seen:
+            reader.expect(',')
+        key = reader.value()
+        if not isinstance(key, type(u'')):
+            raise ValueError("Expecting a property name at input position %d"
+                % reader.position)
+        reader.expect(':')
+        seen.add(key)
+        object_expr = 'object.' + key
+        schema_expr = 'schema.properties.' + key
+        if key != field or reader.peek() != '[':
+            value = reader.value()
+            if key in properties:
+                errors = check(properties[key], value, object_expr,
+                    schema_expr)
+                if errors:
+                    yield StreamItem(None, None, errors)
+            continue
+        for item in _validate_items(reader, field_schema, check, object_expr,
+            schema_expr, homogeneous):
+            yield item
+    reader.expect('}')
+    for key, key_schema in properties.items():
+        if key not in seen and not Schema(key_schema).optional:
+            yield _error("document does not have property {0!r}".format(key),
+                "Object lacks property {0!r}".format(key), 'object',
+                'schema.properties.' + key + '.optional')
+
+
+def _validate_items(reader, field_schema, check, object_expr, schema_expr,
+    homogeneous):
+    # the type of the field is satisfied by any list, and so are the checks
+    # on lists the field schemas do not use (such as uniqueItems)
+    items = Schema(field_schema).items
+    repeated = homogeneous and isinstance(items, list) and len(items) == 1
+    reader.expect('[')
+    index = 0
+    while reader.peek() != ']':
+        if index:
+            reader.expect(',')
+        value = reader.value()
+        item_expr = '%s[%d]' % (object_expr, index)
+        if isinstance(items, dict):
+            errors = check(items, value, item_expr, schema_expr + '.items') \
+                if items else []
+        elif repeated or index < len(items):
+            position = 0 if repeated else index
+            errors = check(items[position], value, item_expr,
+                schema_expr + 'items[%d]' % position)
+        else:
+            errors = []
+        yield StreamItem(index, value, errors)
+        index += 1
+    reader.expect(']')
+    if isinstance(items, list) and index < len(items):
+        yield _error("list of {0} items is shorter than array schema".format(
+            index), "Object array is shorter than schema array", object_expr,
+            schema_expr + '.items')
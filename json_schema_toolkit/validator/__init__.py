@@ -0,0 +1,563 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 - 2015 by Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+"""
+
+__status__ = "beta"
+__version__ = "1.0.0b1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import datetime
+import re
+import threading
+import weakref
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+from json_schema_validator.misc import NUMERIC_TYPES
+from json_schema_validator.schema import Schema
+from json_schema_validator.validator import Validator
+
+# JSON Schema Toolkit
+from json_schema_toolkit.compact import NumericArray
+
+
+try:
+    _STRING_TYPES = basestring
+except NameError:
+    _STRING_TYPES = str
+
+
+# Schema members which the generated code does not implement; a schema using
+# any of them (with a value other than the default) is validated by the generic
+# json_schema_validator Validator instead.
+_UNSUPPORTED = {
+    'requires' : {},
+    'additionalProperties' : {},
+    'uniqueItems' : False,
+    'minItems' : 0,
+    'maxItems' : None,
+    'contentEncoding' : None,
+    'divisibleBy' : 1,
+    'disallow' : None,
+    'extends' : None,
+}
+
+DATE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+class _Unsupported(Exception):
+    """ Raised while generating code for a schema the compiler cannot handle.
+    """
+
+
+def _fail(error, obj, object_expr = None):
+    legacy_message, arguments, new_message, static_expr, schema_expr = error
+    raise ValidationError(legacy_message.format(obj = obj, **arguments),
+        new_message, object_expr or static_expr, schema_expr)
+
+
+def _relocate(error, object_expr, schema_expr):
+    # errors of a shared subschema validator are raised at the root of the
+    # subschema, and are moved to where the subschema is used
+    error.object_expr = object_expr + error.object_expr[len('object'):]
+    error.schema_expr = schema_expr + error.schema_expr[len('schema'):]
+
+
+def _interned(schema):
+    """ True for the immutable schemas of JSONDocument classes, which are
+    interned by structure, so the functions compiled for them are kept on them
+    and shared by every class using them.
+    """
+    return hasattr(schema, '_compiled')
+
+
+# The exact types of the values which are integers and numbers for the
+# Validator (which tests them with isinstance, so booleans are integers).
+_ITEM_TYPES = dict((json_type, frozenset([ bool, ]) | frozenset(types if
+    isinstance(types, tuple) else (types, ))) for json_type, types in
+    Validator.JSON_TYPE_MAP.items() if json_type in ('integer', 'number'))
+
+_ARRAY_TYPES = (list, NumericArray, )
+
+
+def _numeric_items(values, types, minimum, maximum, minimum_can_equal,
+    maximum_can_equal):
+    """ Returns True if the values held by a NumericArray are of the given
+    types and within the range, checked by the type of the array and its
+    bounds instead of one test per item. Returns False for any other list,
+    and when an item fails or the bounds are unknown, in which case the items
+    are validated one at a time (raising the error of the first failing item).
+    """
+    if values.__class__ is not NumericArray:
+        return False
+    held = values.types()
+    if held is None or not held <= types:
+        return False
+    bounds = values.bounds()
+    if bounds is None:
+        return not len(values)
+    lowest, highest = bounds
+    if minimum is not None and (lowest < minimum or
+        (lowest == minimum and not minimum_can_equal)):
+        return False
+    if maximum is not None and (highest > maximum or
+        (highest == maximum and not maximum_can_equal)):
+        return False
+    return True
+
+
+def _match_date_time(obj):
+    try:
+        datetime.datetime.strptime(obj, DATE_TIME_FORMAT)
+    except ValueError:
+        return False
+    return True
+
+
+def _match_regex(obj):
+    try:
+        re.compile(obj)
+    except:
+        return False
+    return True
+
+
+class _SchemaCompiler(object):
+    """ Generates the source of a Python function which validates a value
+    against a schema in the same order, and raising the same ValidationError
+    (messages, object and schema expressions), as the json_schema_validator
+    Validator. The schema is traversed once, at compilation, so validation
+    performs no schema lookups, no Schema wrapping and no stack bookkeeping.
+    """
+
+    def __init__(self):
+        super(_SchemaCompiler, self).__init__()
+        self.lines = []
+        self.namespace = {
+            '_fail' : _fail,
+            '_STRING_TYPES' : _STRING_TYPES,
+            '_NUMERIC_TYPES' : NUMERIC_TYPES,
+            '_match_date_time' : _match_date_time,
+            '_match_regex' : _match_regex,
+            '_relocate' : _relocate,
+            '_ValidationError' : ValidationError,
+            '_ARRAY_TYPES' : _ARRAY_TYPES,
+            '_numeric_items' : _numeric_items,
+        }
+        self.counter = 0
+
+    def compile(self, schema):
+        self.emit(0, 'def validate(v0):')
+        self.node(Schema(schema), 'v0', ['object'], 'schema', 1)
+        self.emit(1, 'return True')
+        source = '\n'.join(self.lines) + '\n'
+        code = compile(source, '<compiled schema>', 'exec')
+        exec(code, self.namespace)
+        return self.namespace['validate'], source
+
+    def emit(self, indent, line):
+        self.lines.append('    ' * indent + line)
+
+    def name(self, prefix):
+        self.counter += 1
+        return '%s%d' % (prefix, self.counter)
+
+    def constant(self, value):
+        name = self.name('K')
+        self.namespace[name] = value
+        return name
+
+    def fail(self, indent, var, object_expr, schema_expr, legacy_message,
+        new_message, **arguments):
+        static = [piece for piece in object_expr if not isinstance(piece,
+            tuple)]
+        error = self.constant((legacy_message, arguments, new_message,
+            ''.join(static), schema_expr))
+        if len(static) == len(object_expr):
+            self.emit(indent, '_fail(%s, %s)' % (error, var))
+        else:
+            self.emit(indent, '_fail(%s, %s, %s)' % (error, var,
+                self.expression(object_expr)))
+
+    def expression(self, object_expr):
+        """ Returns the code of the object expression, whose pieces are strings
+        or (for list items) the names of index variables.
+        """
+        if not [piece for piece in object_expr if isinstance(piece, tuple)]:
+            return repr(''.join(object_expr))
+        return "''.join((%s, ))" % ', '.join(repr(piece) if not isinstance(
+            piece, tuple) else "'[%%d]' %% %s" % piece[0] for piece in
+            object_expr)
+
+    def shared(self, schema, var, object_expr, schema_expr, indent):
+        """ Calls the function compiled for an interned object or list
+        subschema (compiling it once for all the schemas it is part of)
+        instead of generating its code again.
+        """
+        validate = self.constant(compile_schema(schema._schema)[0])
+        self.emit(indent, 'try:')
+        self.emit(indent + 1, '%s(%s)' % (validate, var))
+        self.emit(indent, 'except _ValidationError as e:')
+        self.emit(indent + 1, '_relocate(e, %s, %r)' % (self.expression(
+            object_expr), schema_expr))
+        self.emit(indent + 1, 'raise')
+
+    def type_test(self, json_type, var):
+        if json_type == 'any':
+            return 'True'
+        if json_type == 'boolean':
+            return '(%s is True or %s is False)' % (var, var)
+        if json_type == 'array':
+            # lists of compact JSONListFields are held in NumericArrays
+            return 'isinstance(%s, _ARRAY_TYPES)' % var
+        return 'isinstance(%s, %s)' % (var, self.constant(
+            Validator.JSON_TYPE_MAP[json_type]))
+
+    def node(self, schema, var, object_expr, schema_expr, indent):
+        for key, default in _UNSUPPORTED.items():
+            if schema._schema.get(key, default) != default:
+                raise _Unsupported(key)
+        json_type = schema.type
+        if var != 'v0' and json_type in ('object', 'array') and \
+            _interned(schema._schema) and (schema._schema.get('properties') or
+            schema._schema.get('items')):
+            return self.shared(schema, var, object_expr, schema_expr, indent)
+        if isinstance(json_type, list):
+            if [t for t in json_type if not isinstance(t, _STRING_TYPES)]:
+                raise _Unsupported('type')
+            if 'any' not in json_type and json_type != []:
+                self.emit(indent, 'if not (%s):' % ' or '.join(
+                    self.type_test(t, var) for t in json_type))
+                self.fail(indent + 1, var, object_expr, schema_expr + '.type',
+                    "{obj!r} does not match any of the types in {type!r}",
+                    "Object has incorrect type (multiple types possible)",
+                    type = json_type)
+            kind = None
+        elif isinstance(json_type, dict):
+            raise _Unsupported('type')
+        else:
+            if json_type != 'any':
+                self.emit(indent, 'if not %s:' % self.type_test(json_type,
+                    var))
+                if json_type == 'boolean':
+                    self.fail(indent + 1, var, object_expr,
+                        schema_expr + '.type',
+                        "{obj!r} does not match type {type!r}",
+                        "Object has incorrect type (expected boolean)",
+                        type = json_type)
+                else:
+                    self.fail(indent + 1, var, object_expr,
+                        schema_expr + '.type',
+                        "{obj!r} does not match type {type!r}",
+                        "Object has incorrect type (expected {0})".format(
+                            json_type), type = json_type)
+            kind = {
+                'object' : 'object',
+                'array' : 'array',
+                'string' : 'string',
+                'integer' : 'number',
+                'number' : 'number',
+                'boolean' : 'scalar',
+                'null' : 'scalar',
+            }.get(json_type)
+        if kind is None:
+            # the type does not determine the branch taken by the validator
+            self.emit(indent, 'if isinstance(%s, dict):' % var)
+            self.properties(schema, var, object_expr, schema_expr, indent + 1)
+            self.emit(indent + 1, 'pass')
+            self.emit(indent, 'elif isinstance(%s, _ARRAY_TYPES):' % var)
+            self.items(schema, var, object_expr, schema_expr, indent + 1)
+            self.emit(indent + 1, 'pass')
+            self.emit(indent, 'else:')
+            self.scalar(schema, var, object_expr, schema_expr, indent + 1,
+                kind)
+            self.emit(indent + 1, 'pass')
+        elif kind == 'object':
+            self.properties(schema, var, object_expr, schema_expr, indent)
+        elif kind == 'array':
+            self.items(schema, var, object_expr, schema_expr, indent)
+        else:
+            self.scalar(schema, var, object_expr, schema_expr, indent, kind)
+
+    def properties(self, schema, var, object_expr, schema_expr, indent):
+        for prop, prop_schema in schema.properties.items():
+            prop_schema = Schema(prop_schema)
+            prop_expr = schema_expr + '.properties.' + prop
+            prop_var = self.name('v')
+            self.emit(indent, 'if %r in %s:' % (prop, var))
+            self.emit(indent + 1, '%s = %s[%r]' % (prop_var, var, prop))
+            self.node(prop_schema, prop_var, object_expr + ['.' + prop],
+                prop_expr, indent + 1)
+            if not prop_schema.optional:
+                self.emit(indent, 'else:')
+                self.fail(indent + 1, var, object_expr,
+                    prop_expr + '.optional',
+                    "{obj!r} does not have property {prop!r}",
+                    "Object lacks property {0!r}".format(prop), prop = prop)
+
+    def items(self, schema, var, object_expr, schema_expr, indent):
+        items = schema.items
+        if isinstance(items, dict):
+            if items == {}:
+                return
+            numeric = self.numeric_items(Schema(items))
+            if numeric is not None:
+                # compact arrays are checked by their type and bounds
+                self.emit(indent, 'if not _numeric_items(%s, *%s):' % (var,
+                    self.constant(numeric)))
+                indent += 1
+            index = self.name('i')
+            item_var = self.name('v')
+            self.emit(indent, 'for %s, %s in enumerate(%s):' % (index,
+                item_var, var))
+            self.node(Schema(items), item_var, object_expr + [(index, )],
+                schema_expr + '.items', indent + 1)
+            self.emit(indent + 1, 'pass')
+        else:
+            self.emit(indent, 'if len(%s) < %d:' % (var, len(items)))
+            self.fail(indent + 1, var, object_expr, schema_expr + '.items',
+                "{obj!r} is shorter than array schema {schema!r}",
+                "Object array is shorter than schema array", schema = items)
+            for index, item_schema in enumerate(items):
+                item_var = self.name('v')
+                self.emit(indent, '%s = %s[%d]' % (item_var, var, index))
+                self.node(Schema(item_schema), item_var,
+                    object_expr + ['[%d]' % index],
+                    schema_expr + 'items[%d]' % index, indent)
+
+    def numeric_items(self, schema):
+        """ Returns the arguments of _numeric_items for the schema of the
+        items of a list, when it only constrains their type (integer or
+        number) and range, or None.
+        """
+        json_type = schema.type
+        if not isinstance(json_type, _STRING_TYPES) or \
+            json_type not in _ITEM_TYPES or schema.enum is not None or \
+            schema._schema.get('format') is not None:
+            return None
+        minimum, maximum = schema.minimum, schema.maximum
+        return (_ITEM_TYPES[json_type], minimum, maximum,
+            minimum is None or schema.minimumCanEqual,
+            maximum is None or schema.maximumCanEqual)
+
+    def scalar(self, schema, var, object_expr, schema_expr, indent, kind):
+        enum = schema.enum
+        if enum is not None:
+            self.emit(indent, 'if %s not in %s:' % (var, self.constant(enum)))
+            self.fail(indent + 1, var, object_expr, schema_expr + '.enum',
+                "{obj!r} does not match any value in enumeration {enum!r}",
+                "Object does not match any value in enumeration", enum = enum)
+        fmt = schema._schema.get('format', None)
+        if fmt is not None:
+            if fmt not in ('date-time', 'regex'):
+                # mirrors the Schema.format property, which is only consulted
+                # for values which are neither objects nor arrays
+                self.emit(indent, 'raise NotImplementedError(%r)' % (
+                    "format value {0!r} is not supported".format(fmt), ))
+                return
+            self.emit(indent, 'if not _match_%s(%s):' % ({
+                'date-time' : 'date_time', 'regex' : 'regex', }[fmt], var))
+            self.fail(indent + 1, var, object_expr, schema_expr + '.format',
+                "{obj!r} is not a string representing %s" % ({
+                    'date-time' : 'JSON date-time',
+                    'regex' : 'a regex', }[fmt], ),
+                "Object is not a string representing %s" % ({
+                    'date-time' : 'JSON date-time',
+                    'regex' : 'a regex', }[fmt], ))
+        pattern = schema.pattern
+        if kind in ('string', None) and pattern is not None and \
+            pattern.pattern:
+            test = '%s.match(%s)' % (self.constant(pattern), var)
+            if kind is None:
+                test = '(not isinstance(%s, _STRING_TYPES) or %s)' % (var,
+                    test)
+            self.emit(indent, 'if not %s:' % test)
+            self.fail(indent + 1, var, object_expr, schema_expr + '.pattern',
+                "{obj!r} does not match pattern {ptn!r}",
+                "Object does not match pattern (expected {0})".format(pattern),
+                ptn = pattern)
+        if kind in ('string', None):
+            self.length(schema, var, object_expr, schema_expr, indent,
+                kind is None)
+        if kind in ('number', None):
+            self.range(schema, var, object_expr, schema_expr, indent,
+                kind is None)
+
+    def length(self, schema, var, object_expr, schema_expr, indent, guard):
+        tests = []
+        if schema.minLength:
+            tests.append(('len(%s) < %r' % (var, schema.minLength),
+                '.minLength', "{obj!r} does not meet the minimum length"
+                " {minLength!r}", "Object does not meet the minimum length",
+                { 'minLength' : schema.minLength }))
+        if schema.maxLength is not None:
+            tests.append(('len(%s) > %r' % (var, schema.maxLength),
+                '.maxLength', "{obj!r} exceeds the maximum length"
+                " {maxLength!r}", "Object exceeds the maximum length",
+                { 'maxLength' : schema.maxLength }))
+        self.guarded_tests(tests, var, object_expr, schema_expr, indent,
+            '_STRING_TYPES' if guard else None)
+
+    def range(self, schema, var, object_expr, schema_expr, indent, guard):
+        tests = []
+        if schema.minimum is not None:
+            minimum = self.constant(schema.minimum)
+            test = '%s < %s' % (var, minimum)
+            if not schema.minimumCanEqual:
+                test = '%s <= %s' % (var, minimum)
+            tests.append((test, '.minimum', "{obj!r} is less than the minimum"
+                " {minimum!r}", "Object is less than the minimum",
+                { 'minimum' : schema.minimum }))
+        if schema.maximum is not None:
+            maximum = self.constant(schema.maximum)
+            test = '%s > %s' % (var, maximum)
+            if not schema.maximumCanEqual:
+                test = '%s >= %s' % (var, maximum)
+            tests.append((test, '.maximum', "{obj!r} is greater than the"
+                " maximum {maximum!r}", "Object is greater than the maximum",
+                { 'maximum' : schema.maximum }))
+        self.guarded_tests(tests, var, object_expr, schema_expr, indent,
+            '_NUMERIC_TYPES' if guard else None)
+
+    def guarded_tests(self, tests, var, object_expr, schema_expr, indent,
+        guard):
+        if not tests:
+            return
+        if guard is not None:
+            self.emit(indent, 'if isinstance(%s, %s):' % (var, guard))
+            indent += 1
+        for test, suffix, legacy_message, new_message, arguments in tests:
+            self.emit(indent, 'if %s:' % test)
+            self.fail(indent + 1, var, object_expr, schema_expr + suffix,
+                legacy_message, new_message, **arguments)
+
+
+def _generic_validator(schema):
+    schema = Schema(schema)
+    def validate(obj):
+        return Validator.validate(schema, obj)
+    return validate, None
+
+
+_COMPILED_LOCK = threading.Lock()
+
+
+def compile_schema(schema):
+    """ Compiles a schema (a dictionary as generated by JSONDocumentField and
+    JSONDocument, or a json_schema_validator Schema) into a function which
+    validates a value against it, returning True or raising the same
+    ValidationError as the json_schema_validator Validator. Schemas using
+    members the compiler does not implement are validated by the Validator.
+    Returns the function and its generated source (None for the fall back).
+    """
+    if isinstance(schema, Schema):
+        schema = schema._schema
+    if _interned(schema) and schema._compiled is not None:
+        return schema._compiled
+    try:
+        compiled = _SchemaCompiler().compile(schema)
+    except _Unsupported:
+        compiled = _generic_validator(schema)
+    if _interned(schema):
+        # a schema compiled by several threads at once keeps the function
+        # compiled first, so every validator of the schema shares it
+        with _COMPILED_LOCK:
+            if schema._compiled is None:
+                schema._compiled = compiled
+            compiled = schema._compiled
+    return compiled
+
+
+_VALIDATORS = weakref.WeakKeyDictionary()
+
+
+class CompiledValidator(object):
+    """ Validator specialized for the schema of a JSONDocument class, which can
+    be used in place of the json_schema_validator Validator through the
+    'validator' argument of JSONDocument::
+
+        validator = CompiledValidator.for_document(EventLog)
+        log = EventLog(value, validator = validator)
+
+    The 'schema' argument of validate is accepted for compatibility with
+    Validator.validate; values are always validated against the schema the
+    validator was compiled from.
+    """
+
+    def __init__(self, schema):
+        super(CompiledValidator, self).__init__()
+        if isinstance(schema, type):
+            schema = schema.document_schema
+        self.schema = schema
+        self._validate, self.source = compile_schema(schema)
+        self._subschemas = {}
+
+    @classmethod
+    def for_document(cls, document_cls):
+        """ Returns the validator for the given JSONDocument class, compiling
+        it only the first time, or when the class schema has been recompiled.
+        """
+        validator = _VALIDATORS.get(document_cls)
+        if validator is None or \
+            validator.schema is not document_cls.document_schema:
+            validator = _VALIDATORS[document_cls] = cls(document_cls)
+        return validator
+
+    def for_subschema(self, schema):
+        """ Returns the function validating values against the given subschema
+        of the schema of this validator (as compile_schema does), compiling it
+        only the first time.
+        """
+        try:
+            return self._subschemas[id(schema)][1]
+        except KeyError:
+            validate = compile_schema(schema)[0]
+            # the subschema is kept so that its id is not reused
+            self._subschemas[id(schema)] = (schema, validate)
+            return validate
+
+    def validate(self, schema, obj):
+        return self._validate(obj)
+
+    def __reduce__(self):
+        # the generated function cannot be pickled, so the validator is
+        # compiled again when unpickled (for instance in a worker process)
+        return (self.__class__, (self.schema, ))
+
+    def __call__(self, obj):
+        return self._validate(obj)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" The tests of json_schema_toolkit.aio, which use coroutines; imported by
+test_aio on Python >= 3.6 only, as the syntax is not available before.
+"""
+
+__status__ = "alpha"
+__version__ = "1.0.0a1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import asyncio
+
+# Unittest2
+from unittest2 import TestCase
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+
+# JSON Schema Toolkit
+from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
+    JSONListField, JSONStringField
+
+
+class SeriesDocument(JSONDocument):
+
+    sensor = JSONStringField(title = u'sensor', min_length = 1)
+    readings = JSONListField(title = u'readings', content = [
+        JSONIntegerField(title = u'reading', min_value = 0), ])
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class AsyncValidatorTestCase(TestCase):
+
+    def test_validate(self):
+        from json_schema_toolkit import aio
+        small = { 'sensor' : u'a', 'readings' : [ 1, 2, 3, ], }
+        large = { 'sensor' : u'a', 'readings' : list(range(5000)), }
+
+        async def check():
+            self.assertTrue(await SeriesDocument.avalidate(small))
+            self.assertTrue(await SeriesDocument.avalidate(large))
+            with self.assertRaises(ValidationError):
+                await SeriesDocument.avalidate(dict(large, readings = [ -1, ]))
+            with self.assertRaises(ValidationError) as context:
+                await SeriesDocument.avalidate(dict(large,
+                    readings = [ -1, ] + list(range(5000))))
+            self.assertEqual(context.exception.object_expr,
+                'object.readings[0]')
+
+        _run(check())
+        self.assertIs(aio.for_document(SeriesDocument),
+            aio.for_document(SeriesDocument))
+        self.assertFalse(aio._exceeds(small, aio.INLINE_SIZE))
+        self.assertTrue(aio._exceeds(large, aio.INLINE_SIZE))
+
+    def test_validate_in_many_loops(self):
+        large = { 'sensor' : u'a', 'readings' : list(range(5000)), }
+
+        async def check():
+            for result in await asyncio.gather(*[ SeriesDocument.avalidate(
+                large) for n in range(20) ]):
+                self.assertTrue(result)
+
+        # the validator of the class is shared by the loops
+        _run(check())
+        _run(check())
+
+    def test_concurrency_and_cancellation(self):
+        from json_schema_toolkit import aio
+        validator = aio.AsyncValidator(SeriesDocument, concurrency = 2,
+            inline_size = 0)
+        running = []
+        peak = []
+        release = None
+
+        async def submit(value):
+            running.append(value)
+            peak.append(len(running))
+            await release.wait()
+            running.remove(value)
+            return None
+
+        validator._submit = submit
+
+        async def check():
+            nonlocal release
+            release = asyncio.Event()
+            tasks = [ asyncio.ensure_future(validator.validate({ 'n' : n, }))
+                for n in range(5) ]
+            await asyncio.sleep(0.01)
+            self.assertEqual(len(running), 2)
+            tasks[0].cancel()
+            tasks[4].cancel()
+            release.set()
+            results = await asyncio.gather(*tasks, return_exceptions = True)
+            self.assertIsInstance(results[0], asyncio.CancelledError)
+            self.assertEqual(results[1:4], [ True, True, True, ])
+            self.assertEqual(max(peak), 2)
+            self.assertEqual(validator._semaphores[
+                aio._running_loop()]._value, 2)
+
+        _run(check())
+
+    def test_validate_stream(self):
+        from json_schema_toolkit import aio
+        validator = aio.AsyncValidator(SeriesDocument, executor = 'process',
+            workers = 2, inline_size = 2)
+        values = [ { 'sensor' : u'a', 'readings' : [ n - 2, n, ], }
+            for n in range(6) ]
+
+        async def source():
+            for value in values:
+                await asyncio.sleep(0)
+                yield value
+
+        async def check():
+            results = [ result async for result in
+                SeriesDocument.avalidate_stream(source(),
+                    validator = validator) ]
+            self.assertEqual([ result.index for result in results ],
+                list(range(6)))
+            self.assertEqual([ result.ok for result in results ],
+                [ False, False, True, True, True, True, ])
+            self.assertEqual(results[0].errors[0].object_expr,
+                'object.readings[0]')
+            stream = validator.validate_stream(values)
+            self.assertEqual((await stream.__anext__()).index, 0)
+            await stream.aclose()
+
+        try:
+            _run(check())
+        finally:
+            validator.close()
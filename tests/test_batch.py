@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" 
+"""
+
+__status__ = "alpha"
+__version__ = "1.0.0a1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+
+# Unittest2
+from unittest2 import TestCase
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+
+# JSON Schema Toolkit
+from json_schema_toolkit import batch
+from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
+    JSONStringField
+from json_schema_toolkit.validator import CompiledValidator
+
+
+class ReadingDocument(JSONDocument):
+
+    sensor = JSONStringField(title = u'sensor', min_length = 1)
+    reading = JSONIntegerField(title = u'reading', min_value = 0,
+        max_value = 100)
+
+    class Meta(object):
+        title = u'reading'
+        description = u'a sensor reading'
+
+
+RECORDS = [ { 'sensor' : u's%d' % index, 'reading' : index % 150 }
+    for index in range(1000) ]
+
+INVALID = [ index for index in range(1000) if index % 150 > 100 ]
+
+
+class ValidateManyTestCase(TestCase):
+
+    def assertResults(self, results, fail_fast = False):
+        if fail_fast:
+            self.assertEqual(len(results), INVALID[0] + 1)
+        else:
+            self.assertEqual(len(results), len(RECORDS))
+        self.assertEqual([ result.index for result in results ],
+            list(range(len(results))))
+        self.assertEqual([ result.index for result in results
+            if not result.ok ], [ index for index in INVALID
+            if index < len(results) ])
+        error = results[INVALID[0]].errors[0]
+        self.assertEqual(error.new_message, u'Object is greater than the maximum')
+        self.assertEqual(error.object_expr, u'object.reading')
+
+
+    def test_serial(self):
+        self.assertResults(ReadingDocument.validate_many(iter(RECORDS),
+            chunk_size = 64))
+        self.assertResults(ReadingDocument.validate_many(iter(RECORDS),
+            chunk_size = 64, fail_fast = True), fail_fast = True)
+
+
+    def test_thread(self):
+        self.assertResults(ReadingDocument.validate_many(RECORDS, workers = 3,
+            executor = 'thread', chunk_size = 64))
+        self.assertResults(ReadingDocument.validate_many(RECORDS, workers = 3,
+            executor = 'thread', chunk_size = 64, fail_fast = True),
+            fail_fast = True)
+
+
+    def test_process_with_compiled_validator(self):
+        validator = CompiledValidator.for_document(ReadingDocument)
+        self.assertResults(ReadingDocument.validate_many(RECORDS, workers = 2,
+            executor = 'process', chunk_size = 256, validator = validator))
+
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, ReadingDocument.validate_many, RECORDS,
+            executor = 'fiber')
+        self.assertRaises(ValueError, ReadingDocument.validate_many, RECORDS,
+            chunk_size = 0)
+
+
+class ValidateColumnsTestCase(TestCase):
+
+    def assertAgrees(self, report, records, validator):
+        invalid = []
+        for index, record in enumerate(records):
+            try:
+                validator(record)
+            except ValidationError:
+                invalid.append(index)
+        self.assertEqual(report.count, len(records))
+        self.assertEqual(report.invalid, invalid)
+        self.assertEqual(report.ok, not invalid)
+
+
+    def test_columns(self):
+        validator = CompiledValidator.for_document(ReadingDocument)
+        report = ReadingDocument.validate_columns(RECORDS)
+        self.assertEqual(report.failures, { 'reading' : INVALID, })
+        self.assertAgrees(report, RECORDS, validator)
+        records = RECORDS[:10] + [ {}, [], { 'sensor' : u'', 'reading' : 5 },
+            { 'sensor' : u's', 'reading' : True }, { 'sensor' : 1,
+            'reading' : float('nan') }, { 'sensor' : u's', 'reading' : 2 ** 70 },
+            { 'sensor' : u's', 'reading' : 1.5 }, ]
+        report = ReadingDocument.validate_columns(iter(records))
+        self.assertEqual(report.failures, { None : [ 11, ],
+            'sensor' : [ 10, 12, 14, ], 'reading' : [ 10, 14, 15, 16, ], })
+        self.assertAgrees(report, records, validator)
+
+
+    def test_rows(self):
+        schema = { 'type' : 'object', 'additionalProperties' : False,
+            'properties' : { 'reading' : { 'type' : 'integer', }, }, }
+        records = [ { 'reading' : 1 }, { 'reading' : 1, 'sensor' : u's' },
+            { 'reading' : u'1' }, ]
+        report = batch.validate_columns(schema, records)
+        self.assertEqual(report.failures, { None : [ 1, 2, ], })
+        self.assertAgrees(report, records, CompiledValidator(schema))
+
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" 
+"""
+
+__status__ = "alpha"
+__version__ = "1.0.0a1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import datetime
+import decimal
+import io
+
+# Unittest2
+from unittest2 import TestCase
+
+# JSON Schema Toolkit
+from json_schema_toolkit import codec
+from json_schema_toolkit.document import JSONDocument, JSONStringField, \
+    JSONDateTimeField, JSONTimeDeltaField
+
+
+class EventDocument(JSONDocument):
+
+    name = JSONStringField(title = u'name')
+    when = JSONDateTimeField(title = u'when')
+    duration = JSONTimeDeltaField(title = u'duration')
+
+
+class CodecTestCase(TestCase):
+
+    def test_registry(self):
+        self.assertIn('json', codec.codecs())
+        self.assertIs(codec.get_codec('json'), codec.get_codec(
+            codec.get_codec('json')))
+        self.assertRaises(ValueError, codec.get_codec, 'missing')
+        default = codec.get_codec().name
+        try:
+            codec.set_default('json')
+            self.assertEqual('json', codec.get_codec().name)
+        finally:
+            codec.set_default(default)
+
+    def test_default_codec(self):
+        # the standard library json module, whatever else is installed
+        self.assertEqual('json', codec.get_codec().name)
+        value = { 'big' : 2 ** 70, 'ratio' : decimal.Decimal('1.5'),
+            'count' : decimal.Decimal('3'), }
+        self.assertEqual({ 'big' : 2 ** 70, 'ratio' : 1.5, 'count' : 3, },
+            codec.get_codec().decode(codec.get_codec().encode(value)))
+        self.assertEqual(u'1180591620717411303424', codec.get_codec().encode(
+            2 ** 70))
+
+    def test_codecs_agree(self):
+        value = {
+            'name' : u'café "\\\n',
+            'when' : datetime.datetime(2013, 6, 16, 12, 0, 0),
+            'duration' : datetime.timedelta(days = 1, seconds = 2),
+            'items' : [ 1, 2.5, None, True, {}, ],
+            'amount' : decimal.Decimal('2.25'),
+        }
+        decoded = dict(value, when = u'2013-06-16T12:00:00Z',
+            duration = u'1d 2s 0us', amount = 2.25)
+        for name in codec.codecs():
+            json_codec = codec.get_codec(name)
+            encoded = json_codec.encode(value)
+            self.assertIsInstance(encoded, type(u''), name)
+            self.assertEqual(decoded, json_codec.decode(encoded), name)
+            self.assertEqual(decoded, json_codec.decode(
+                json_codec.encode_bytes(value)), name)
+            self.assertEqual(decoded, json_codec.decode(bytearray(
+                json_codec.encode_bytes(value))), name)
+
+    def test_document_codecs(self):
+        value = { 'name' : u'café', 'when' : u'2013-06-16T12:00:00Z',
+            'duration' : u'1d 2s 0us', }
+        for name in codec.codecs():
+            document = EventDocument.from_json(EventDocument(value).to_json(
+                codec = name), codec = name)
+            self.assertEqual(value, document.value)
+            document.when = datetime.datetime(2013, 6, 17, 12, 0, 0)
+            buffer = bytearray(b'[')
+            written = document.to_json(codec = name, buffer = buffer)
+            self.assertEqual(len(buffer) - 1, written)
+            self.assertEqual(u'2013-06-17T12:00:00Z', codec.get_codec(
+                name).decode(bytes(buffer[1:]))['when'])
+        raw = u'{"name":"a","when":"2013-06-16T12:00:00Z",' \
+            u'"duration":"0d 0s 0us"}'
+        output = io.BytesIO()
+        EventDocument.from_json(raw, lazy = True).to_json(buffer = output)
+        self.assertEqual(raw.encode('utf-8'), output.getvalue())
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" 
+"""
+
+__status__ = "alpha"
+__version__ = "1.0.0a1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Unittest2
+from unittest2 import TestCase, skipIf
+
+try:
+    # Django
+    import django
+    from django.conf import settings
+except ImportError:
+    django = None
+
+# JSON Schema Toolkit
+from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
+    JSONStringField, JSONObjectField
+
+
+class ProfileDocument(JSONDocument):
+
+    name = JSONStringField(title = u'name', min_length = 1)
+    age = JSONIntegerField(title = u'age', min_value = 0)
+    address = JSONObjectField(title = u'address', optional = True, content = {
+        'city' : JSONStringField(title = u'city'),
+    })
+
+
+def _profile_model():
+    """ Configures Django with an in-memory SQLite database, and returns a model
+    with a JSONDocumentModelField and its table created.
+    """
+    if not settings.configured:
+        settings.configure(DATABASES = { 'default' : {
+            'ENGINE' : 'django.db.backends.sqlite3', 'NAME' : ':memory:', } },
+            INSTALLED_APPS = [])
+        django.setup()
+    from django.db import connection, models
+    from json_schema_toolkit.django import JSONDocumentModelField
+
+    class Profile(models.Model):
+
+        profile = JSONDocumentModelField(document_class = ProfileDocument,
+            null = True)
+
+        class Meta(object):
+            app_label = 'json_schema_toolkit'
+
+    with connection.schema_editor() as editor:
+        editor.create_model(Profile)
+    return Profile
+
+
+@skipIf(django is None, 'Django is not installed')
+class JSONDocumentModelFieldTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.Profile = _profile_model()
+
+    def test_save_and_load(self):
+        from django.core.exceptions import ValidationError
+        Profile = self.Profile
+        p1 = Profile.objects.create(profile = { 'name' : u'Alexis',
+            'age' : 42, })
+        self.assertIsInstance(p1.profile, ProfileDocument)
+        p2 = Profile.objects.get(pk = p1.pk)
+        # decoding is deferred until the document is read
+        self.assertNotIsInstance(p2.__dict__['profile'], ProfileDocument)
+        document = p2.profile
+        self.assertIn('_lazy', document.__dict__)
+        self.assertEqual(document.age, 42)
+        raw = document.to_json()
+        p2.save()
+        self.assertIs(Profile.objects.get(pk = p1.pk).profile.to_json().__class__,
+            raw.__class__)
+        document.age = 43
+        document.address = { 'city' : u'London', }
+        p2.save()
+        p3 = Profile.objects.get(pk = p1.pk)
+        self.assertEqual(p3.profile.address.city, u'London')
+        self.assertEqual(p3.profile.age, 43)
+        p3.profile.age = -1
+        self.assertRaises(ValidationError, p3.save)
+        self.assertRaises(ValidationError, p3.full_clean)
+        self.assertEqual(Profile.objects.get(pk = p1.pk).profile.age, 43)
+        Profile.objects.create(profile = None)
+        self.assertEqual(Profile.objects.filter(profile = None).count(), 1)
+
+    def test_unchanged_documents_not_validated(self):
+        Profile = self.Profile
+        p1 = Profile.objects.create(profile = { 'name' : u'Alexis',
+            'age' : 42, })
+        p2 = Profile.objects.get(pk = p1.pk)
+        p2.profile.name
+        validations = []
+        p2.profile.__class__ = type('CountedDocument', (ProfileDocument, ),
+            { 'validate' : lambda document: validations.append(document), })
+        p2.save()
+        self.assertEqual(validations, [])
+        p2.profile.age = 44
+        p2.save()
+        self.assertEqual(validations, [ p2.profile, ])
+
+    def test_assigned_text_validated(self):
+        from django.core.exceptions import ValidationError
+        Profile = self.Profile
+        self.assertRaises(ValidationError,
+            Profile(profile = u'{"bad": 1}').save)
+        self.assertRaises(ValidationError, Profile(profile = u'{"bad"').save)
+        p1 = Profile.objects.create(profile = u'{"name": "Alexis", "age": 42}')
+        p1.profile = u'{"name": "Alexis", "age": -1}'
+        self.assertRaises(ValidationError, p1.save)
+        self.assertEqual(Profile.objects.get(pk = p1.pk).profile.age, 42)
+        # text loaded from the database is saved back without being read
+        p2 = Profile.objects.get(pk = p1.pk)
+        p2.save()
+        self.assertNotIsInstance(p2.__dict__['profile'], ProfileDocument)
+        p3 = Profile.objects.get(pk = p1.pk)
+        p3.profile = p2.__dict__['profile']
+        p3.save()
+        self.assertEqual(Profile.objects.get(pk = p1.pk).profile.age, 42)
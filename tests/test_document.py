@@ -39,12 +39,24 @@ __version__ = "1.0.0a1"
 __maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
 __author__ = (u"Alexis Petrounias <www.petrounias.org>", )
 
+# Python
+import datetime
+import time
+
 # Unittest2
 from unittest2 import TestCase
 
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+
 # JSON Schema Toolkit
+from json_schema_toolkit.compact import NumericArray, backends
 from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
-    JSONStringField, JSONListField, JSONObjectField
+    JSONStringField, JSONListField, JSONObjectField, JSONDateField, \
+    JSONURLField, JSONDateTimeField, JSONTimeField, JSONTimeDeltaField, \
+    JSONDecimalField, compile_pattern, parse_datetime, parse_date, \
+    parse_time, parse_timedelta
+from json_schema_toolkit.validator import CompiledValidator
 
 
 class JSONDocumentTestCase(TestCase):
@@ -127,3 +139,301 @@ class JSONDocumentTestCase(TestCase):
 
 
 
+
+    def test_schema_compiled_once_per_class(self):
+
+        class SimpleDocument(JSONDocument):
+
+            answer = JSONIntegerField(title = u'the answer')
+
+            class Meta(object):
+                title = u'oracle'
+                description = u'a repository of truth'
+
+        d1 = SimpleDocument({ 'answer' : 42 })
+        d2 = SimpleDocument({ 'answer' : 43 })
+        self.assertIs(d1._schema, SimpleDocument.document_schema)
+        self.assertIs(d1._schema, d2._schema)
+        self.assertIs(d1._fields, d2._fields)
+        self.assertRaises(TypeError, SimpleDocument.document_schema.__setitem__,
+            'title', u'another title')
+        self.assertRaises(TypeError, SimpleDocument._fields.pop, 'answer')
+
+
+    def test_inherited_and_added_fields(self):
+
+        class BaseDocument(JSONDocument):
+
+            answer = JSONIntegerField(title = u'the answer')
+
+            class Meta(object):
+                title = u'oracle'
+                description = u'a repository of truth'
+
+        class DerivedDocument(BaseDocument):
+
+            question = JSONStringField(title = u'the question', optional = True)
+
+        self.assertEqual(sorted(DerivedDocument._fields), ['answer', 'question'])
+        self.assertEqual(DerivedDocument.document_schema['title'], u'oracle')
+
+        BaseDocument.universe = JSONIntegerField(title = u'universe',
+            optional = True)
+        self.assertIn('universe', BaseDocument.document_schema['properties'])
+        self.assertIn('universe', DerivedDocument.document_schema['properties'])
+
+        d1 = DerivedDocument({ 'answer' : 42, 'universe' : 1 })
+        self.assertEqual(d1.universe, 1)
+
+        del BaseDocument.universe
+        self.assertNotIn('universe', BaseDocument._fields)
+        self.assertNotIn('universe', DerivedDocument._fields)
+
+
+    def test_compiled_patterns(self):
+
+        class PatternDocument(JSONDocument):
+
+            day = JSONDateField(title = u'day')
+            code = JSONStringField(title = u'code', pattern = r'^[A-Z]{3}$')
+            name = JSONStringField(title = u'name')
+
+        properties = PatternDocument.document_schema['properties']
+        self.assertIs(properties['day']['pattern'], JSONDateField.REGEX)
+        self.assertIs(properties['code']['pattern'],
+            compile_pattern(r'^[A-Z]{3}$'))
+        self.assertNotIn('pattern', properties['name'])
+        d1 = PatternDocument({ 'day' : u'06/16/2013', 'code' : u'ABC',
+            'name' : u'' })
+        self.assertEqual(d1.code, u'ABC')
+
+
+    def test_url_pattern_hostile_input(self):
+        for hostile in [ u'http://' + u'ab.' * 20000 + u'a!',
+            u'http://' + u'a.' * 20000 + u'!',
+            u'http://[' + u':1' * 20000 + u' ',
+            u'http://a.bc:' + u'1' * 40000 + u' ', ]:
+            start = time.time()
+            self.assertIsNone(JSONURLField.REGEX.match(hostile))
+            self.assertLess(time.time() - start, 1.0)
+        self.assertIsNotNone(JSONURLField.REGEX.match(
+            u'http://www.petrounias.org/software/json-schema-toolkit/'))
+
+
+    def test_field_descriptors(self):
+        class D1(JSONDocument):
+            name = JSONStringField(title = u'name')
+            address = JSONObjectField(title = u'address', content = {
+                'city' : JSONStringField(title = u'city'),
+            })
+        self.assertIs(D1.name, D1._fields['name'])
+        d1 = D1({ 'name' : u'a', 'address' : { 'city' : u'Athens', }, })
+        self.assertEqual(d1.name, u'a')
+        d1.name = u'b'
+        self.assertEqual(d1.name, u'b')
+        self.assertEqual(d1['name'].value, u'b')
+        del d1.name
+        self.assertEqual(d1.name, None)
+        d1.name = u'c'
+        self.assertEqual(d1.address.city, u'Athens')
+        # proxies are reused until the document is written to
+        address = d1.address
+        self.assertIs(d1.address, address)
+        d1.address.city = u'Patras'
+        self.assertIsNot(d1.address, address)
+        self.assertEqual(d1.address.city, u'Patras')
+
+
+    def test_delete_shares_structure(self):
+        class D1(JSONDocument):
+            address = JSONObjectField(title = u'address', content = {
+                'city' : JSONStringField(title = u'city'),
+                'street' : JSONStringField(title = u'street'),
+            })
+        d1 = D1({ 'address' : { 'city' : u'Athens', 'street' : u'Ermou', }, })
+        old = d1['address'].value
+        street = d1['address']['street']
+        revision = d1.revision
+        del d1.address.city
+        # holders of the previous value are not affected
+        self.assertEqual(old, { 'city' : u'Athens', 'street' : u'Ermou', })
+        self.assertEqual(d1['address'].value, { 'street' : u'Ermou', })
+        self.assertEqual(d1.revision, revision + 1)
+        # fragments of the remaining items stay attached
+        self.assertFalse(street.is_orphaned)
+        street.value = u'Athinas'
+        self.assertEqual(d1.address.street, u'Athinas')
+        self.assertRaises(KeyError, d1.address.__delitem__, 'city')
+        self.assertEqual(d1.revision, revision + 2)
+        del d1['address']
+        self.assertEqual(d1.value, {})
+
+
+    def test_is_valid(self):
+        class D1(JSONDocument):
+            name = JSONStringField(title = u'name')
+            address = JSONObjectField(title = u'address', content = {
+                'city' : JSONStringField(title = u'city'),
+                'number' : JSONIntegerField(title = u'number',
+                    optional = True),
+            })
+        d1 = D1({ 'name' : u'a', 'address' : { 'city' : u'Athens', }, })
+        self.assertTrue(d1.is_valid)
+        d1.address.number = u'one'
+        self.assertFalse(d1.is_valid)
+        d1.address.number = 1
+        self.assertTrue(d1.is_valid)
+        del d1.address.number
+        self.assertTrue(d1.is_valid)
+        # removing a required member is caught through its parent
+        del d1.address.city
+        self.assertFalse(d1.is_valid)
+        self.assertRaises(ValidationError, d1.validate)
+        d1.address = { 'city' : u'Patras', }
+        self.assertTrue(d1.is_valid)
+        d1.validate()
+
+
+    def test_compact_schema(self):
+        class D1(JSONDocument):
+            name = JSONStringField(title = u'name')
+            address = JSONObjectField(content = {
+                'city' : JSONStringField(optional = True),
+            })
+        self.assertFalse(hasattr(D1.name, '__dict__'))
+        properties = D1.document_schema['properties']
+        self.assertEqual(sorted(properties['name'].keys()),
+            [ '__fragment_cls', 'default', 'title', 'type', ])
+        city = properties['address']['properties']['city']
+        self.assertEqual(sorted(city.keys()),
+            [ '__fragment_cls', 'default', 'optional', 'type', ])
+        self.assertIs(D1.field_for_schema(properties['name']), D1.name)
+        self.assertIs(D1.field_for_schema(city),
+            D1.address.content['city'])
+        self.assertIs(D1.field_for_schema(D1({ 'name' : u'a',
+            'address' : {}, })['address']['city']._schema),
+            D1.address.content['city'])
+        self.assertIsNone(D1.field_for_schema({}))
+
+
+    def test_from_json(self):
+        class D1(JSONDocument):
+            name = JSONStringField(title = u'name')
+        raw = b'{"name": "a"}'
+        d1 = D1.from_json(raw, lazy = True)
+        self.assertIs(d1.to_json(), raw)
+        self.assertIn('_lazy', d1.__dict__)
+        self.assertEqual(d1.name, u'a')
+        self.assertNotIn('_lazy', d1.__dict__)
+        self.assertIs(d1.to_json(), raw)
+        d1.name = u'b'
+        self.assertEqual(d1.to_json(), b'{"name":"b"}')
+        self.assertEqual(D1.from_json(raw).name, u'a')
+        d2 = D1.from_json(b'{"name": 1}', lazy = True)
+        self.assertRaises(ValidationError, getattr, d2, 'name')
+        self.assertFalse(d2.is_valid)
+        self.assertRaises(ValidationError, D1.from_json, b'{"name": 1}')
+
+
+    def test_export_schema(self):
+        def address():
+            return JSONObjectField(title = u'address', content = {
+                'city' : JSONStringField(title = u'city', pattern = r'[A-Z]'),
+            })
+        class D1(JSONDocument):
+            home = address()
+            work = address()
+            tags = JSONListField(title = u'tags', content = [ address(), ])
+        exported = D1.export_schema()
+        self.assertEqual({ '$ref' : '#/definitions/address', },
+            exported['properties']['home'])
+        self.assertEqual({ '$ref' : '#/definitions/address', },
+            exported['properties']['tags']['items'][0])
+        self.assertEqual([ 'address', ], list(exported['definitions']))
+        self.assertEqual({ 'type' : 'string', 'title' : u'city',
+            'pattern' : u'[A-Z]', 'default' : None, },
+            exported['definitions']['address']['properties']['city'])
+        inlined = D1.export_schema(definitions = False)
+        self.assertNotIn('definitions', inlined)
+        self.assertEqual(exported['definitions']['address'],
+            inlined['properties']['work'])
+
+
+    def test_native_values(self):
+        class D1(JSONDocument):
+            when = JSONDateTimeField(title = u'when')
+            day = JSONDateField(title = u'day', null = True)
+            at = JSONTimeField(title = u'at')
+            took = JSONTimeDeltaField(title = u'took')
+            events = JSONListField(title = u'events', content = [
+                JSONObjectField(title = u'event', content = {
+                    'when' : JSONDateTimeField(title = u'event time'), }), ])
+        d1 = D1({ 'when' : u'2013-06-16T12:00:00Z', 'day' : None,
+            'at' : u'9:30', 'took' : u'1d 2s 3us',
+            'events' : [ { 'when' : u'2013-06-17T12:00:00Z' } ], })
+        when = d1['when'].native
+        self.assertEqual(datetime.datetime(2013, 6, 16, 12, 0, 0), when)
+        self.assertIs(when, d1['when'].native)
+        self.assertIsNone(d1['day'].native)
+        self.assertEqual(datetime.time(9, 30), d1['at'].native)
+        self.assertEqual(datetime.timedelta(1, 2, 3), d1['took'].native)
+        self.assertEqual(datetime.datetime(2013, 6, 17, 12, 0, 0),
+            d1['events'][0]['when'].native)
+        d1.when = datetime.datetime(2014, 1, 1, 0, 0, 0)
+        self.assertEqual(datetime.datetime(2014, 1, 1, 0, 0, 0),
+            d1['when'].native)
+        self.assertEqual(datetime.date(2013, 6, 16), parse_date(u'06/16/13'))
+        self.assertEqual(datetime.date(2013, 6, 16), parse_date(u'2013-06-16'))
+        self.assertRaises(ValueError, parse_date, u'2013-6-16')
+        self.assertEqual(datetime.time(23, 59, 1), parse_time(u'23:59:01'))
+        self.assertRaises(ValueError, parse_time, u'23:5')
+        self.assertRaises(ValueError, parse_datetime, u'2013-06-16T12:00:0xZ')
+        self.assertRaises(ValueError, parse_timedelta, u'1d 2s')
+
+    def test_compact_lists(self):
+        for backend in backends():
+            class D1(JSONDocument):
+                readings = JSONListField(title = u'readings', compact = backend,
+                    content = [ JSONIntegerField(title = u'reading',
+                        min_value = 0, max_value = 100), ])
+                meta = JSONObjectField(title = u'meta', optional = True,
+                    content = { 'scale' : JSONListField(title = u'scale',
+                        compact = backend, content = [
+                            JSONDecimalField(title = u'factor'), ]), })
+            value = { 'readings' : [ 1, 2, 3, ],
+                'meta' : { 'scale' : [ 0.5, 2.0, ], }, }
+            d1 = D1(value)
+            # the value given is not modified
+            self.assertIs(list, value['readings'].__class__)
+            self.assertIs(NumericArray, d1._value['readings'].__class__)
+            self.assertIs(NumericArray, d1._value['meta']['scale'].__class__)
+            self.assertEqual(2, d1.readings[1])
+            self.assertEqual([ 1, 2, 3, ], [ fragment.value for fragment in
+                d1['readings'] ])
+            self.assertEqual(u'{"readings":[1,2,3],"meta":{"scale":[0.5,2.0]}}',
+                d1.to_json(codec = 'json').replace(' ', ''))
+            # every item is validated, by the bounds of compact arrays
+            invalid = { 'readings' : [ 1, 101, ], }
+            self.assertRaises(ValidationError, D1, invalid)
+            validator = CompiledValidator.for_document(D1)
+            self.assertRaises(ValidationError, D1, invalid,
+                validator = validator)
+            d1 = D1({ 'readings' : [ 1, 2, 3, ], }, validator = validator)
+            d1.readings[1] = 101
+            self.assertFalse(d1.is_valid)
+            d1.readings[1] = 50
+            self.assertTrue(d1.is_valid)
+            # values an array cannot hold turn it into a list
+            d1.readings[1] = u'x'
+            self.assertFalse(d1._value['readings'].compact)
+            self.assertFalse(d1.is_valid)
+            d1.readings = [ 4, 5, ]
+            self.assertTrue(d1._value['readings'].compact)
+            del d1.readings[0]
+            self.assertEqual([ 5, ], d1._value['readings'])
+            self.assertTrue(d1.is_valid)
+            d2 = D1.from_json(d1.to_json(), lazy = True)
+            self.assertEqual(5, d2.readings[0])
+            self.assertIs(NumericArray, d2._value['readings'].__class__)
+        self.assertRaises(ValueError, JSONListField, compact = True,
+            content = [ JSONStringField(), ])
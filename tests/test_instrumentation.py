@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" 
+"""
+
+__status__ = "alpha"
+__version__ = "1.0.0a1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import datetime
+
+# Unittest2
+from unittest2 import TestCase
+
+# JSON Schema Toolkit
+from json_schema_toolkit import instrumentation
+from json_schema_toolkit.document import JSONDocument, JSONStringField, \
+    JSONObjectField, JSONDateTimeField
+
+
+class InstrumentationTestCase(TestCase):
+
+    def tearDown(self):
+        instrumentation.disable()
+
+    def test_events(self):
+        stats = instrumentation.Stats()
+        instrumentation.enable(stats)
+
+        class InstrumentedDocument(JSONDocument):
+            name = JSONStringField(title = u'name')
+            when = JSONDateTimeField(title = u'when', optional = True)
+            address = JSONObjectField(title = u'address', content = {
+                'city' : JSONStringField(title = u'city'),
+            })
+
+        key = instrumentation.class_key(InstrumentedDocument)
+        d1 = InstrumentedDocument({ 'name' : u'a',
+            'address' : { 'city' : u'Athens', }, })
+        d1.address.city = u'Patras'
+        d1.when = datetime.datetime(2013, 6, 16, 12, 0, 0)
+        self.assertTrue(d1.is_valid)
+        snapshot = stats.snapshot(reset = True)
+        self.assertEqual(snapshot['compile'][key]['count'], 1)
+        self.assertEqual(snapshot['validate'][key]['count'], 1)
+        self.assertEqual(snapshot['proxy'][key]['count'], 1)
+        self.assertEqual(snapshot['coerce']['datetime']['count'], 1)
+        self.assertIn(key + ':address.city', snapshot['validate_path'])
+        self.assertIn(key + ':when', snapshot['validate_path'])
+        self.assertGreaterEqual(sum(entry['count'] for entry in
+            snapshot['fragment'].values()), 3)
+        self.assertEqual(stats.snapshot(), {})
+        instrumentation.disable()
+        InstrumentedDocument({ 'name' : u'b', 'address' : { 'city' : u'a', }, })
+        self.assertEqual(stats.snapshot(), {})
+
+    def test_sampling(self):
+        events = []
+        instrumentation.enable(lambda event, key, seconds:
+            events.append(event), sample_rate = 0.5)
+        for index in range(1000):
+            start = instrumentation.sample()
+            if start is not None:
+                instrumentation.record('validate', 'key', start)
+        self.assertTrue(300 < len(events) < 700)
+        self.assertRaises(ValueError, instrumentation.enable, events.append,
+            sample_rate = 0)
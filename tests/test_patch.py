@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" 
+"""
+
+__status__ = "alpha"
+__version__ = "1.0.0a1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+
+# Python
+import copy
+
+# Unittest2
+from unittest2 import TestCase
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+
+# JSON Schema Toolkit
+from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
+    JSONStringField, JSONListField, JSONObjectField
+from json_schema_toolkit.patch import operations, parse_pointer, pointer, \
+    snapshot
+
+
+class ProfileDocument(JSONDocument):
+
+    name = JSONStringField(title = u'name', min_length = 1)
+    age = JSONIntegerField(title = u'age', optional = True, min_value = 0)
+    scores = JSONListField(title = u'scores', optional = True, compact = True,
+        content = [ JSONIntegerField(title = u'score', min_value = 0), ])
+    links = JSONObjectField(title = u'links', optional = True)
+
+
+PROFILE = { 'name' : u'Alexis', 'scores' : [ 3, 1, 4, ],
+    'links' : { 'a/b' : u'c', }, }
+
+
+class PatchTestCase(TestCase):
+
+    def test_pointer(self):
+        self.assertEqual(pointer(()), u'')
+        self.assertEqual(pointer(('links', 'a/b~', 0)), u'/links/a~1b~0/0')
+        self.assertEqual(parse_pointer(u'/links/a~1b~0/0'),
+            ('links', 'a/b~', '0'))
+        self.assertRaises(ValueError, parse_pointer, u'links')
+
+
+    def test_patch(self):
+        d1 = ProfileDocument(copy.deepcopy(PROFILE))
+        revision = d1.revision
+        d1.age = 41
+        d1.age = 42
+        d1.scores[0] = 5
+        del d1.scores[1]
+        d1.links['a/b'] = u'd'
+        patch = d1.patch(revision)
+        self.assertEqual(patch, [
+            { 'op' : 'add', 'path' : u'/age', 'value' : 42, },
+            { 'op' : 'replace', 'path' : u'/scores/0', 'value' : 5, },
+            { 'op' : 'remove', 'path' : u'/scores/1', },
+            { 'op' : 'replace', 'path' : u'/links/a~1b', 'value' : u'd', },
+        ])
+        self.assertEqual(d1.patch(revision, revision + 1), [
+            { 'op' : 'add', 'path' : u'/age', 'value' : 41, }, ])
+        self.assertEqual([ operation['path'] for operation in d1.patch(
+            revision, pointers = False) ], [ ('age', ), ('scores', 0, ),
+            ('scores', 1, ), ('links', 'a/b', ), ])
+        # insertions into lists move the items written before them
+        self.assertEqual(operations([
+            (1, 'add', ('scores', 1, ), 2),
+            (2, 'add', ('scores', 1, ), 3),
+            (3, 'replace', ('scores', 1, ), 4), ]), [
+            { 'op' : 'add', 'path' : u'/scores/1', 'value' : 2, },
+            { 'op' : 'add', 'path' : u'/scores/1', 'value' : 4, }, ])
+        d2 = ProfileDocument(copy.deepcopy(PROFILE))
+        d2.apply_patch(patch)
+        self.assertEqual(d2.value, d1.value)
+        self.assertEqual(d2.patch(0), patch)
+        # writes which are not recorded (here made directly through
+        # json_document) start the log over
+        d1['age']._lowlevel_set_value(43)
+        d1._bump_revision()
+        self.assertRaises(ValueError, d1.patch, revision)
+        d1.name = u'Alex'
+        self.assertRaises(ValueError, d1.patch, revision)
+        self.assertEqual(d1.patch(d1.revision - 1), [ { 'op' : 'replace',
+            'path' : u'/name', 'value' : u'Alex', }, ])
+        d1.discard_changes()
+        self.assertRaises(ValueError, d1.patch, d1.revision - 1)
+        self.assertEqual(d1.patch(d1.revision), [])
+
+
+    def test_apply_patch(self):
+        d1 = ProfileDocument(copy.deepcopy(PROFILE))
+        d1.apply_patch([
+            { 'op' : 'add', 'path' : u'/scores/-', 'value' : 9, },
+            { 'op' : 'add', 'path' : u'/scores/0', 'value' : 2, },
+            { 'op' : 'move', 'from' : u'/links/a~1b', 'path' : u'/links/e', },
+            { 'op' : 'copy', 'from' : u'/scores', 'path' : u'/links/f', },
+            { 'op' : 'test', 'path' : u'/links/e', 'value' : u'c', },
+        ])
+        self.assertEqual(d1.value, { 'name' : u'Alexis',
+            'scores' : [ 2, 3, 1, 4, 9, ], 'links' : { 'e' : u'c',
+            'f' : [ 2, 3, 1, 4, 9, ], }, })
+        value = snapshot(d1.value)
+        revision = d1.revision
+        for patch, error in [
+            ([ { 'op' : 'replace', 'path' : u'/age', 'value' : 1, }, ],
+                ValueError),
+            ([ { 'op' : 'remove', 'path' : u'/scores/0', },
+                { 'op' : 'test', 'path' : u'/name', 'value' : u'x', }, ],
+                ValueError),
+            ([ { 'op' : 'add', 'path' : u'/scores/9', 'value' : 1, }, ],
+                ValueError),
+            ([ { 'op' : 'move', 'from' : u'/links', 'path' : u'/links/g', },
+                ], ValueError),
+            ([ { 'op' : 'remove', 'path' : u'/links/e', },
+                { 'op' : 'replace', 'path' : u'/scores/1', 'value' : -1, }, ],
+                ValidationError),
+        ]:
+            self.assertRaises(error, d1.apply_patch, patch)
+            self.assertEqual(d1.value, value)
+        self.assertTrue(d1.is_valid)
+        # the operations undone are recorded along with the operations
+        d2 = ProfileDocument(snapshot(value))
+        d2.apply_patch(d1.patch(revision))
+        self.assertEqual(d2.value, value)
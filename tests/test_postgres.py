@@ -0,0 +1,562 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" 
+"""
+
+__status__ = "alpha"
+__version__ = "1.0.0a1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import io
+import json
+import os
+import random
+import re
+
+# Unittest2
+from unittest2 import TestCase, skipIf
+
+try:
+    # Django
+    import django
+    from django.conf import settings
+except ImportError:
+    django = None
+
+try:
+    # Psycopg2
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+
+# JSON Schema Toolkit
+from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
+    JSONDecimalField, JSONStringField, JSONObjectField, JSONListField, \
+    JSONDateTimeField
+from json_schema_toolkit.validator import CompiledValidator
+
+
+# connection string of a scratch database for the integration test
+POSTGRES_DSN = os.environ.get('JSON_SCHEMA_TOOLKIT_POSTGRES')
+
+
+class ProfileDocument(JSONDocument):
+
+    name = JSONStringField(title = u'name', min_length = 1,
+        pattern = r'[a-z]+')
+    age = JSONIntegerField(title = u'age', min_value = 0, optional = True)
+    kind = JSONStringField(title = u'kind', enum = [ u'a', u"b'c", ],
+        optional = True)
+    address = JSONObjectField(title = u'address', optional = True, content = {
+        'city' : JSONStringField(title = u'city'),
+    })
+    tags = JSONListField(title = u'tags', optional = True, content = [
+        JSONStringField(title = u'tag'), ])
+
+
+class SeriesDocument(JSONDocument):
+
+    levels = JSONListField(title = u'levels', compact = True, content = [
+        JSONIntegerField(title = u'level', min_value = 0, max_value = 10), ])
+    gauge = JSONObjectField(title = u'gauge', optional = True, content = {
+        'readings' : JSONListField(title = u'readings', compact = True,
+            content = [ JSONDecimalField(title = u'reading',
+            max_value = 1.5), ]),
+    })
+
+
+class EventDocument(JSONDocument):
+
+    name = JSONStringField(title = u'name', index = True)
+    count = JSONIntegerField(title = u'count', optional = True, index = True)
+    when = JSONDateTimeField(title = u'when', optional = True, index = True)
+    place = JSONObjectField(title = u'place', optional = True, content = {
+        'city' : JSONStringField(title = u'city', index = True),
+    })
+    labels = JSONObjectField(title = u'labels', optional = True,
+        index = True)
+
+
+def _partial_profile_model():
+    """ Configures Django (with an in-memory SQLite database, as for the tests
+    of JSONDocumentModelField) and returns a model with a
+    PartialJSONDocumentModelField, and one of events with indexes, without
+    creating their tables.
+    """
+    if not settings.configured:
+        settings.configure(DATABASES = { 'default' : {
+            'ENGINE' : 'django.db.backends.sqlite3', 'NAME' : ':memory:', } },
+            INSTALLED_APPS = [])
+        django.setup()
+    from django.db import models
+    from json_schema_toolkit.django.postgres import \
+        PartialJSONDocumentModelField
+
+    from json_schema_toolkit.django.postgres import document_indexes
+
+    class PartialProfile(models.Model):
+
+        profile = PartialJSONDocumentModelField(
+            document_class = ProfileDocument, null = True)
+
+        class Meta(object):
+            app_label = 'json_schema_toolkit'
+
+    class Event(models.Model):
+
+        event = PartialJSONDocumentModelField(document_class = EventDocument)
+
+        class Meta(object):
+            app_label = 'json_schema_toolkit'
+            indexes = document_indexes(EventDocument, 'event')
+
+    return PartialProfile, Event
+
+
+class _CopyConnection(object):
+    """ Connection recording the statements and data of COPY.
+    """
+
+    def __init__(self):
+        self.copies = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def copy_expert(self, sql, source):
+        self.copies.append((sql, source.read()))
+
+
+@skipIf(django is None, "Django is not installed")
+class CheckConstraintTestCase(TestCase):
+
+    def test_check_constraint_sql(self):
+        from json_schema_toolkit.django.postgres import check_constraint_sql
+        sql = check_constraint_sql(ProfileDocument, 'profile')
+        self.assertIn("""(jsonb_typeof("profile") IN ('object'))""", sql)
+        self.assertIn("""CASE WHEN jsonb_typeof("profile") = 'object' THEN """
+            """("profile" #> ARRAY['name']) IS NOT NULL ELSE TRUE END""", sql)
+        self.assertNotIn("""("profile" #> ARRAY['age']) IS NOT NULL""", sql)
+        self.assertIn("""("profile" #>> ARRAY['age']) ~ '^-?[0-9]+$'""", sql)
+        self.assertIn("""("profile" #>> ARRAY['age'])::numeric >= 0""", sql)
+        self.assertIn("""char_length(("profile" #>> ARRAY['name'])) >= 1""",
+            sql)
+        self.assertIn("""("profile" #>> ARRAY['name']) ~ '^([a-z]+)'""", sql)
+        self.assertIn("""("profile" #> ARRAY['kind'])::jsonb IN """
+            """('"a"'::jsonb, '"b''c"'::jsonb)""", sql)
+        self.assertIn("""("profile" #> ARRAY['address', 'city'])""", sql)
+        self.assertIn("""jsonb_array_length(("profile" #> ARRAY['tags'])) """
+            """>= 1""", sql)
+        self.assertIn("""("profile" #> ARRAY['tags', '0'])""", sql)
+        self.assertIn('json_typeof(', check_constraint_sql(ProfileDocument,
+            'profile', 'json'))
+        self.assertIn('("profile"::jsonb)', check_constraint_sql(
+            ProfileDocument, 'profile', 'text'))
+        self.assertRaises(ValueError, check_constraint_sql, ProfileDocument,
+            'profile', 'hstore')
+
+    def test_check_constraint_sql_of_items(self):
+        from json_schema_toolkit.django.postgres import check_constraint_sql
+        sql = check_constraint_sql(SeriesDocument, 'series')
+        self.assertIn("""CASE WHEN jsonb_typeof(("series" #> """
+            """ARRAY['levels'])) = 'array' THEN NOT jsonb_path_exists("""
+            """("series" #> ARRAY['levels']), 'strict $[*] ? ("""
+            """!(@.type() == "number") || """
+            """(@.type() == "number" && @.floor() != @) || """
+            """(@.type() == "number" && @ < 0) || """
+            """(@.type() == "number" && @ > 10))') ELSE TRUE END""", sql)
+        self.assertIn("""jsonb_path_exists(("series" #> """
+            """ARRAY['gauge', 'readings']), 'strict $[*] ? (""", sql)
+        self.assertIn("""(@.type() == "number" && @ > 1.5))')""", sql)
+        self.assertIn("""jsonb_path_exists(("series" #> """
+            """ARRAY['levels'])::jsonb, """, check_constraint_sql(
+            SeriesDocument, 'series', 'json'))
+
+    def test_add_check_constraint(self):
+        from json_schema_toolkit.django.postgres import add_check_constraint
+        operation = add_check_constraint('app_profile', 'profile',
+            'profile_schema', ProfileDocument)
+        self.assertTrue(operation.sql.startswith('ALTER TABLE "app_profile" '
+            'ADD CONSTRAINT "profile_schema" CHECK ('))
+        self.assertEqual('ALTER TABLE "app_profile" DROP CONSTRAINT '
+            '"profile_schema"', operation.reverse_sql)
+
+    @skipIf(POSTGRES_DSN is None or psycopg2 is None,
+        "JSON_SCHEMA_TOOLKIT_POSTGRES is not set")
+    def test_check_constraint_agrees_with_validator(self):
+        from json_schema_toolkit.django.postgres import check_constraint_sql
+        documents = [
+            { 'name' : u'abc', },
+            { 'name' : u'abc', 'age' : 3, 'kind' : u"b'c",
+                'address' : { 'city' : u'x', }, 'tags' : [ u'y', ], },
+            { 'name' : u'', },
+            { 'name' : u'ABC', },
+            { 'age' : 3, },
+            { 'name' : u'abc', 'age' : -1, },
+            { 'name' : u'abc', 'age' : 1.5, },
+            { 'name' : u'abc', 'kind' : u'c', },
+            { 'name' : u'abc', 'address' : {}, },
+            { 'name' : u'abc', 'tags' : [], },
+            { 'name' : u'abc', 'tags' : [ 1, ], },
+            [ u'abc', ],
+        ]
+        series = [
+            { 'levels' : [], },
+            { 'levels' : [ 0, 5, 10, ], 'gauge' : { 'readings' : [ 1.5, -2, ],
+                }, },
+            { 'levels' : [ -5, ], },
+            { 'levels' : [ 3, 99, ], },
+            { 'levels' : [ 3, u'x', ], },
+            { 'levels' : [ 3, 2.5, ], },
+            { 'levels' : [ [ 3, ], ], },
+            { 'levels' : [ 3, ], 'gauge' : { 'readings' : [ 0, 1.75, ], }, },
+            { 'levels' : [ 3, ], 'gauge' : { 'readings' : [ None, ], }, },
+        ]
+        connection = psycopg2.connect(POSTGRES_DSN)
+        try:
+            cursor = connection.cursor()
+            for column_type in ('jsonb', 'json', 'text', ):
+                self._check_agreement(cursor, ProfileDocument, 'profiles',
+                    documents, column_type)
+                self._check_agreement(cursor, SeriesDocument, 'series',
+                    series, column_type)
+        finally:
+            connection.rollback()
+            connection.close()
+
+    def _check_agreement(self, cursor, document_class, table, documents,
+        column_type):
+        from json_schema_toolkit.django.postgres import check_constraint_sql
+        validator = CompiledValidator.for_document(document_class)
+        cursor.execute('CREATE TEMPORARY TABLE %s_%s (document %s CHECK (%s))'
+            % (table, column_type, column_type, check_constraint_sql(
+            document_class, 'document', column_type).replace('%', '%%')))
+        for document in documents:
+            cursor.execute('SAVEPOINT document')
+            try:
+                cursor.execute('INSERT INTO %s_%s VALUES (%%s)' % (table,
+                    column_type), (json.dumps(document), ))
+                accepted = True
+            except psycopg2.IntegrityError:
+                cursor.execute('ROLLBACK TO SAVEPOINT document')
+                accepted = False
+            try:
+                validator(document)
+                valid = True
+            except ValidationError:
+                valid = False
+            self.assertEqual(valid, accepted, (column_type, document))
+
+    def test_bulk_load(self):
+        from json_schema_toolkit.django.postgres import bulk_load
+        records = [ { 'name' : u'a\\b\tc', 'age' : index, } for index in
+            range(5) ] + [ '{"name": "abc"}', { 'name' : u'ABC', }, '{' ]
+        connection = _CopyConnection()
+        rejects = io.StringIO()
+        reports = []
+        report = bulk_load(connection, 'profiles', 'profile', ProfileDocument,
+            iter(records), rejects = rejects, executor = 'thread', workers = 2,
+            chunk_size = 2, batch_size = 3, progress = reports.append)
+        self.assertEqual((6, 2), (report.loaded, report.rejected))
+        self.assertEqual([ 4, 6, ], [ r.loaded for r in reports ])
+        self.assertEqual('COPY "profiles" ("profile") FROM STDIN',
+            connection.copies[0][0])
+        rows = u''.join(data for sql, data in connection.copies).splitlines()
+        self.assertEqual(6, len(rows))
+        # backslashes of the encoding are escaped for COPY
+        self.assertEqual(r'{"name":"a\\\\b\\tc","age":0}', rows[0])
+        rejected = [ json.loads(line) for line in
+            rejects.getvalue().splitlines() ]
+        self.assertEqual([ 6, 7, ], [ reject['index'] for reject in rejected ])
+        self.assertEqual('object.name', rejected[0]['errors'][0]['object_expr'])
+        self.assertEqual(u'{"name":"ABC"}', rejected[0]['record'])
+        self.assertEqual(u'{', rejected[1]['record'])
+
+
+@skipIf(django is None, "Django is not installed")
+class PartialUpdateTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.PartialProfile, cls.Event = _partial_profile_model()
+
+    def test_partial_update_sql(self):
+        from json_schema_toolkit.django.postgres import partial_update_sql
+        sql, params = partial_update_sql('profile', [
+            { 'op' : 'replace', 'path' : ('age', ), 'value' : 3, },
+            { 'op' : 'add', 'path' : ('tags', 0, ), 'value' : u'x', },
+            { 'op' : 'remove', 'path' : ('address', 'city', ), },
+        ], 'text')
+        self.assertEqual('((jsonb_insert(jsonb_set("profile"::jsonb, '
+            '%s::text[], %s::jsonb), %s::text[], %s::jsonb) #- %s::text[]))'
+            '::text', sql)
+        self.assertEqual([ [ u'age', ], u'3', [ u'tags', u'0', ], u'"x"',
+            [ u'address', u'city', ], ], params)
+        self.assertEqual(('"profile"', []), partial_update_sql('profile', []))
+        self.assertRaises(ValueError, partial_update_sql, 'profile', [
+            { 'op' : 'replace', 'path' : (), 'value' : {}, }, ])
+        self.assertRaises(ValueError, partial_update_sql, 'profile', [
+            { 'op' : 'move', 'path' : ('age', ), 'from' : ('kind', ), }, ])
+
+    def test_partial_save(self):
+        from django.db.models import signals
+        PartialProfile = self.PartialProfile
+        field = PartialProfile._meta.get_field('profile')
+        self.assertEqual('jsonb', field.db_type(None))
+        # as loaded by a queryset, which converts values with from_db_value
+        p1 = PartialProfile.from_db('default', [ 'id', 'profile', ],
+            [ 1, field.from_db_value(json.dumps({ 'name' : u'abc', 'age' : 3,
+            'tags' : [ u'x', u'a' * 200, ], }), None, None), ])
+        # never read, so unchanged
+        self.assertEqual('"profile"', field.pre_save(p1, False).sql)
+        p1.profile.age = 4
+        p1.profile.address = { 'city' : u'x', }
+        update = field.pre_save(p1, False)
+        self.assertEqual('jsonb_set(jsonb_set("profile", %s::text[], '
+            '%s::jsonb), %s::text[], %s::jsonb)', update.sql)
+        self.assertEqual([ [ u'age', ], 4, [ u'address', ],
+            { 'city' : u'x', }, ], [ param if isinstance(param, list) else
+            json.loads(param) for param in update.params ])
+        signals.post_save.send(sender = PartialProfile, instance = p1,
+            created = False, update_fields = None)
+        self.assertEqual('"profile"', field.pre_save(p1, False).sql)
+        # a partial update larger than the document is not cheaper
+        p1.profile.name = u'a' * 1000
+        self.assertEqual(u'a' * 1000, json.loads(field.pre_save(p1,
+            False))['name'])
+        signals.post_save.send(sender = PartialProfile, instance = p1,
+            created = False, update_fields = None)
+        p1.profile.tags[0] = u'y'
+        self.assertEqual([ [ u'tags', u'0', ], u'"y"', ],
+            field.pre_save(p1, False).params)
+        # saving other fields does not record the document as saved
+        signals.post_save.send(sender = PartialProfile, instance = p1,
+            created = False, update_fields = frozenset([ 'id', ]))
+        self.assertEqual([ [ u'tags', u'0', ], u'"y"', ],
+            field.pre_save(p1, False).params)
+        # assigned documents, and added instances, are written whole
+        p1.profile = { 'name' : u'abc', }
+        self.assertEqual({ 'name' : u'abc', }, json.loads(field.pre_save(p1,
+            False)))
+        p2 = PartialProfile(profile = { 'name' : u'abc', })
+        self.assertEqual({ 'name' : u'abc', }, json.loads(field.pre_save(p2,
+            True)))
+
+    @skipIf(POSTGRES_DSN is None or psycopg2 is None,
+        "JSON_SCHEMA_TOOLKIT_POSTGRES is not set")
+    def test_partial_update_agrees_with_document(self):
+        from json_schema_toolkit.django.postgres import partial_update_sql
+        generator = random.Random(7)
+        connection = psycopg2.connect(POSTGRES_DSN)
+        try:
+            cursor = connection.cursor()
+            for column_type in ('jsonb', 'json', 'text', ):
+                cursor.execute('CREATE TEMPORARY TABLE partial_%s '
+                    '(profile %s)' % (column_type, column_type))
+                document = ProfileDocument({ 'name' : u'abc',
+                    'tags' : [ u'x', u'y', ], })
+                cursor.execute('INSERT INTO partial_%s VALUES (%%s)' % (
+                    column_type, ), (document.to_json(), ))
+                for iteration in range(50):
+                    revision = document.revision
+                    for write in range(generator.randint(1, 4)):
+                        self._write(generator, document)
+                    sql, params = partial_update_sql('profile',
+                        document.patch(revision, pointers = False),
+                        column_type)
+                    cursor.execute('UPDATE partial_%s SET profile = %s' % (
+                        column_type, sql), params)
+                    cursor.execute('SELECT profile::text FROM partial_%s' % (
+                        column_type, ))
+                    self.assertEqual(json.loads(document.to_json()),
+                        json.loads(cursor.fetchone()[0]))
+        finally:
+            connection.rollback()
+            connection.close()
+
+    def _write(self, generator, document):
+        choice = generator.randint(0, 5)
+        value = document.value
+        if choice == 0:
+            document.age = generator.randint(0, 100)
+        elif choice == 1:
+            document.address = { 'city' : generator.choice(u'abc'), }
+        elif choice == 2 and 'address' in value:
+            document.address.city = generator.choice(u'abc')
+        elif choice == 3 and 'address' in value:
+            del document.address
+        elif choice == 4:
+            document.apply_patch([ { 'op' : 'add', 'path' : u'/tags/%d' %
+                generator.randint(0, len(value['tags'])), 'value' :
+                generator.choice(u'abc'), }, ], validate = False)
+        elif len(value['tags']) > 1:
+            del document.tags[generator.randrange(len(value['tags']))]
+
+    def test_index_sql(self):
+        from json_schema_toolkit.django.postgres import index_sql, \
+            add_indexes
+        statements = index_sql(EventDocument, 'events', 'event')
+        self.assertTrue(statements[0].startswith('CREATE OR REPLACE FUNCTION '
+            'json_schema_toolkit_timestamptz(text) RETURNS timestamptz'))
+        self.assertEqual([
+            """ON "events" USING btree (((("event" #>> ARRAY['count']))"""
+                """::bigint))""",
+            """ON "events" USING gin ((("event" #> ARRAY['labels'])) """
+                """jsonb_path_ops)""",
+            """ON "events" USING btree ((("event" #>> ARRAY['name'])))""",
+            """ON "events" USING btree ((("event" #>> ARRAY['place', """
+                """'city'])))""",
+            """ON "events" USING btree ((json_schema_toolkit_timestamptz("""
+                """("event" #>> ARRAY['when']))))""",
+        ], [ re.sub('^CREATE INDEX "events_event_[0-9a-f]{6}_(idx|gin)" ', '',
+            statement) for statement in statements[1:] ])
+        self.assertIn('("event"::jsonb)', index_sql(EventDocument, 'events',
+            'event', 'text')[1])
+        operation = add_indexes('events', 'event', EventDocument)
+        self.assertEqual(statements, operation.sql)
+        self.assertEqual(5, len(operation.reverse_sql))
+
+    def test_document_indexes(self):
+        from json_schema_toolkit.django.postgres import JSONDocumentIndex, \
+            index_sql
+        indexes = self.Event._meta.indexes
+        self.assertEqual(5, len(indexes))
+        self.assertEqual([ index.name for index in indexes ], [
+            re.match('CREATE INDEX "([^"]+)"', statement).group(1) for statement
+            in index_sql(EventDocument, self.Event._meta.db_table, 'event')[1:]
+            ])
+        self.assertEqual(indexes[4].create_sql(self.Event, None), ';\n'.join(
+            index_sql(EventDocument, self.Event._meta.db_table, 'event')[::5]))
+        path, args, kwargs = indexes[0].deconstruct()
+        self.assertEqual((('count', ), 'bigint', 'btree', 'event', ),
+            (kwargs['path'], kwargs['cast'], kwargs['method'],
+            kwargs['field']))
+        self.assertEqual(indexes[0], JSONDocumentIndex(*args, **kwargs))
+        self.assertRaises(ValueError, JSONDocumentIndex, 'event', ('count', ),
+            method = 'hash')
+
+    def test_document_indexes_named(self):
+        import django
+        from json_schema_toolkit.django.postgres import document_indexes, \
+            index_sql
+        # named without the model, as Django < 2.0 requires
+        indexes = document_indexes(EventDocument, 'event', table = 'events')
+        names = [ re.match('CREATE INDEX "([^"]+)"', statement).group(1)
+            for statement in index_sql(EventDocument, 'events', 'event')[1:] ]
+        self.assertEqual(names, [ index.name for index in indexes ])
+        indexes[0].set_name_with_model(self.Event)
+        self.assertEqual(names[0], indexes[0].name)
+        version = django.VERSION
+        django.VERSION = (1, 11, 0, 'final', 0)
+        try:
+            self.assertRaises(ValueError, document_indexes, EventDocument,
+                'event')
+            self.assertEqual(names, [ index.name for index in
+                document_indexes(EventDocument, 'event', table = 'events') ])
+        finally:
+            django.VERSION = version
+
+    def test_lookups(self):
+        from django.core.exceptions import FieldError
+        Event = self.Event
+        sql, params = Event.objects.filter(event__count__gte = 3,
+            event__place__city = u'x', event__labels__a = u'b').query.\
+            sql_with_params()
+        table = '"%s"."event"' % Event._meta.db_table
+        self.assertIn("""((%s #>> ARRAY['count']))::bigint >= %%s""" % table,
+            sql)
+        self.assertIn("""(%s #>> ARRAY['place', 'city']) = %%s""" % table,
+            sql)
+        self.assertIn("""(%s #> ARRAY['labels', 'a'])""" % table, sql)
+        self.assertEqual(3, params[0])
+        self.assertRaises(FieldError, Event.objects.filter,
+            event__place__country = u'x')
+        self.assertRaises(FieldError, Event.objects.filter,
+            event__name__first = u'x')
+
+    @skipIf(POSTGRES_DSN is None or psycopg2 is None,
+        "JSON_SCHEMA_TOOLKIT_POSTGRES is not set")
+    def test_lookups_use_indexes(self):
+        from django.db import connections
+        from django.db.backends.postgresql.base import DatabaseWrapper
+        from json_schema_toolkit.django.postgres import index_sql
+        Event = self.Event
+        table = Event._meta.db_table
+        # queries are compiled for PostgreSQL, and run by psycopg2
+        compiler = DatabaseWrapper(dict(connections['default'].settings_dict,
+            ENGINE = 'django.db.backends.postgresql'), 'postgresql')
+        connection = psycopg2.connect(POSTGRES_DSN)
+        try:
+            cursor = connection.cursor()
+            cursor.execute('CREATE TEMPORARY TABLE "%s" (id serial, '
+                'event jsonb)' % table)
+            for statement in index_sql(EventDocument, table, 'event'):
+                cursor.execute(statement)
+            for index in range(1000):
+                cursor.execute('INSERT INTO "%s" (event) VALUES (%%s)' % table,
+                    (json.dumps({ 'name' : u'e%d' % index, 'count' : index,
+                    'when' : u'2013-06-16T12:%02d:00Z' % (index % 60),
+                    'place' : { 'city' : u'c%d' % (index % 10), },
+                    'labels' : { 'a' : u'b%d' % index, }, }), ))
+            cursor.execute('ANALYZE "%s"' % table)
+            cursor.execute('SET enable_seqscan = off')
+            for queryset, count in (
+                (Event.objects.filter(event__count__gte = 995), 5),
+                (Event.objects.filter(event__name = u'e7'), 1),
+                (Event.objects.filter(event__place__city = u'c3'), 100),
+                (Event.objects.filter(event__when__lt =
+                    u'2013-06-16T12:01:00Z'), 17),
+                (Event.objects.filter(event__labels__contains =
+                    { 'a' : u'b5', }), 1), ):
+                sql, params = queryset.query.get_compiler(
+                    connection = compiler).as_sql()
+                cursor.execute('EXPLAIN ' + sql, params)
+                self.assertIn('Index', u''.join(row[0] for row in
+                    cursor.fetchall()), sql)
+                cursor.execute(sql, params)
+                self.assertEqual(count, len(cursor.fetchall()), sql)
+        finally:
+            connection.rollback()
+            connection.close()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" 
+"""
+
+__status__ = "alpha"
+__version__ = "1.0.0a1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+
+# Python
+import io
+import json
+
+# Unittest2
+from unittest2 import TestCase
+
+# JSON Schema Toolkit
+from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
+    JSONStringField, JSONListField, JSONObjectField
+
+
+class HistoryDocument(JSONDocument):
+
+    source = JSONStringField(title = u'source', min_length = 2)
+    events = JSONListField(title = u'events',
+        description = u'important historical events', content = [
+            JSONObjectField(title = u'event',
+                description = u'important historical event', content = {
+                    'title' : JSONStringField(title = u'event title'),
+                    'importance' : JSONIntegerField(title = u'event importance',
+                        max_value = 10),
+                }),
+        ])
+
+    class Meta(object):
+        title = u'history'
+        description = u'a collection of historical events'
+
+
+def errors(item):
+    return [ (error.new_message, error.object_expr, error.schema_expr)
+        for error in item.errors ]
+
+
+class ValidateStreamTestCase(TestCase):
+
+    def test_items_in_chunks(self):
+        value = { 'source' : u'atlantis', 'events' : [
+            { 'title' : u'Sinking of Atlantis', 'importance' : 3 },
+            { 'title' : u'Discovery of Atlantis', 'importance' : 7 },
+            { 'title' : u'Colonization of Atlantis', 'importance' : 12 },
+        ] }
+        data = json.dumps(value).encode('utf-8')
+        for chunk_size in [ 1, 5, 4096 ]:
+            items = list(HistoryDocument.validate_stream(io.BytesIO(data),
+                'events', chunk_size = chunk_size))
+            self.assertEqual([ item.index for item in items ], [ 0, 1, 2 ])
+            self.assertEqual([ item.value for item in items ],
+                value['events'])
+            self.assertEqual([ item.ok for item in items ],
+                [ True, True, False ])
+            self.assertEqual(errors(items[2]), [ (u'Object is greater than '
+                u'the maximum', u'object.events[2].importance',
+                u'schema.properties.eventsitems[0].properties.importance.'
+                u'maximum') ])
+        # with positional item schemas, only the first item is validated
+        items = list(HistoryDocument.validate_stream(io.BytesIO(data),
+            'events', homogeneous = False))
+        self.assertTrue(all(item.ok for item in items))
+
+
+    def test_errors(self):
+        chunks = [ b'{"source": "a", "events": [{"title": 1, "imp',
+            b'ortance": 1}, {"title": "x", "importance": 1}]}' ]
+        items = list(HistoryDocument.validate_stream(chunks, 'events'))
+        self.assertEqual([ item.index for item in items ], [ None, 0, 1 ])
+        self.assertEqual(errors(items[0]), [ (u'Object does not meet the '
+            u'minimum length', u'object.source',
+            u'schema.properties.source.minLength') ])
+        self.assertEqual(errors(items[1]), [ (u'Object has incorrect type '
+            u'(expected string)', u'object.events[0].title',
+            u'schema.properties.eventsitems[0].properties.title.type') ])
+        self.assertTrue(items[2].ok)
+
+
+    def test_malformed_item(self):
+        read = []
+        def chunks():
+            yield b'{"source": "ab", "events": [{"title": x}, '
+            for index in range(1000):
+                read.append(index)
+                yield b'{"title": "y", "importance": 1}, '
+            yield b'{"title": "y"}]}'
+        items = HistoryDocument.validate_stream(chunks(), 'events',
+            chunk_size = 64)
+        self.assertRaises(ValueError, list, items)
+        # the rest of the input is not read
+        self.assertTrue(len(read) < 2)
+        # values cut by the end of chunks are read further
+        data = b'{"source": "ab", "events": [{"title": "\\ud83d\\ude00", ' \
+            b'"importance": -1.5e1}, true, null]}'
+        for chunk_size in [ 1, 3, 7 ]:
+            items = list(HistoryDocument.validate_stream([ data[index:index +
+                chunk_size] for index in range(0, len(data), chunk_size) ],
+                'events', homogeneous = False))
+            self.assertEqual([ item.value for item in items ], [ {
+                'title' : u'\U0001f600', 'importance' : -15.0, }, True,
+                None ])
+
+
+    def test_missing_members(self):
+        items = list(HistoryDocument.validate_stream([ b'{"events": []}' ],
+            'events'))
+        self.assertEqual([ errors(item) for item in items ], [
+            [ (u'Object array is shorter than schema array', u'object.events',
+                u'schema.properties.events.items') ],
+            [ (u"Object lacks property 'source'", u'object',
+                u'schema.properties.source.optional') ],
+        ])
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" 
+"""
+
+__status__ = "alpha"
+__version__ = "1.0.0a1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+# Python
+import sys
+import threading
+
+# Unittest2
+from unittest2 import TestCase
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+
+# JSON Schema Toolkit
+from json_schema_toolkit.document import JSONDocument, JSONDateTimeField, \
+    JSONIntegerField, JSONListField, JSONObjectField, JSONStringField
+from json_schema_toolkit.validator import CompiledValidator
+
+
+THREADS = 16
+ROUNDS = 200
+
+
+def _address():
+    return JSONObjectField(title = u'address', optional = True, content = {
+        'city' : JSONStringField(title = u'city', min_length = 1),
+        'code' : JSONStringField(title = u'code', pattern = u'^[0-9]{5}$'),
+    })
+
+
+def _document_class(name):
+    return type(name, (JSONDocument, ), {
+        'name' : JSONStringField(title = u'name', min_length = 1),
+        'age' : JSONIntegerField(title = u'age', min_value = 0),
+        'joined' : JSONDateTimeField(title = u'joined', optional = True),
+        'address' : _address(),
+        'tags' : JSONListField(title = u'tags', optional = True, content = [
+            JSONStringField(title = u'tag'), ]),
+    })
+
+
+def _stress(target):
+    """ Runs the target in THREADS threads started together (with frequent
+    thread switches where the interpreter allows it), and returns the
+    exceptions raised by any of them.
+    """
+    errors = []
+    start = threading.Event()
+
+    def run(number):
+        start.wait()
+        try:
+            target(number)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [ threading.Thread(target = run, args = (number, ))
+        for number in range(THREADS) ]
+    interval = getattr(sys, 'getswitchinterval', None)
+    if interval is not None:
+        previous = interval()
+        sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        if interval is not None:
+            sys.setswitchinterval(previous)
+    return errors
+
+
+class ThreadSafetyTestCase(TestCase):
+
+    def test_concurrent_documents(self):
+        Profile = _document_class('Profile')
+        schema = Profile.document_schema
+
+        def target(number):
+            for index in range(ROUNDS):
+                value = { 'name' : u'n%d' % number, 'age' : index,
+                    'address' : { 'city' : u'c', 'code' : u'12345', },
+                    'joined' : u'2013-06-16T12:00:00Z', }
+                document = Profile(value, validator = CompiledValidator.for_document(
+                    Profile) if index % 2 else None)
+                assert document.age == index and document.is_valid
+                assert document['joined'].native.year == 2013
+                document.address.code = u'x'
+                assert not document.is_valid
+                document.address.code = u'54321'
+                document.tags = [ u't%d' % number, ]
+                assert document.is_valid
+                assert Profile.from_json(document.to_json()).tags[0] == \
+                    u't%d' % number
+                try:
+                    Profile(dict(value, age = -1))
+                except ValidationError:
+                    pass
+                else:
+                    raise AssertionError('invalid document accepted')
+
+        self.assertEqual(_stress(target), [])
+        self.assertIs(Profile.document_schema, schema)
+
+    def test_concurrent_compilation(self):
+        classes = []
+        validators = []
+
+        def target(number):
+            # classes with identical fields, created and compiled concurrently,
+            # share one interned schema and one compiled validation function
+            cls = _document_class('Profile%d' % number)
+            classes.append(cls)
+            for index in range(ROUNDS // 10):
+                validators.append(CompiledValidator.for_document(
+                    classes[index % len(classes)]))
+            cls({ 'name' : u'n', 'age' : number, })
+
+        self.assertEqual(_stress(target), [])
+        schemas = set(id(cls.document_schema) for cls in classes)
+        self.assertEqual(len(schemas), 1)
+        self.assertEqual(len(set(id(validator._validate)
+            for validator in validators)), 1)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# This document is free and open-source software, subject to the OSI-approved
+# BSD license below.
+#
+# Copyright (c) 2013 Alexis Petrounias <www.petrounias.org>,
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# * Neither the name of the author nor the names of its contributors may be used
+# to endorse or promote products derived from this software without specific
+# prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" 
+"""
+
+__status__ = "alpha"
+__version__ = "1.0.0a1"
+__maintainer__ = (u"Alexis Petrounias <www.petrounias.org>", )
+__author__ = (u"Alexis Petrounias <www.petrounias.org>", )
+
+
+# Unittest2
+from unittest2 import TestCase
+
+# JSON Schema Validator
+from json_schema_validator.errors import ValidationError
+from json_schema_validator.schema import Schema
+from json_schema_validator.validator import Validator
+
+# JSON Schema Toolkit
+from json_schema_toolkit.document import JSONDocument, JSONIntegerField, \
+    JSONStringField, JSONListField, JSONObjectField, JSONDateTimeField
+from json_schema_toolkit.validator import CompiledValidator
+
+
+class EventDocument(JSONDocument):
+
+    source = JSONStringField(title = u'source', min_length = 2,
+        max_length = 8, pattern = r'^[a-z]+$')
+    level = JSONIntegerField(title = u'level', min_value = 0, max_value = 9,
+        null = True)
+    events = JSONListField(title = u'events', content = [
+        JSONObjectField(title = u'event', content = {
+            'title' : JSONStringField(title = u'event title',
+                enum = [u'start', u'stop']),
+            'when' : JSONDateTimeField(title = u'event time', optional = True),
+        }),
+    ])
+
+    class Meta(object):
+        title = u'events'
+        description = u'a collection of events'
+
+
+class CompiledValidatorTestCase(TestCase):
+
+    def assertSameResult(self, value):
+        schema = Schema(EventDocument.document_schema)
+        validator = CompiledValidator.for_document(EventDocument)
+        try:
+            Validator.validate(schema, value)
+        except ValidationError as expected:
+            with self.assertRaises(ValidationError) as context:
+                validator.validate(schema, value)
+            error = context.exception
+            self.assertEqual((error.message, error.new_message,
+                error.object_expr, error.schema_expr), (expected.message,
+                expected.new_message, expected.object_expr,
+                expected.schema_expr))
+        else:
+            self.assertTrue(validator.validate(schema, value))
+
+
+    def test_valid_document(self):
+        self.assertSameResult({ 'source' : u'abc', 'level' : None,
+            'events' : [ { 'title' : u'start',
+                'when' : u'2013-06-16T12:00:00Z' }, { 'title' : u'stop' } ] })
+
+
+    def test_invalid_documents(self):
+        valid = { 'source' : u'abc', 'level' : 3,
+            'events' : [ { 'title' : u'start' } ] }
+        for key, value in [ ('source', u'a'), ('source', u'abcdefghi'),
+            ('source', u'ABC'), ('source', 3), ('level', -1), ('level', 10),
+            ('level', u'3'), ('events', []), ('events', [ {} ]),
+            ('events', [ { 'title' : u'pause' } ]),
+            ('events', [ { 'title' : u'stop', 'when' : u'yesterday' } ]), ]:
+            invalid = dict(valid)
+            invalid[key] = value
+            self.assertSameResult(invalid)
+        invalid = dict(valid)
+        del invalid['level']
+        self.assertSameResult(invalid)
+
+
+    def test_validator_argument(self):
+        validator = CompiledValidator.for_document(EventDocument)
+        self.assertIs(validator,
+            CompiledValidator.for_document(EventDocument))
+        d1 = EventDocument({ 'source' : u'abc', 'level' : 3,
+            'events' : [ { 'title' : u'start' } ] }, validator = validator)
+        self.assertEqual(d1.level, 3)
+        self.assertRaises(ValidationError, EventDocument, { 'source' : u'abc',
+            'level' : 30, 'events' : [ { 'title' : u'start' } ] },
+            validator = validator)
+
+
+    def test_shared_subschemas(self):
+        def address():
+            return JSONObjectField(title = u'address', content = {
+                'city' : JSONStringField(title = u'city', min_length = 1), })
+        class D1(JSONDocument):
+            home = address()
+            work = address()
+        class D2(JSONDocument):
+            office = address()
+        home = D1.document_schema['properties']['home']
+        self.assertIs(home, D1.document_schema['properties']['work'])
+        self.assertIs(home, D2.document_schema['properties']['office'])
+        validator = CompiledValidator.for_document(D1)
+        self.assertIs(validator.for_subschema(home),
+            CompiledValidator.for_document(D2).for_subschema(home))
+        with self.assertRaises(ValidationError) as context:
+            validator({ 'home' : { 'city' : u'a', }, 'work' : { 'city' : u'', },
+                })
+        self.assertEqual('object.work.city', context.exception.object_expr)
+        self.assertEqual('schema.properties.work.properties.city.minLength',
+            context.exception.schema_expr)